@@ -0,0 +1,344 @@
+import fcntl
+import logging
+import os
+import random
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+# 优先级：数值小的先调度。交互式请求 (同步 / 流式评分、按需润色、单篇异步任务) 优先于教师批量评分
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BATCH: 'batch'}
+
+
+class Overloaded(Exception):
+    """排队已满或预计等待过久时快速拒绝；status 为 429 (该用户排队的请求过多) 或 503，retry_after 为预计等待秒数。"""
+
+    def __init__(self, message, retry_after, status=503):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status = status
+
+
+class SharedQuota:
+    """
+    所有 worker 进程共享的 RPM / TPM 令牌桶。
+
+    状态是 path 文件中的 4 个 double (请求桶余量、token 桶余量、更新时间、暂停截止时间)，
+    每次读改写都持有 flock 排他锁；默认放在 /dev/shm (内存文件系统)，一次操作只有几微秒。
+    桶容量为 burst_seconds 秒的配额，避免一分钟的配额在一瞬间用完后触发服务端更细粒度的限流。
+    rpm / tpm <= 0 表示该维度不限制。
+    """
+
+    _FORMAT = '<dddd'
+    _SIZE = struct.calcsize(_FORMAT)
+
+    def __init__(self, path, rpm, tpm, burst_seconds=10.0):
+        self.path = path
+        self.request_rate = rpm / 60.0 if rpm > 0 else 0.0
+        self.token_rate = tpm / 60.0 if tpm > 0 else 0.0
+        self.request_capacity = max(1.0, self.request_rate * burst_seconds)
+        self.token_capacity = max(1.0, self.token_rate * burst_seconds)
+        self._pid = None
+        self._fd = None
+        self._lock = threading.Lock()
+
+    def _file(self):
+        # flock 属于打开的文件描述 (open file description)，fork 前打开的描述在父子进程间共享、互不排斥，
+        # 所以每个进程单独打开一次
+        if self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._pid = os.getpid()
+        return self._fd
+
+    def _update(self, change):
+        """在文件锁内补充令牌后调用 change(state, now)，写回修改后的 state 并返回 change 的返回值。"""
+        with self._lock:
+            fd = self._file()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                data = os.pread(fd, self._SIZE, 0)
+                if len(data) == self._SIZE:
+                    requests, tokens, updated, paused_until = struct.unpack(self._FORMAT, data)
+                else:
+                    requests, tokens, updated, paused_until = self.request_capacity, self.token_capacity, now, 0.0
+                elapsed = max(0.0, now - updated)
+                state = [
+                    min(self.request_capacity, requests + elapsed * self.request_rate),
+                    min(self.token_capacity, tokens + elapsed * self.token_rate),
+                    now,
+                    paused_until,
+                ]
+                result = change(state, now)
+                os.pwrite(fd, struct.pack(self._FORMAT, *state), 0)
+                return result
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def try_acquire(self, tokens, reserve=0.0):
+        """
+        尝试占用 1 个请求和 tokens 个 token，成功返回 0，否则返回大约还要等待的秒数。
+        reserve 为占用后两个桶都必须保留的容量比例：低优先级请求不能用掉留给交互式请求的那部分配额，
+        在多个 worker 之间也能体现优先级。
+        """
+        tokens = min(float(tokens), self.token_capacity)
+
+        def change(state, now):
+            if state[3] > now:
+                return state[3] - now
+            waits = []
+            if self.request_rate:
+                need = min(1 + reserve * self.request_capacity, self.request_capacity)
+                if state[0] < need:
+                    waits.append((need - state[0]) / self.request_rate)
+            if self.token_rate:
+                need = min(tokens + reserve * self.token_capacity, self.token_capacity)
+                if state[1] < need:
+                    waits.append((need - state[1]) / self.token_rate)
+            if waits:
+                return max(waits)
+            if self.request_rate:
+                state[0] -= 1
+            if self.token_rate:
+                state[1] -= tokens
+            return 0.0
+
+        return self._update(change)
+
+    def settle(self, delta_tokens):
+        """按实际用量修正 token 桶：delta 为实际用量减去占用时的估算，可以为负 (退还)。"""
+        if not self.token_rate or not delta_tokens:
+            return
+
+        def change(state, now):
+            state[1] = min(self.token_capacity, state[1] - delta_tokens)
+
+        self._update(change)
+
+    def refund(self, tokens):
+        """退还一次 try_acquire 占用的请求与 token。"""
+
+        def change(state, now):
+            if self.request_rate:
+                state[0] = min(self.request_capacity, state[0] + 1)
+            if self.token_rate:
+                state[1] = min(self.token_capacity, state[1] + min(float(tokens), self.token_capacity))
+
+        self._update(change)
+
+    def pause(self, seconds):
+        """服务端返回 429 时按 Retry-After 暂停所有进程的调度。"""
+
+        def change(state, now):
+            state[3] = max(state[3], now + seconds)
+
+        self._update(change)
+
+    def snapshot(self):
+        """返回 (请求桶余量, token 桶余量, 剩余暂停秒数)。"""
+        return self._update(lambda state, now: (state[0], state[1], max(0.0, state[3] - now)))
+
+
+class _Ticket:
+    def __init__(self, user, priority, tokens):
+        self.user = user
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.granted = threading.Event()
+        self.started = None
+        self.released = False
+
+
+class AdmissionController:
+    """
+    进程内的大模型调用准入控制：请求先排队，由调度线程按优先级、按用户轮转 (每个用户一次一个) 逐个放行，
+    放行前要从 SharedQuota 中拿到配额，且本进程同时进行的调用不超过 max_concurrency 个。
+
+    入队时估算等待时间：同一用户排队的交互式请求超过 max_user_queue 时返回 429
+    (批量请求的并发由调用方限制；未登录的请求 user 为 None，不分用户，只受总排队数限制)，
+    总排队数超过 max_queue 或预计等待超过 max_wait 时返回 503 (Overloaded)，不让请求挂到 gunicorn 超时；
+    排队超过 max_wait 仍未放行同样返回 503。估算只看本进程的队列，其他 worker 的排队情况体现在共享配额的余量中。
+    """
+
+    def __init__(self, quota, max_concurrency=16, max_queue=200, max_user_queue=3, max_wait=30.0,
+                 batch_reserve=0.2, on_depth=None, on_wait=None, on_reject=None):
+        self.quota = quota
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_queue = max_queue
+        self.max_user_queue = max_user_queue
+        self.max_wait = max_wait
+        self.batch_reserve = batch_reserve
+        self._on_depth = on_depth
+        self._on_wait = on_wait
+        self._on_reject = on_reject
+        self._cond = threading.Condition()
+        self._pid = None
+        self._queues = {}
+        self._depth = 0
+        self._inflight = 0
+        # 单次调用耗时的指数滑动平均，用于估算并发已满时的等待时间
+        self._service_seconds = 10.0
+        self._stats = {'admitted': 0, 'rejected': 0, 'timed_out': 0, 'paused': 0}
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queues = {priority: OrderedDict() for priority in PRIORITY_NAMES}
+            self._depth = 0
+            self._inflight = 0
+            threading.Thread(target=self._run, name='llm-admission', daemon=True).start()
+
+    def acquire(self, user, priority=INTERACTIVE, tokens=0, max_wait=None):
+        """排队等待放行，返回 ticket；调用结束后必须 release(ticket)。无法在 max_wait 秒内放行时抛出 Overloaded。"""
+        self.start()
+        max_wait = self.max_wait if max_wait is None else max_wait
+        ticket = _Ticket(user, priority, tokens)
+        with self._cond:
+            estimate = self._estimate(priority, tokens)
+            if (priority == INTERACTIVE and user is not None
+                    and len(self._queues[priority].get(user, ())) >= self.max_user_queue):
+                self._reject('user_queue')
+                raise Overloaded("您提交的评分请求过多，请等待之前的请求完成", estimate, status=429)
+            if self._depth >= self.max_queue or estimate > max_wait:
+                self._reject('queue_full' if self._depth >= self.max_queue else 'wait_estimate')
+                raise Overloaded(f"评分服务繁忙，预计需要等待 {estimate:.0f} 秒，请稍后重试", estimate)
+            self._queues[priority].setdefault(user, deque()).append(ticket)
+            self._set_depth(priority, 1)
+            self._cond.notify_all()
+
+        if ticket.granted.wait(max_wait):
+            return ticket
+        with self._cond:
+            if ticket.granted.is_set():
+                return ticket
+            self._remove(ticket)
+            self._stats['timed_out'] += 1
+            self._reject('timeout')
+            estimate = self._estimate(priority, tokens)
+        raise Overloaded(f"评分服务繁忙，排队超过 {max_wait:.0f} 秒，请稍后重试", estimate)
+
+    def release(self, ticket, actual_tokens=None):
+        """释放并发名额；actual_tokens 为实际消耗的 token 数 (未知时为 None，保留估算值)。可重复调用。"""
+        with self._cond:
+            if ticket.released or not ticket.granted.is_set():
+                return
+            ticket.released = True
+            self._inflight -= 1
+            elapsed = time.monotonic() - ticket.started
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * elapsed
+            self._cond.notify_all()
+        if actual_tokens is not None:
+            self.quota.settle(actual_tokens - min(ticket.tokens, self.quota.token_capacity))
+
+    def pause(self, seconds):
+        """服务端限流 (429) 时暂停所有 worker 的调度 seconds 秒。"""
+        with self._cond:
+            self._stats['paused'] += 1
+        logger.warning(f"LLM provider rate limited, pausing dispatch for {seconds:.1f}s")
+        self.quota.pause(seconds)
+
+    def _estimate(self, priority, tokens):
+        # 调用方持有 self._cond
+        ahead = [t for p, users in self._queues.items() if p <= priority
+                 for waiting in users.values() for t in waiting]
+        requests, available_tokens, paused = self.quota.snapshot()
+        waits = [paused]
+        if self.quota.request_rate:
+            waits.append((len(ahead) + 1 - requests) / self.quota.request_rate)
+        if self.quota.token_rate:
+            waits.append((sum(t.tokens for t in ahead) + tokens - available_tokens) / self.quota.token_rate)
+        # 本进程并发已满时，前面的请求按 max_concurrency 路并行完成
+        busy = len(ahead) + 1 - (self.max_concurrency - self._inflight)
+        if busy > 0:
+            waits.append(busy / self.max_concurrency * self._service_seconds)
+        return max(0.0, *waits)
+
+    def _next(self):
+        # 调用方持有 self._cond；返回下一个应放行的 ticket (不出队)
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            if users:
+                return users[next(iter(users))][0]
+        return None
+
+    def _remove(self, ticket):
+        # 调用方持有 self._cond；从队列中移除 ticket，该用户还有排队的请求时移到轮转末尾
+        users = self._queues[ticket.priority]
+        waiting = users[ticket.user]
+        first = waiting[0] is ticket
+        waiting.remove(ticket)
+        if not waiting:
+            del users[ticket.user]
+        elif first:
+            users.move_to_end(ticket.user)
+        self._set_depth(ticket.priority, -1)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                ticket = self._next()
+                while ticket is None or self._inflight >= self.max_concurrency:
+                    self._cond.wait()
+                    ticket = self._next()
+            reserve = self.batch_reserve if ticket.priority == BATCH else 0.0
+            wait = self.quota.try_acquire(ticket.tokens, reserve)
+            with self._cond:
+                if wait > 0:
+                    # 加一点随机抖动，避免各 worker 在同一时刻醒来争抢配额；新请求到达时会被提前唤醒
+                    self._cond.wait(min(wait, 1.0) * random.uniform(1.0, 1.2))
+                    continue
+                if self._next() is not ticket:
+                    # 等待配额期间 ticket 已超时离开，或到达了优先级更高的请求：退还配额，重新选择
+                    refund = ticket
+                else:
+                    refund = None
+                    self._remove(ticket)
+                    self._inflight += 1
+                    self._stats['admitted'] += 1
+                    ticket.started = time.monotonic()
+                    ticket.granted.set()
+            if refund is not None:
+                self.quota.refund(refund.tokens)
+                continue
+            if self._on_wait:
+                self._on_wait(PRIORITY_NAMES[ticket.priority], ticket.started - ticket.enqueued)
+
+    def _set_depth(self, priority, delta):
+        # 调用方持有 self._cond
+        self._depth += delta
+        if self._on_depth:
+            self._on_depth(PRIORITY_NAMES[priority], sum(len(w) for w in self._queues[priority].values()))
+
+    def _reject(self, reason):
+        # 调用方持有 self._cond
+        self._stats['rejected'] += 1
+        if self._on_reject:
+            self._on_reject(reason)
+
+    def stats(self):
+        """本进程的排队与并发情况，以及共享配额的余量。"""
+        requests, tokens, paused = self.quota.snapshot()
+        with self._cond:
+            stats = dict(self._stats)
+            stats['queued'] = {PRIORITY_NAMES[p]: sum(len(w) for w in users.values())
+                               for p, users in self._queues.items()}
+            stats['users_waiting'] = len(set().union(*self._queues.values()))
+            stats['inflight'] = self._inflight
+            stats['max_concurrency'] = self.max_concurrency
+            stats['service_seconds_avg'] = round(self._service_seconds, 3)
+        stats['quota'] = {'requests_available': round(requests, 2), 'tokens_available': round(tokens),
+                          'paused_seconds': round(paused, 3)}
+        return stats
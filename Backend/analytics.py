@@ -0,0 +1,278 @@
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+# 反馈分类：在「不足」「建议」等反馈文本中按关键词归类，统计用户最常出现的问题
+FEEDBACK_CATEGORIES = {
+    '审题立意': ('审题', '立意', '主旨', '中心', '主题', '切题', '偏题', '跑题'),
+    '结构': ('结构', '层次', '条理', '段落', '过渡', '衔接', '开头', '结尾', '首尾'),
+    '语言表达': ('语言', '表达', '用词', '词语', '语句', '句子', '修辞', '文采', '语病'),
+    '内容素材': ('内容', '素材', '论据', '事例', '例子', '细节', '描写', '空洞'),
+    '思想深度': ('深度', '深刻', '思考', '感悟', '见解', '深入'),
+    '书写规范': ('错别字', '标点', '书写', '字数'),
+}
+
+TABLES = ('user_score_daily', 'user_topic_stats', 'user_score_buckets', 'user_feedback_categories')
+
+SCHEMA = (
+    # 每个用户每天的篇数与分数之和 / 最低 / 最高分 (分数趋势)
+    """
+    CREATE TABLE IF NOT EXISTS user_score_daily (
+        username VARCHAR(100) NOT NULL,
+        day DATE NOT NULL,
+        essays INT NOT NULL,
+        score_sum BIGINT NOT NULL,
+        score_min INT NOT NULL,
+        score_max INT NOT NULL,
+        PRIMARY KEY (username, day)
+    )
+    """,
+    # 每个用户每个题目的统计，topic_hash 为题目全文的哈希，topic 只保留前 255 个字符用于展示
+    """
+    CREATE TABLE IF NOT EXISTS user_topic_stats (
+        username VARCHAR(100) NOT NULL,
+        topic_hash CHAR(32) NOT NULL,
+        topic VARCHAR(255) NOT NULL,
+        essays INT NOT NULL,
+        score_sum BIGINT NOT NULL,
+        score_min INT NOT NULL,
+        score_max INT NOT NULL,
+        last_timestamp BIGINT NOT NULL,
+        PRIMARY KEY (username, topic_hash)
+    )
+    """,
+    # 每个用户每个题目的分数段分布
+    """
+    CREATE TABLE IF NOT EXISTS user_score_buckets (
+        username VARCHAR(100) NOT NULL,
+        topic_hash CHAR(32) NOT NULL,
+        bucket SMALLINT NOT NULL,
+        essays INT NOT NULL,
+        PRIMARY KEY (username, topic_hash, bucket)
+    )
+    """,
+    # 每个用户各类反馈 (优点 / 不足 / 建议) 中各分类出现的篇数
+    """
+    CREATE TABLE IF NOT EXISTS user_feedback_categories (
+        username VARCHAR(100) NOT NULL,
+        feedback_type VARCHAR(16) NOT NULL,
+        category VARCHAR(32) NOT NULL,
+        essays INT NOT NULL,
+        PRIMARY KEY (username, feedback_type, category)
+    )
+    """,
+)
+
+UPSERT_SQL = {
+    'user_score_daily': """
+        INSERT INTO user_score_daily (username, day, essays, score_sum, score_min, score_max)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE essays = essays + VALUES(essays), score_sum = score_sum + VALUES(score_sum),
+            score_min = LEAST(score_min, VALUES(score_min)), score_max = GREATEST(score_max, VALUES(score_max))
+    """,
+    'user_topic_stats': """
+        INSERT INTO user_topic_stats (username, topic_hash, topic, essays, score_sum, score_min, score_max,
+                                      last_timestamp)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE essays = essays + VALUES(essays), score_sum = score_sum + VALUES(score_sum),
+            score_min = LEAST(score_min, VALUES(score_min)), score_max = GREATEST(score_max, VALUES(score_max)),
+            last_timestamp = GREATEST(last_timestamp, VALUES(last_timestamp))
+    """,
+    'user_score_buckets': """
+        INSERT INTO user_score_buckets (username, topic_hash, bucket, essays) VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE essays = essays + VALUES(essays)
+    """,
+    'user_feedback_categories': """
+        INSERT INTO user_feedback_categories (username, feedback_type, category, essays) VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE essays = essays + VALUES(essays)
+    """,
+}
+
+# 一致性检查时读取各表的全部内容 (主键在前，与 Aggregates 中的键一致)
+SELECT_SQL = {
+    'user_score_daily': "SELECT username, day, essays, score_sum, score_min, score_max FROM user_score_daily",
+    'user_topic_stats': "SELECT username, topic_hash, topic, essays, score_sum, score_min, score_max, "
+                        "last_timestamp FROM user_topic_stats",
+    'user_score_buckets': "SELECT username, topic_hash, bucket, essays FROM user_score_buckets",
+    'user_feedback_categories': "SELECT username, feedback_type, category, essays FROM user_feedback_categories",
+}
+KEY_COLUMNS = {
+    'user_score_daily': 2,
+    'user_topic_stats': 2,
+    'user_score_buckets': 3,
+    'user_feedback_categories': 3,
+}
+
+
+def topic_hash(topic):
+    return hashlib.sha256((topic or '').encode('utf-8')).hexdigest()[:32]
+
+
+def feedback_categories(feedback):
+    """从反馈 [{'type', 'detail'}] 中找出命中的 (反馈类型, 分类)，同一篇作文每个组合只计一次。"""
+    if isinstance(feedback, (str, bytes, bytearray)):
+        try:
+            feedback = json.loads(feedback)
+        except ValueError:
+            return set()
+    found = set()
+    for item in feedback or []:
+        if not isinstance(item, dict):
+            continue
+        detail = item.get('detail')
+        if not isinstance(detail, str):
+            detail = json.dumps(detail, ensure_ascii=False)
+        for category, keywords in FEEDBACK_CATEGORIES.items():
+            if any(keyword in detail for keyword in keywords):
+                found.add((str(item.get('type'))[:16], category))
+    return found
+
+
+class Aggregates:
+    """
+    一批作文对各统计表的增量。增量写入 (apply) 与全量重建 / 一致性检查 (rebuild / check) 使用同一套计算，
+    保证两者结果一致。
+
+    day_offset 为按日统计时使用的时区相对 UTC 的秒数，bucket_size 为分数段宽度 (满分 max_score 并入最后一段)；
+    修改这两个参数后需要重建统计表。
+    """
+
+    def __init__(self, day_offset=8 * 3600, bucket_size=10, max_score=60):
+        self.day_offset = day_offset
+        self.bucket_size = bucket_size
+        self.max_bucket = max(max_score - 1, 0) // bucket_size
+        self.rows = {table: {} for table in TABLES}
+
+    def day(self, timestamp):
+        return datetime.fromtimestamp(timestamp // 1000 + self.day_offset, timezone.utc).date()
+
+    def bucket(self, score):
+        return min(max(score, 0) // self.bucket_size, self.max_bucket)
+
+    def add(self, username, topic, score, feedback, timestamp):
+        if score is None or timestamp is None:
+            return
+        score = int(score)
+        digest = topic_hash(topic)
+        self._merge('user_score_daily', (username, self.day(timestamp)), [1, score, score, score])
+        self._merge('user_topic_stats', (username, digest), [(topic or '')[:255], 1, score, score, score, timestamp])
+        self._merge('user_score_buckets', (username, digest, self.bucket(score)), [1])
+        for feedback_type, category in feedback_categories(feedback):
+            self._merge('user_feedback_categories', (username, feedback_type, category), [1])
+
+    def _merge(self, table, key, values):
+        current = self.rows[table].get(key)
+        if current is None:
+            self.rows[table][key] = values
+        elif table == 'user_score_daily':
+            essays, score_sum, score_min, score_max = values
+            current[0] += essays
+            current[1] += score_sum
+            current[2] = min(current[2], score_min)
+            current[3] = max(current[3], score_max)
+        elif table == 'user_topic_stats':
+            _, essays, score_sum, score_min, score_max, timestamp = values
+            current[1] += essays
+            current[2] += score_sum
+            current[3] = min(current[3], score_min)
+            current[4] = max(current[4], score_max)
+            current[5] = max(current[5], timestamp)
+        else:
+            current[0] += values[0]
+
+    def apply(self, cursor):
+        """把增量累加到统计表 (调用方负责提交，应与作文写入在同一事务中)。"""
+        for table in TABLES:
+            rows = [(*key, *values) for key, values in self.rows[table].items()]
+            if rows:
+                cursor.executemany(UPSERT_SQL[table], rows)
+
+
+def scan_essays(cursor, batch_size=5000):
+    """按 id 分批读取全部作文，逐行返回 (username, topic, score, feedback, timestamp)。"""
+    last_id = ''
+    while True:
+        cursor.execute(
+            "SELECT id, username, topic, score, feedback, timestamp FROM essays WHERE id > %s ORDER BY id LIMIT %s",
+            (last_id, batch_size)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        for row in rows:
+            yield row[1:]
+
+
+def compute(cursor, day_offset, bucket_size, batch_size=5000):
+    """从 essays 表从头计算全部统计。"""
+    aggregates = Aggregates(day_offset, bucket_size)
+    for username, topic, score, feedback, timestamp in scan_essays(cursor, batch_size):
+        aggregates.add(username, topic, score, feedback, timestamp)
+    return aggregates
+
+
+def check(cursor, day_offset, bucket_size, batch_size=5000):
+    """
+    比较统计表与从 essays 从头计算的结果，返回 {表名: [(键, 表中的值, 重新计算的值)]}，只包含不一致的行。
+    在同一个一致性快照中读取统计表与作文 (统计表与作文在同一事务中更新)，检查期间的新写入不会造成误报。
+    """
+    cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY")
+    try:
+        stored = {}
+        for table in TABLES:
+            cursor.execute(SELECT_SQL[table])
+            width = KEY_COLUMNS[table]
+            stored[table] = {tuple(row[:width]): list(row[width:]) for row in cursor.fetchall()}
+        expected = compute(cursor, day_offset, bucket_size, batch_size)
+    finally:
+        cursor.execute("COMMIT")
+
+    mismatches = {}
+    for table in TABLES:
+        rows = expected.rows[table]
+        diff = []
+        for key in rows.keys() | stored[table].keys():
+            actual, wanted = stored[table].get(key), rows.get(key)
+            if actual is None or wanted is None or [_plain(v) for v in actual] != [_plain(v) for v in wanted]:
+                diff.append((key, actual, wanted))
+        if diff:
+            mismatches[table] = diff
+    return mismatches
+
+
+def _plain(value):
+    # 数据库返回的 Decimal / bytearray 与 Python 计算结果比较前统一类型
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8')
+    if isinstance(value, Decimal):
+        return int(value)
+    return value
+
+
+def rebuild(cursor, day_offset, bucket_size, batch_size=5000):
+    """
+    清空统计表后从 essays 从头计算并写入 (调用方负责提交)。返回统计到的作文数。
+    重建期间写入的作文可能被重复计数或漏计，应在暂停写入 (或低峰期) 时执行，之后可用 check 核对。
+    """
+    aggregates = compute(cursor, day_offset, bucket_size, batch_size)
+    for table in TABLES:
+        cursor.execute(f"DELETE FROM {table}")
+    aggregates.apply(cursor)
+    return sum(values[1] for values in aggregates.rows['user_topic_stats'].values())
+
+
+def bucket_label(bucket, bucket_size, max_score=60):
+    """分数段的展示名称，如 40-49；最后一段包含满分，如 50-60。"""
+    low = bucket * bucket_size
+    high = max_score if bucket == max(max_score - 1, 0) // bucket_size else low + bucket_size - 1
+    return f"{low}-{high}"
+
+
+def start_of_period(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
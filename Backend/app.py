@@ -1,92 +1,229 @@
+import base64
+import click
+import hashlib
 import json
+import logging
+import random
+import re
+import sys
+import tempfile
 import time
-from flask import Flask, request, jsonify
+from datetime import timedelta
+from flask import (Blueprint, Flask, Response, current_app, g, has_request_context, request, jsonify,
+                   stream_with_context)
 from flask_cors import CORS
 from uuid import uuid4
-from openai import OpenAI
 import os
 import mysql.connector 
 from werkzeug.security import generate_password_hash, check_password_hash
-from aip import AipOcr #百度ocr
 import math
+import secrets
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from logging_config import setup_logging_from_env, log_content
+import metrics
+from metrics import track
+from db_pool import ConnectionPool, PoolTimeout
+from llm_cache import ResultCache, MySQLCacheStore, cache_key
+from json_stream import JsonFieldStream
+from batch import RateLimiter, run_batch
+from image_prep import ImagePreprocessor
+import essay_diff
+import analytics
+from compression import Compressor, strip_etag_suffix
+from auth import TokenSigner, InvalidToken, PasswordHasher, HasherBusy, bearer_token
+from write_behind import WriteBehindBuffer, BufferFull, WRITTEN, REJECTED
+from similarity import MinHasher
+from admission import AdmissionController, SharedQuota, Overloaded, INTERACTIVE, BATCH
+from jobs import JobQueue, InMemoryJobStore, MySQLJobStore, QueueFull, FINISHED_STATUSES
+logger = logging.getLogger(__name__)
 # --- MySQL 数据库配置 (请根据您的环境修改这些值) ---
 
 MYSQL_HOST = os.getenv('MYSQL_HOST', 'localhost') 
+MYSQL_PORT = int(os.getenv('MYSQL_PORT', '3306'))
 MYSQL_USER = os.getenv('MYSQL_USER', 'root')
 MYSQL_PASSWORD = os.getenv('MYSQL_ROOT_PASSWORD')
 MYSQL_DATABASE = os.getenv('MYSQL_DATABASE', 'essay_scoring')
-try:
-    # 客户端初始化，使用环境变量和固定的 DashScope Base URL
-    client = OpenAI(
+# 连接池配置：每个 gunicorn worker 进程各自维护一个连接池
+MYSQL_POOL_SIZE = int(os.getenv('MYSQL_POOL_SIZE', '8'))
+MYSQL_POOL_TIMEOUT = float(os.getenv('MYSQL_POOL_TIMEOUT', '5'))
+MYSQL_POOL_PING_INTERVAL = float(os.getenv('MYSQL_POOL_PING_INTERVAL', '30'))
+LLM_MODEL = "qwen-max" # 使用通义千问系列模型
+# 压测时可指向本地的 OpenAI 兼容桩服务 (见 bench/bench_concurrency.py)
+LLM_BASE_URL = os.getenv('LLM_BASE_URL', "https://dashscope.aliyuncs.com/compatible-mode/v1")
+# 大模型客户端在第一次调用时才创建：openai SDK 导入就要约 0.7 秒，不应拖慢 worker 启动。
+# LLM_CLIENT_WARMUP 开启时 start_background_workers() 在后台线程里提前创建，worker 先开始接收请求，第一次评分通常无需等待
+LLM_CLIENT_WARMUP = os.getenv('LLM_CLIENT_WARMUP', 'true').lower() in ('1', 'true', 'yes')
+_llm_client = None
+_llm_client_lock = threading.Lock()
+
+def create_llm_client():
+    from openai import OpenAI
+    # 关闭 SDK 自带的重试：429 由准入控制统一暂停调度后重试 (见 _call_llm)，SDK 重试会绕过共享配额，
+    # 在限流时成倍放大请求
+    return OpenAI(
         api_key=os.getenv("DASHSCOPE_API_KEY"),
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+        base_url=LLM_BASE_URL,
+        max_retries=0,
     )
-    LLM_MODEL = "qwen-max" # 使用通义千问系列模型
-except Exception as e:
-    print(f"OpenAI Client Initialization Failed: {e}")
-    client = None 
+
+def get_llm_client():
+    """
+    返回进程内共享的大模型客户端 (所有请求线程共享同一个客户端及其 HTTP 连接池)，创建失败时返回 None。
+    """
+    global _llm_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                try:
+                    _llm_client = create_llm_client()
+                except Exception as e:
+                    logger.error(f"OpenAI Client Initialization Failed: {e}")
+                    return None
+    return _llm_client
 
 # JSON 结构定义：指导大模型返回数据格式
-LLM_RESPONSE_SCHEMA = {
-    "type": "object",
-    "properties": {
-        "score": {
-            "type": "integer",
-            "description": "作文的评分，必须是 0 到 60 之间的一个整数。"
-        },
-        "feedback": {
-            "type": "object", 
-            "description": "结构化反馈，键名必须是'优点'、'不足'、'建议'，值是该类型反馈的列表。",
-            "properties": {
-                "优点": {
-                    "type": "string",
-                    "description": "文章的优点，所有内容合并成一个中文段落。"
-                },
-                "不足": {
-                    "type": "string",
-                    "description": "文章的不足之处，所有内容合并成一个中文段落。"
-                },
-                "建议": {
-                    "type": "string",
-                    "description": "针对文章的修改和改进建议，所有内容合并成一个中文段落。"
-                }
+LLM_RESPONSE_PROPERTIES = {
+    "score": {
+        "type": "integer",
+        "description": "作文的评分，必须是 0 到 60 之间的一个整数。"
+    },
+    "feedback": {
+        "type": "object", 
+        "description": "结构化反馈，键名必须是'优点'、'不足'、'建议'，值是该类型反馈的列表。",
+        "properties": {
+            "优点": {
+                "type": "string",
+                "description": "文章的优点，所有内容合并成一个中文段落。"
             },
-            "required": ["优点", "不足", "建议"],
-            "additionalProperties": "false"
+            "不足": {
+                "type": "string",
+                "description": "文章的不足之处，所有内容合并成一个中文段落。"
+            },
+            "建议": {
+                "type": "string",
+                "description": "针对文章的修改和改进建议，所有内容合并成一个中文段落。"
+            }
         },
-        "revised_content": {
-            "type": "string",
-            "description": "经过润色和优化的文章全文。必须返回完整修改后的文章，不包含任何解释性文字。"
-        }
+        "required": ["优点", "不足", "建议"],
+        "additionalProperties": "false"
     },
-    "required": ["score", "feedback", "revised_content"]
+    "revised_content": {
+        "type": "string",
+        "description": "经过润色和优化的文章全文。必须返回完整修改后的文章，不包含任何解释性文字。"
+    }
+}
+
+def _response_schema(*fields):
+    return {
+        "type": "object",
+        "properties": {field: LLM_RESPONSE_PROPERTIES[field] for field in fields},
+        "required": list(fields)
+    }
+
+# 评分模式：score 只评分，feedback 评分 + 反馈，full 再加全文润色 (默认，与原接口一致)。
+# 润色全文的输出 token 数与作文长度成正比，只需要分数时可以省掉大部分生成时间和费用。
+SCORE_MODE_FIELDS = {
+    'score': ('score',),
+    'feedback': ('score', 'feedback'),
+    'full': ('score', 'feedback', 'revised_content'),
 }
+SCORE_RESPONSE_SCHEMAS = {mode: _response_schema(*fields) for mode, fields in SCORE_MODE_FIELDS.items()}
+# 按需润色 (/api/v1/essay/<id>/rewrite) 只生成 revised_content
+REWRITE_RESPONSE_SCHEMA = _response_schema('revised_content')
+def _connect_mysql():
+    return mysql.connector.connect(
+        host=MYSQL_HOST,
+        port=MYSQL_PORT,
+        user=MYSQL_USER,
+        password=MYSQL_PASSWORD,
+        database=MYSQL_DATABASE
+    )
+
+db_pool = ConnectionPool(
+    _connect_mysql,
+    size=MYSQL_POOL_SIZE,
+    timeout=MYSQL_POOL_TIMEOUT,
+    ping_interval=MYSQL_POOL_PING_INTERVAL
+)
+
 def get_db_connection():
     """
-    建立并返回一个 MySQL 数据库连接对象。
+    从连接池借出一个 MySQL 数据库连接对象。
+    调用方仍按原来的方式 conn.close()，连接会被归还连接池而不是断开。
     """
     try:
-        conn = mysql.connector.connect(
-            host=MYSQL_HOST,
-            user=MYSQL_USER,
-            password=MYSQL_PASSWORD,
-            database=MYSQL_DATABASE
-        )
-        return conn
+        with track('db_connect'):
+            return db_pool.acquire()
+    except PoolTimeout as err:
+        logger.error(f"MySQL connection pool exhausted: {err}")
+        return None
     except mysql.connector.Error as err:
-        print(f"Error connecting to MySQL: {err}")
+        logger.error(f"Error connecting to MySQL: {err}")
         # 在生产环境中，这里应该抛出异常或返回错误状态
         return None
 
+def _has_index(cursor, table, index_name):
+    cursor.execute(
+        """
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        """,
+        (table, index_name)
+    )
+    return bool(cursor.fetchone()[0])
+
+def ensure_index(cursor, table, index_name, columns):
+    """
+    索引不存在时在线添加 (ALGORITHM=INPLACE, LOCK=NONE)：不重建整表，也不阻塞读写。
+    """
+    if _has_index(cursor, table, index_name):
+        return False
+    logger.info(f"Adding index {index_name} on {table}{columns}")
+    cursor.execute(f"ALTER TABLE {table} ADD INDEX {index_name} {columns}, ALGORITHM=INPLACE, LOCK=NONE")
+    return True
+
+def ensure_fulltext_index(cursor, table, index_name, columns):
+    """
+    全文索引 (ngram 分词，支持中文) 不存在时添加。
+    表上第一个全文索引需要重建表以补上 FTS_DOC_ID，期间只能读不能写 (LOCK=SHARED)，旧库请在低峰期执行迁移。
+    """
+    if _has_index(cursor, table, index_name):
+        return False
+    logger.info(f"Adding fulltext index {index_name} on {table}{columns}")
+    cursor.execute(f"ALTER TABLE {table} ADD FULLTEXT INDEX {index_name} {columns} WITH PARSER ngram, "
+                   f"ALGORITHM=INPLACE, LOCK=SHARED")
+    return True
+
+def ensure_column(cursor, table, column, definition):
+    """
+    列不存在时在线添加 (ALGORITHM=INPLACE, LOCK=NONE)，迁移期间不阻塞读写。
+    """
+    cursor.execute(
+        """
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+        """,
+        (table, column)
+    )
+    if cursor.fetchone()[0]:
+        return False
+    logger.info(f"Adding column {column} to {table}")
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}, ALGORITHM=INPLACE, LOCK=NONE")
+    return True
+
 def init_db():
     """
-    初始化 MySQL 数据库，创建 essays 表。
+    初始化 MySQL 数据库：创建各表并补上缺少的列和索引，可重复执行。
+    由 flask --app app migrate 在部署时执行一次；失败时抛出异常。
     """
     conn = None
     try:
         conn = get_db_connection()
         if conn is None:
-            raise Exception("Failed to establish database connection.")
+            raise RuntimeError("Failed to establish database connection.")
             
         cursor = conn.cursor()
         
@@ -97,7 +234,8 @@ def init_db():
             CREATE TABLE IF NOT EXISTS users (
                 username VARCHAR(100) PRIMARY KEY,
                 password_hash VARCHAR(255) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                essays_version BIGINT NOT NULL DEFAULT 0
             )
         """)
         cursor.execute("""
@@ -111,214 +249,1846 @@ def init_db():
                 feedback JSON,
                 revised_content LONGTEXT,
                 timestamp BIGINT,
+                INDEX idx_essays_username_timestamp (username, timestamp, id),
+                FULLTEXT INDEX ft_essays_title_topic (title, topic) WITH PARSER ngram,
                 FOREIGN KEY (username) REFERENCES users(username)
                 ON DELETE CASCADE
             )
         """)
+        # 作文正文单独存放，列表和元数据查询不会读到大字段所在的页。
+        # 润色全文与原文差别不大时只存编辑脚本 revised_diff (见 essay_diff.py)，revised_content 为 NULL
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS essay_contents (
+                essay_id VARCHAR(36) PRIMARY KEY,
+                original_content LONGTEXT NOT NULL,
+                revised_content LONGTEXT,
+                revised_diff MEDIUMTEXT,
+                FULLTEXT INDEX ft_essay_contents_original (original_content) WITH PARSER ngram,
+                FOREIGN KEY (essay_id) REFERENCES essays(id)
+                ON DELETE CASCADE
+            )
+        """)
+        ensure_column(cursor, 'essay_contents', 'revised_diff', 'MEDIUMTEXT')
+        # 每写入一篇作文加一，历史列表的 ETag 由它决定 (见 history_etag)
+        ensure_column(cursor, 'users', 'essays_version', 'BIGINT NOT NULL DEFAULT 0')
+        # 已部署的旧表通过迁移补上历史列表使用的联合索引
+        ensure_index(cursor, 'essays', 'idx_essays_username_timestamp', '(username, timestamp, id)')
+        # 作文搜索 (/api/v1/history/<username>/search) 使用的全文索引
+        ensure_fulltext_index(cursor, 'essays', 'ft_essays_title_topic', '(title, topic)')
+        ensure_fulltext_index(cursor, 'essay_contents', 'ft_essay_contents_original', '(original_content)')
+        # 近似重复 (抄袭) 检测索引：每篇作文的 MinHash 签名，以及签名各段的 LSH 分桶键 (见 similarity.py)。
+        # 查询只按 band_key 主键查找候选，耗时与作文总数无关
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS essay_minhash (
+                essay_id VARCHAR(36) PRIMARY KEY,
+                topic_key BIGINT NOT NULL,
+                signature VARBINARY(1024) NOT NULL,
+                FOREIGN KEY (essay_id) REFERENCES essays(id)
+                ON DELETE CASCADE
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS essay_lsh (
+                band_key BIGINT NOT NULL,
+                essay_id VARCHAR(36) NOT NULL,
+                PRIMARY KEY (band_key, essay_id),
+                FOREIGN KEY (essay_id) REFERENCES essays(id)
+                ON DELETE CASCADE
+            )
+        """)
+        # 成绩统计表 (趋势、各题目平均分与分数段、反馈分类)，随作文写入增量更新，见 analytics.py；
+        # 新建统计表时已有的作文需要执行一次 flask --app app rebuild-analytics
+        for statement in analytics.SCHEMA:
+            cursor.execute(statement)
+        # 大模型评分结果的持久化缓存，cache_key 为内容哈希
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                cache_key CHAR(64) PRIMARY KEY,
+                result JSON NOT NULL,
+                created_at BIGINT NOT NULL,
+                INDEX idx_llm_cache_created_at (created_at)
+            )
+        """)
+        # 异步评分任务状态表，id 与任务完成后写入 essays 的作文 id 相同
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS score_jobs (
+                id VARCHAR(36) PRIMARY KEY,
+                username VARCHAR(100),
+                status VARCHAR(16) NOT NULL,
+                result JSON,
+                error TEXT,
+                created_at BIGINT,
+                started_at BIGINT,
+                finished_at BIGINT,
+                worker VARCHAR(128),
+                INDEX idx_score_jobs_status_created_at (status, created_at)
+            )
+        """)
+        # 执行任务的 worker (主机名:pid)，worker 重启后据此把它遗留的未完成任务标记为失败
+        ensure_column(cursor, 'score_jobs', 'worker', 'VARCHAR(128)')
+        ensure_index(cursor, 'score_jobs', 'idx_score_jobs_status_created_at', '(status, created_at)')
         conn.commit()
-    except Exception as e:
-        print(f"Database initialization failed: {e}")
     finally:
         if conn and conn.is_connected():
             conn.close()
 
-def ai_score_and_refine(topic, content):
+def backfill_essay_contents(batch_size=1000):
     """
-    调用阿里云 DashScope API (兼容 OpenAI 模式) 对作文进行评分、结构化反馈和润色。
+    将旧数据的正文从 essays 表分批搬到 essay_contents 表，每批单独提交。
+    返回搬迁的行数。搬迁后可在低峰期执行 OPTIMIZE TABLE essays 回收空间。
     """
-    if client is None:
-        raise Exception("LLM client not initialized. Check DASHSCOPE_API_KEY environment variable.")
+    moved = 0
+    last_id = ''
+    while True:
+        conn = get_db_connection()
+        if conn is None:
+            raise RuntimeError("数据库连接失败")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id FROM essays WHERE id > %s AND original_content <> '' ORDER BY id LIMIT %s",
+                (last_id, batch_size)
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                return moved
+            last_id = ids[-1]
+            placeholders = ", ".join(["%s"] * len(ids))
+            cursor.execute(
+                f"""
+                INSERT IGNORE INTO essay_contents (essay_id, original_content, revised_content)
+                SELECT id, original_content, revised_content FROM essays WHERE id IN ({placeholders})
+                """,
+                tuple(ids)
+            )
+            cursor.execute(
+                f"UPDATE essays SET original_content = '', revised_content = NULL WHERE id IN ({placeholders})",
+                tuple(ids)
+            )
+            conn.commit()
+            moved += len(ids)
+            logger.info(f"Moved {moved} essay bodies to essay_contents")
+        finally:
+            conn.close()
 
-    # 构建发送给大模型的 Prompt
-    system_prompt = (
-        "你是一名专业的中文作文评分和润色专家。你的任务是根据用户提供的作文题目和内容，"
-        "进行以下三项操作：1. 评分（满分 60 分）。2. 提供结构化的反馈（优点、不足、建议）。"
-        "3. 对原文进行润色和优化，提升其表达和结构。"
+# 评分与润色的系统提示词（同时参与结果缓存键的计算）
+REVISED_CONTENT_RULES = (
+    "**尤其重要：在 'revised_content' 字段中，必须只提供经过修改的纯中文文章内容。**"
+    "**严禁在 'revised_content' 中使用任何 Markdown 符号（如 #、*、**、`）、HTML 标签或额外的控制字符（如 \\\\）。**"
+    "**请使用自然的中文分段换行，确保输出的文章可以直接供读者阅读和复制。**"
+)
+SCORE_SYSTEM_PROMPT = (
+    "你是一名专业的中文作文评分和润色专家。你的任务是根据用户提供的作文题目和内容，"
+    "进行以下三项操作：1. 评分（满分 60 分）。2. 提供结构化的反馈（优点、不足、建议）。"
+    "3. 对原文进行润色和优化，提升其表达和结构。"
+    "**【重要格式要求】**"
+    "1. **必须**严格按照提供的 JSON 格式输出结果，键名 (Key Names) 必须使用英文：'score', 'feedback', 'revised_content'。"
+    "2. " + REVISED_CONTENT_RULES
+)
+SCORE_SYSTEM_PROMPTS = {
+    'score': (
+        "你是一名专业的中文作文评分专家。请根据用户提供的作文题目和内容，按满分 60 分给出评分。"
         "**【重要格式要求】**"
-        "1. **必须**严格按照提供的 JSON 格式输出结果，键名 (Key Names) 必须使用英文：'score', 'feedback', 'revised_content'。"
-        "2. **尤其重要：在 'revised_content' 字段中，必须只提供经过修改的纯中文文章内容。**"
-        "**严禁在 'revised_content' 中使用任何 Markdown 符号（如 #、*、**、`）、HTML 标签或额外的控制字符（如 \\\\）。**"
-        "**请使用自然的中文分段换行，确保输出的文章可以直接供读者阅读和复制。**"
+        "**必须**严格按照提供的 JSON 格式输出结果，只包含键 'score'，不要输出反馈、润色或任何解释。"
+    ),
+    'feedback': (
+        "你是一名专业的中文作文评分专家。你的任务是根据用户提供的作文题目和内容，"
+        "进行以下两项操作：1. 评分（满分 60 分）。2. 提供结构化的反馈（优点、不足、建议）。"
+        "**【重要格式要求】**"
+        "**必须**严格按照提供的 JSON 格式输出结果，键名 (Key Names) 必须使用英文：'score', 'feedback'。"
+        "不要输出润色后的文章。"
+    ),
+    'full': SCORE_SYSTEM_PROMPT,
+}
+REWRITE_SYSTEM_PROMPT = (
+    "你是一名专业的中文作文润色专家。请根据用户提供的作文题目和内容，对原文进行润色和优化，提升其表达和结构。"
+    "**【重要格式要求】**"
+    "1. **必须**严格按照提供的 JSON 格式输出结果，只包含键 'revised_content'。"
+    "2. " + REVISED_CONTENT_RULES
+)
+SCORE_MODE_TASKS = {
+    'score': "评分",
+    'feedback': "评分并给出反馈",
+    'full': "评分和润色",
+}
+SCORE_DEFAULT_MODE = os.getenv('SCORE_DEFAULT_MODE', 'full')
+
+def parse_score_mode(value):
+    """
+    解析请求中的 mode 参数，缺省时使用 SCORE_DEFAULT_MODE；不支持的模式抛出 ValueError。
+    """
+    mode = (value or SCORE_DEFAULT_MODE).strip().lower()
+    if mode not in SCORE_MODE_FIELDS:
+        raise ValueError(f"不支持的评分模式: {mode}，可选 {', '.join(SCORE_MODE_FIELDS)}")
+    return mode
+
+# 与 essays.title 的 VARCHAR(255) 一致：超长的标题写入时会被数据库拒绝
+TITLE_MAX_LENGTH = 255
+
+def validate_title(title):
+    """
+    标题不是字符串或超过 TITLE_MAX_LENGTH 个字符时抛出 ValueError；在评分之前检查，不让写入阶段才失败。
+    """
+    if title is not None and not isinstance(title, str):
+        raise ValueError("作文标题必须是字符串")
+    if title and len(title) > TITLE_MAX_LENGTH:
+        raise ValueError(f"作文标题不能超过 {TITLE_MAX_LENGTH} 个字符")
+
+# 评分结果缓存：进程内 LRU + llm_cache 表，相同作文重复提交时不再调用大模型
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '1024'))
+LLM_CACHE_DB_MAX_ROWS = int(os.getenv('LLM_CACHE_DB_MAX_ROWS', '100000'))
+llm_cache = ResultCache(
+    ttl=LLM_CACHE_TTL,
+    max_entries=LLM_CACHE_MAX_ENTRIES,
+    persistent=MySQLCacheStore(get_db_connection, LLM_CACHE_TTL, LLM_CACHE_DB_MAX_ROWS)
+)
+
+def score_cache_key(topic, content, mode='full'):
+    return cache_key(LLM_MODEL, SCORE_SYSTEM_PROMPTS[mode], topic, content)
+
+def cached_full_result(topic, content):
+    """
+    查找同一作文已缓存的完整评分结果；score / feedback 模式和按需润色可以直接复用。
+    """
+    if not LLM_CACHE_ENABLED:
+        return None
+    return llm_cache.get(score_cache_key(topic, content))
+
+def ai_score_and_refine(topic, content, llm_client=None, mode='full'):
+    """
+    调用阿里云 DashScope API (兼容 OpenAI 模式) 对作文进行评分、结构化反馈和润色。
+    mode 为 score / feedback 时只生成对应字段，未生成的 feedback 为空列表、revised_content 为 None。
+    llm_client 用于注入兼容 OpenAI 接口的客户端（如测试桩），默认使用 get_llm_client() 返回的进程内共享客户端。
+    结果按 (模型, 提示词, 题目, 归一化正文) 缓存，同一作文的并发请求共享一次调用。
+    """
+    if not LLM_CACHE_ENABLED:
+        result = _call_llm_score(topic, content, llm_client, mode)
+    else:
+        result = cached_full_result(topic, content) if mode != 'full' else None
+        if result is None:
+            result = llm_cache.get_or_compute(score_cache_key(topic, content, mode),
+                                              lambda: _call_llm_score(topic, content, llm_client, mode))
+    feedback = result['feedback'] if mode != 'score' else []
+    revised_content = result['revised_content'] if mode == 'full' else None
+    return result['score'], feedback, revised_content
+
+def _build_score_messages(topic, content, mode='full'):
+    """
+    构建发送给大模型的 Prompt。
+    """
+    user_prompt = (
+        f"请对以下作文进行{SCORE_MODE_TASKS[mode]}，并严格以 JSON 格式输出结果。\n\n"
+        f"作文题目：{topic}\n"
+        f"作文内容：\n---\n{content}\n---"
     )
-    
+    return [
+        {"role": "system", "content": SCORE_SYSTEM_PROMPTS[mode]},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def _build_rewrite_messages(topic, content):
     user_prompt = (
-        f"请对以下作文进行评分和润色，并严格以 JSON 格式输出结果。\n\n"
+        f"请对以下作文进行润色，并严格以 JSON 格式输出结果。\n\n"
         f"作文题目：{topic}\n"
         f"作文内容：\n---\n{content}\n---"
     )
+    return [
+        {"role": "system", "content": REWRITE_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def _format_feedback(feedback):
+    """
+    将 {'优点': ..., '不足': ..., '建议': ...} 转为前端使用的 [{'type', 'detail'}] 列表。
+    """
+    return [{'type': type_key, 'detail': detail_value} for type_key, detail_value in feedback.items()]
+
+def _parse_llm_result(result):
+    """
+    从大模型返回的 JSON 中提取结果。
+    """
+    score = result['score']
+    feedback = _format_feedback(result.get('feedback') or {})
+    revised_content = result.get('revised_content')
+    #revised_content = result['revised_content'].replace('\n', '<br>')
+    return {'score': score, 'feedback': feedback, 'revised_content': revised_content}
+
+# 大模型调用准入控制：所有 worker 共用一个 DashScope key，RPM / TPM 配额由各进程通过 LLM_QUOTA_PATH 文件共享，
+# 每个进程内按优先级和用户轮转排队 (见 admission.py)
+LLM_RPM = int(os.getenv('LLM_RPM', '600'))
+LLM_TPM = int(os.getenv('LLM_TPM', '1000000'))
+LLM_BURST_SECONDS = float(os.getenv('LLM_BURST_SECONDS', '10'))
+LLM_QUOTA_PATH = os.getenv('LLM_QUOTA_PATH', os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'essayscore_llm_quota'))
+# 每个 worker 同时进行的大模型调用数
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '16'))
+LLM_QUEUE_MAX = int(os.getenv('LLM_QUEUE_MAX', '200'))
+LLM_QUEUE_MAX_PER_USER = int(os.getenv('LLM_QUEUE_MAX_PER_USER', '3'))
+# 最长排队秒数：交互式请求要远小于 gunicorn 超时；批量评分与异步任务没有用户在等待页面，可以排得更久
+LLM_QUEUE_MAX_WAIT = float(os.getenv('LLM_QUEUE_MAX_WAIT', '30'))
+LLM_BATCH_QUEUE_MAX_WAIT = float(os.getenv('LLM_BATCH_QUEUE_MAX_WAIT', '120'))
+LLM_JOB_QUEUE_MAX_WAIT = float(os.getenv('LLM_JOB_QUEUE_MAX_WAIT', '600'))
+# 批量评分不能使用的配额比例，留给交互式请求
+LLM_BATCH_RESERVE = float(os.getenv('LLM_BATCH_RESERVE', '0.2'))
+# 服务端返回 429 时按 Retry-After (没有时按 LLM_RATE_LIMIT_BACKOFF * 2^n 秒) 暂停调度并重试的次数
+LLM_RATE_LIMIT_RETRIES = int(os.getenv('LLM_RATE_LIMIT_RETRIES', '2'))
+LLM_RATE_LIMIT_BACKOFF = float(os.getenv('LLM_RATE_LIMIT_BACKOFF', '2'))
+llm_admission = AdmissionController(
+    SharedQuota(LLM_QUOTA_PATH, LLM_RPM, LLM_TPM, burst_seconds=LLM_BURST_SECONDS),
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    max_queue=LLM_QUEUE_MAX,
+    max_user_queue=LLM_QUEUE_MAX_PER_USER,
+    max_wait=LLM_QUEUE_MAX_WAIT,
+    batch_reserve=LLM_BATCH_RESERVE,
+    on_depth=metrics.set_admission_depth,
+    on_wait=metrics.record_admission_wait,
+    on_reject=metrics.record_admission_reject
+)
+# 后台线程 (批量评分、异步任务) 中调用大模型时的调用方：(用户名, 优先级, 最长排队秒数)
+llm_caller = contextvars.ContextVar('llm_caller', default=None)
+
+def current_llm_caller():
+    """返回 (用户名, 优先级, 最长排队秒数)；未显式设置时为当前请求的用户、交互式优先级、默认排队时间。"""
+    caller = llm_caller.get()
+    if caller is not None:
+        return caller
+    return (g.get('username') if has_request_context() else None), INTERACTIVE, None
+
+def estimate_llm_tokens(messages, mode):
+    """
+    占用配额时的 token 估算 (中文约 1 字 1 token)：提示词全文加上预计的输出长度，
+    润色全文的输出与原文等长。调用结束后按 usage 中的实际用量修正。
+    """
+    prompt = sum(len(m['content']) for m in messages)
+    if mode == 'score':
+        completion = 20
+    elif mode == 'feedback':
+        completion = 400
+    else:
+        completion = 400 + len(messages[-1]['content'])
+    return prompt + completion
+
+def is_llm_rate_limited(e):
+    openai = sys.modules.get('openai')
+    return openai is not None and isinstance(e.__cause__ or e, openai.RateLimitError)
+
+def llm_retry_after(e, attempt):
+    """429 响应要求的等待秒数 (Retry-After / retry-after-ms)，没有时按指数退避。"""
+    headers = getattr(getattr(e.__cause__ or e, 'response', None), 'headers', None) or {}
+    for name, scale in (('retry-after-ms', 0.001), ('retry-after', 1)):
+        try:
+            return max(0.0, float(headers.get(name)) * scale)
+        except (TypeError, ValueError):
+            continue
+    return LLM_RATE_LIMIT_BACKOFF * 2 ** attempt
+
+def pause_for_rate_limit(e, attempt):
+    """服务端限流时暂停所有 worker 的调度，加上随机抖动避免暂停结束时同时重试；返回暂停秒数。"""
+    metrics.record_llm_rate_limited()
+    delay = llm_retry_after(e, attempt) * random.uniform(1.0, 1.25)
+    llm_admission.pause(delay)
+    return delay
+
+def _usage_tokens(usage):
+    total = getattr(usage, 'total_tokens', None)
+    return int(total) if total is not None else None
+
+def is_transient_llm_error(e):
+    """
+    判断大模型调用失败是否值得重试（网络错误、超时、5xx）。
+    429 已在 _call_llm 中按准入控制暂停调度并重试过，这里不再重试。
+    """
+    cause = e.__cause__ or e
+    # 没有导入过 openai 说明没有经过 SDK 发出请求 (例如注入了其他客户端)，异常不可能来自 SDK
+    openai = sys.modules.get('openai')
+    if openai is None:
+        return False
+    return isinstance(cause, (openai.APIConnectionError, openai.InternalServerError))
+
+def _call_llm(messages, schema, mode, llm_client=None):
+    """
+    调用大模型并解析返回的 JSON；按 mode 记录调用耗时与 token 用量。
+    """
+    if llm_client is None:
+        llm_client = get_llm_client()
+    if llm_client is None:
+        raise Exception("LLM client not initialized. Check DASHSCOPE_API_KEY environment variable.")
+
+    user, priority, max_wait = current_llm_caller()
+    tokens = estimate_llm_tokens(messages, mode)
+    attempt = 0
+    while True:
+        # 排队等待配额；排不上时 Overloaded 直接抛给路由，返回 429 / 503
+        with track('llm_queue'):
+            ticket = llm_admission.acquire(user, priority, tokens, max_wait)
+        used_tokens = None
+        try:
+            # 调用大模型 API，并指定返回格式为 JSON 对象
+            start = time.perf_counter()
+            with track('llm'):
+                response = llm_client.chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=messages,
+                    response_format={"type": "json_object", "schema": schema}
+                )
+            usage = getattr(response, 'usage', None)
+            used_tokens = _usage_tokens(usage)
+            metrics.record_llm_call(mode, time.perf_counter() - start, usage)
+
+            # 解析 JSON 响应
+            response_text = response.choices[0].message.content
+            result = json.loads(response_text)
+            log_content(logger, "LLM result", result)
+            return result
+
+        except Exception as e:
+            if is_llm_rate_limited(e):
+                # 被限流的请求不计入 token 用量；暂停调度后重新排队
+                used_tokens = 0
+                delay = pause_for_rate_limit(e, attempt)
+                if attempt < LLM_RATE_LIMIT_RETRIES:
+                    attempt += 1
+                    logger.warning(f"LLM rate limited, retry {attempt} after {delay:.1f}s")
+                    continue
+            # 记录详细的 API 调用错误并抛出，以便在 Flask 路由中捕获
+            logger.error(f"LLM API Call Failed: {e}")
+            raise Exception(f"AI评分失败，请检查API Key和网络连接。错误信息: {e}") from e
+        finally:
+            llm_admission.release(ticket, used_tokens)
+
+def _call_llm_score(topic, content, llm_client=None, mode='full'):
+    """
+    实际调用大模型，返回包含 score / feedback / revised_content 的字典。
+    """
+    result = _call_llm(_build_score_messages(topic, content, mode), SCORE_RESPONSE_SCHEMAS[mode], mode, llm_client)
+    return _parse_llm_result(result)
+
+def ai_rewrite(topic, content, llm_client=None):
+    """
+    只生成润色后的全文；同一作文已有完整评分缓存时直接复用其中的 revised_content。
+    """
+    cached = cached_full_result(topic, content)
+    if cached is not None:
+        return cached['revised_content']
+
+    def compute():
+        result = _call_llm(_build_rewrite_messages(topic, content), REWRITE_RESPONSE_SCHEMA, 'rewrite', llm_client)
+        return {'revised_content': result['revised_content']}
+
+    if not LLM_CACHE_ENABLED:
+        return compute()['revised_content']
+    key = cache_key(LLM_MODEL, REWRITE_SYSTEM_PROMPT, topic, content)
+    return llm_cache.get_or_compute(key, compute)['revised_content']
+
+# --- Flask 应用配置 ---
+# 接口、钩子与命令行命令都注册在 api 蓝图上，应用由文件末尾的 create_app() 创建
+api = Blueprint('api', __name__, cli_group=None)
+
+
+@api.before_app_request
+def _reset_stage_timer():
+    # 同一线程会处理多个请求，先清掉上一个请求遗留的计时器
+    metrics.reset()
+
+
+@api.teardown_app_request
+def _finish_stage_timer(exc):
+    """接口里调用了 metrics.start_request() 的请求，在这里记录总耗时。"""
+    timer = metrics.current_timer()
+    if timer is not None:
+        metrics.finish_request(timer)
+
+
+@api.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus 抓取接口：各接口总耗时、分阶段耗时与大模型 token 用量。"""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+# 响应压缩：不小于 COMPRESS_MIN_SIZE 字节的 JSON 响应按 Accept-Encoding 使用 brotli (已安装时) 或 gzip
+COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+compressor = Compressor(
+    min_size=int(os.getenv('COMPRESS_MIN_SIZE', '1024')),
+    gzip_level=int(os.getenv('COMPRESS_GZIP_LEVEL', '6')),
+    brotli_quality=int(os.getenv('COMPRESS_BROTLI_QUALITY', '5'))
+)
+
+@api.after_app_request
+def _compress_response(response):
+    if COMPRESS_ENABLED:
+        compressor.compress(response, request.headers.get('Accept-Encoding'))
+    return response
+
+# 读接口的缓存策略：浏览器可以缓存，但每次使用前都要带 If-None-Match 重新验证
+READ_CACHE_CONTROL = 'private, no-cache'
+
+def _short_hash(*parts):
+    return hashlib.sha1('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()[:16]
+
+def request_etags():
+    """
+    返回 If-None-Match 中的 {去掉压缩后缀的 ETag: 客户端原样发送的 ETag}。
+    """
+    return {strip_etag_suffix(tag): tag for tag in request.if_none_match.as_set()}
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = READ_CACHE_CONTROL
+    return response
+
+def cacheable_json(payload, etag):
+    """带强 ETag 的 JSON 响应；客户端持有的 ETag 与之相同时返回 304。"""
+    matched = request_etags().get(etag)
+    if matched:
+        return not_modified(matched)
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = READ_CACHE_CONTROL
+    return response
+
+# 登录态：登录时签发 HMAC 签名的访问令牌 / 刷新令牌，各接口只在内存中校验签名和有效期，不查 users 表。
+# 所有 worker 必须共用同一个 AUTH_SECRET_KEY；未配置时 gunicorn.conf.py 在主进程启动时生成一个 (重启后旧令牌失效)
+AUTH_SECRET_KEY = os.getenv('AUTH_SECRET_KEY') or secrets.token_hex(32)
+AUTH_ACCESS_TTL = int(os.getenv('AUTH_ACCESS_TTL', '900'))
+AUTH_REFRESH_TTL = int(os.getenv('AUTH_REFRESH_TTL', str(14 * 86400)))
+# 关闭后未带令牌的请求仍按请求中的 username 处理 (兼容旧客户端)；带了令牌就必须有效
+AUTH_REQUIRED = os.getenv('AUTH_REQUIRED', 'true').lower() in ('1', 'true', 'yes')
+token_signer = TokenSigner(AUTH_SECRET_KEY, access_ttl=AUTH_ACCESS_TTL, refresh_ttl=AUTH_REFRESH_TTL)
+# 可以调用管理接口 (如跨用户的相似作文查询) 的用户名，逗号分隔
+ADMIN_USERNAMES = {name.strip() for name in os.getenv('ADMIN_USERNAMES', '').split(',') if name.strip()}
+
+# 密码哈希放到独立线程池中计算，限制并发登录占用的 CPU；PASSWORD_HASH_WORKERS=0 时在请求线程中直接计算
+password_hasher = PasswordHasher(
+    lambda password: generate_password_hash(password, method='pbkdf2:sha256'),
+    check_password_hash,
+    workers=int(os.getenv('PASSWORD_HASH_WORKERS', '1')),
+    max_pending=int(os.getenv('PASSWORD_HASH_MAX_PENDING', '32')),
+    nice=int(os.getenv('PASSWORD_HASH_NICE', '10'))
+)
+
+def overloaded_response(e):
+    """准入控制拒绝 (Overloaded) 时的 429 / 503 响应，Retry-After 为预计等待秒数。"""
+    retry_after = max(1, math.ceil(e.retry_after))
+    response = jsonify({"error": str(e), "retryAfter": retry_after})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
 
+def auth_error(message, invalid=True):
+    response = jsonify({"error": message})
+    response.status_code = 401
+    response.headers['WWW-Authenticate'] = 'Bearer error="invalid_token"' if invalid else 'Bearer'
+    return response
+
+def require_auth(view):
+    """
+    校验 Authorization: Bearer <访问令牌>，通过后令牌中的用户名放在 g.username。
+    AUTH_REQUIRED 关闭且请求未带令牌时 g.username 为 None。
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.username = None
+        token = bearer_token(request.headers.get('Authorization'))
+        if token is None:
+            if AUTH_REQUIRED:
+                return auth_error("缺少访问令牌", invalid=False)
+            return view(*args, **kwargs)
+        try:
+            g.username = token_signer.verify(token)['sub']
+        except InvalidToken as e:
+            return auth_error(str(e))
+        return view(*args, **kwargs)
+    return wrapper
+
+def require_admin(view):
+    """
+    在 require_auth 的基础上要求令牌用户在 ADMIN_USERNAMES 中，否则返回 403；未带令牌时同样拒绝。
+    """
+    @require_auth
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if g.username is None or g.username not in ADMIN_USERNAMES:
+            return jsonify({"error": "无权访问该接口"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+def request_username(username):
+    """
+    请求中声明的用户名与令牌不一致时抛出 PermissionError；返回本次请求实际使用的用户名。
+    """
+    if g.username is None:
+        return username
+    if username and username != g.username:
+        raise PermissionError("无权访问其他用户的数据")
+    return g.username
+
+
+# essays 表只保存元数据；original_content 写入空字符串，正文写入 essay_contents 表。
+# 写后缓冲重试或回放时同一条记录可能写入多次，主键冲突时保持已有的行不变
+ESSAY_INSERT_SQL = """
+    INSERT INTO essays (id, username, topic, title, original_content, score, feedback, revised_content, timestamp)
+    VALUES (%s, %s, %s, %s, '', %s, %s, NULL, %s)
+    ON DUPLICATE KEY UPDATE id = id
+"""
+USER_ESSAYS_VERSION_SQL = "UPDATE users SET essays_version = essays_version + %s WHERE username = %s"
+ESSAY_CONTENT_INSERT_SQL = """
+    INSERT INTO essay_contents (essay_id, original_content, revised_content, revised_diff)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE essay_id = essay_id
+"""
+ESSAY_MINHASH_INSERT_SQL = """
+    INSERT INTO essay_minhash (essay_id, topic_key, signature) VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE topic_key = VALUES(topic_key), signature = VALUES(signature)
+"""
+ESSAY_LSH_INSERT_SQL = """
+    INSERT INTO essay_lsh (band_key, essay_id) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE essay_id = essay_id
+"""
+# 编辑脚本不超过润色全文字节数的这个比例时只存脚本；<=0 表示始终存全文
+REVISED_DIFF_MAX_RATIO = float(os.getenv('REVISED_DIFF_MAX_RATIO', '0.6'))
+
+def pack_revised_content(original_content, revised_content):
+    """返回写入 essay_contents 的 (revised_content, revised_diff)。"""
+    return essay_diff.pack(original_content, revised_content, REVISED_DIFF_MAX_RATIO)
+
+# 近似重复检测：评分结果附带同一题目下最相似的已有作文 (similarEssays)。
+# 普通用户只能看到相似度与时间 (自己的作文另带 id)，作者与其他用户的作文 id 只通过管理接口返回
+SIMILARITY_ENABLED = os.getenv('SIMILARITY_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+SIMILARITY_THRESHOLD = float(os.getenv('SIMILARITY_THRESHOLD', '0.5'))
+SIMILARITY_TOP_K = int(os.getenv('SIMILARITY_TOP_K', '5'))
+# 按命中分桶数取前若干个候选，再用签名估计相似度
+SIMILARITY_MAX_CANDIDATES = int(os.getenv('SIMILARITY_MAX_CANDIDATES', '50'))
+# 修改以下参数后需要执行 flask --app app rebuild-similarity
+minhasher = MinHasher(
+    num_perm=int(os.getenv('SIMILARITY_NUM_PERM', '128')),
+    bands=int(os.getenv('SIMILARITY_BANDS', '32')),
+    shingle_size=int(os.getenv('SIMILARITY_SHINGLE_SIZE', '5'))
+)
+
+def similarity_index_rows(essay_id, topic, content):
+    """
+    返回写入 essay_minhash 的一行与写入 essay_lsh 的若干行：(minhash_row, lsh_rows)。
+    未开启或正文为空时返回 None。
+    """
+    if not SIMILARITY_ENABLED:
+        return None
+    signature = minhasher.signature(content)
+    if signature is None:
+        return None
+    minhash_row = (essay_id, minhasher.topic_key(topic), MinHasher.to_bytes(signature))
+    return minhash_row, [(key, essay_id) for key in minhasher.band_keys(signature, topic)]
+
+def find_similar_essays(topic, content, exclude_id=None):
+    """
+    查找同一题目下与 content 相似度不低于 SIMILARITY_THRESHOLD 的已有作文 (包括其他用户的)，
+    按相似度从高到低最多返回 SIMILARITY_TOP_K 篇：[{id, username, timestamp, similarity}]。
+    结果含其他用户的信息，返回给普通用户前需经 visible_similar_essays 过滤。
+    未开启时返回 []；数据库不可用或查询失败时返回 None，不影响评分结果。
+    """
+    if not SIMILARITY_ENABLED:
+        return []
+    signature = minhasher.signature(content)
+    if signature is None:
+        return []
+    keys = minhasher.band_keys(signature, topic)
+    conn = get_db_connection()
+    if conn is None:
+        return None
+    cursor = conn.cursor()
     try:
-        # 调用大模型 API，并指定返回格式为 JSON 对象
-        response = client.chat.completions.create(
-            model=LLM_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            response_format={"type": "json_object", "schema": LLM_RESPONSE_SCHEMA}
-        )
-        
-        # 解析 JSON 响应
-        response_text = response.choices[0].message.content
-        result = json.loads(response_text)
-        print(result)
-        # 提取结果
-        score = result['score']
-        print(score)
-        feedback = [{'type': type_key, 'detail': detail_value} for type_key, detail_value in result['feedback'].items()]
-        print(feedback)
-        revised_content = result['revised_content']
-        #revised_content = result['revised_content'].replace('\n', '<br>')
-        print(revised_content)
-        return score, feedback, revised_content
+        with track('similarity'):
+            placeholders = ", ".join(["%s"] * len(keys))
+            cursor.execute(
+                f"""
+                SELECT m.essay_id, m.signature, e.username, e.timestamp
+                FROM (
+                    SELECT essay_id, COUNT(*) AS hits FROM essay_lsh
+                    WHERE band_key IN ({placeholders})
+                    GROUP BY essay_id ORDER BY hits DESC LIMIT %s
+                ) AS c
+                JOIN essay_minhash m ON m.essay_id = c.essay_id
+                JOIN essays e ON e.id = c.essay_id
+                """,
+                (*keys, SIMILARITY_MAX_CANDIDATES)
+            )
+            rows = cursor.fetchall()
+    except mysql.connector.Error as e:
+        logger.warning(f"Similar essay lookup failed: {e}")
+        return None
+    finally:
+        if conn.is_connected():
+            conn.close()
+
+    similar = []
+    for essay_id, stored, username, timestamp in rows:
+        if essay_id == exclude_id:
+            continue
+        score = MinHasher.similarity(signature, MinHasher.from_bytes(stored))
+        if score >= SIMILARITY_THRESHOLD:
+            similar.append({"id": essay_id, "username": username, "timestamp": timestamp,
+                            "similarity": round(score, 3)})
+    similar.sort(key=lambda item: item['similarity'], reverse=True)
+    return similar[:SIMILARITY_TOP_K]
+
+def visible_similar_essays(similar, viewer):
+    """
+    find_similar_essays 的结果中返回给普通用户的部分：[{similarity, timestamp}]，
+    属于 viewer 的作文另带 id。similar 为 None (查询失败) 时原样返回。
+    """
+    if similar is None:
+        return None
+    visible = []
+    for item in similar:
+        entry = {"similarity": item['similarity'], "timestamp": item['timestamp']}
+        if item['username'] == viewer:
+            entry['id'] = item['id']
+        visible.append(entry)
+    return visible
+
+# 成绩统计：按日统计使用的时区 (相对 UTC 的小时数) 与分数段宽度，修改后需要执行 flask --app app rebuild-analytics
+ANALYTICS_UTC_OFFSET_HOURS = float(os.getenv('ANALYTICS_UTC_OFFSET_HOURS', '8'))
+ANALYTICS_SCORE_BUCKET = int(os.getenv('ANALYTICS_SCORE_BUCKET', '10'))
+ANALYTICS_MAX_DAYS = int(os.getenv('ANALYTICS_MAX_DAYS', '3650'))
+ANALYTICS_MAX_TOPICS = int(os.getenv('ANALYTICS_MAX_TOPICS', '100'))
+
+def new_aggregates():
+    return analytics.Aggregates(int(ANALYTICS_UTC_OFFSET_HOURS * 3600), ANALYTICS_SCORE_BUCKET)
+
+def _essay_record(topic, title, content, score, feedback, revised_content, essay_id=None):
+    """
+    构造前端使用的作文字典（camelCase 键名）。
+    """
+    return {
+        "id": essay_id or str(uuid4()),
+        "topic": topic,
+        "title": title,
+        "originalContent": content,
+        "score": score,
+        "feedback": feedback, # 返回时仍使用 Python 对象
+        "revisedContent": revised_content,
+        "timestamp": int(time.time() * 1000)
+    }
+
+def write_essays(records):
+    """
+    用一次多行 INSERT (executemany) 把一批 {"username", "essay"} 记录写入 essays / essay_contents 表并统一提交。
+    写后缓冲的批量写入函数，也用于关闭缓冲时的同步写入。
+    数据库不可用时抛出 RuntimeError，写入失败时抛出 mysql.connector.Error。
+    """
+    if not records:
+        return
+    conn = get_db_connection()
+    if conn is None:
+        raise RuntimeError("数据库连接失败")
+
+    cursor = conn.cursor()
+    try:
+        # MySQL 中可以直接存储 JSON 对象，但为了兼容性，我们仍将 Python 列表转为 JSON 字符串
+        rows = []
+        content_rows = []
+        minhash_rows = []
+        lsh_rows = []
+        for record in records:
+            e = record['essay']
+            rows.append((e['id'], record['username'], e['topic'], e['title'], e['score'],
+                         json.dumps(e['feedback'], ensure_ascii=False), e['timestamp']))
+            content_rows.append((e['id'], e['originalContent'],
+                                 *pack_revised_content(e['originalContent'], e['revisedContent'])))
+            index_rows = similarity_index_rows(e['id'], e['topic'], e['originalContent'])
+            if index_rows:
+                minhash_rows.append(index_rows[0])
+                lsh_rows.extend(index_rows[1])
+        # 使用 %s 作为 MySQL 的参数占位符；元数据、正文、相似度索引与成绩统计在同一事务中提交
+        with track('db_query'):
+            # 统计表是累加的，重试 / 回放时已写入的作文不能再计一次：先锁定并找出已存在的 id
+            placeholders = ", ".join(["%s"] * len(rows))
+            cursor.execute(f"SELECT id FROM essays WHERE id IN ({placeholders}) FOR UPDATE",
+                           tuple(row[0] for row in rows))
+            existing = {row[0] for row in cursor.fetchall()}
+            aggregates = new_aggregates()
+            added = {}
+            for record in records:
+                e = record['essay']
+                if e['id'] not in existing:
+                    aggregates.add(record['username'], e['topic'], e['score'], e['feedback'], e['timestamp'])
+                    added[record['username']] = added.get(record['username'], 0) + 1
+            cursor.executemany(ESSAY_INSERT_SQL, rows)
+            cursor.executemany(ESSAY_CONTENT_INSERT_SQL, content_rows)
+            if minhash_rows:
+                cursor.executemany(ESSAY_MINHASH_INSERT_SQL, minhash_rows)
+                cursor.executemany(ESSAY_LSH_INSERT_SQL, lsh_rows)
+            aggregates.apply(cursor)
+            # 回放 / 延迟写入的作文时间戳可能早于已有的作文，历史列表的任意一页都可能变化：
+            # 用户的作文版本号随每次新增递增 (按用户名排序加锁，避免并发批次互相死锁)
+            if added:
+                cursor.executemany(USER_ESSAYS_VERSION_SQL, [(added[name], name) for name in sorted(added)])
+            conn.commit()
+    finally:
+        if conn.is_connected():
+            conn.close()
+
+# 写后缓冲：评分结果交给后台线程合并写入 (group commit)，数据库故障时重试并溢写到本地文件，启动时回放。
+# 请求最多等待 ESSAY_WRITE_ACK_TIMEOUT 秒：正常情况下返回前已经提交 (紧接着的历史列表查询能看到新作文)，
+# 数据库变慢或不可用时不再等待，评分结果照常返回，记录留在缓冲 / 溢写文件中稍后写入
+ESSAY_WRITE_BEHIND = os.getenv('ESSAY_WRITE_BEHIND', 'true').lower() in ('1', 'true', 'yes')
+ESSAY_WRITE_ACK_TIMEOUT = float(os.getenv('ESSAY_WRITE_ACK_TIMEOUT', '0.5'))
+# worker 退出时等待写后缓冲写完的最长秒数，超时未写入的记录溢写到文件 (需小于 gunicorn 的 graceful_timeout)
+ESSAY_WRITE_CLOSE_TIMEOUT = float(os.getenv('ESSAY_WRITE_CLOSE_TIMEOUT', '5'))
+ESSAY_SPILL_PATH = os.getenv('ESSAY_SPILL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                              'spill', 'essays.jsonl'))
+# 被数据库拒绝 (违反约束、字段超长) 的记录不重试也不溢写，移到死信文件等待人工处理
+ESSAY_DEAD_LETTER_PATH = os.getenv('ESSAY_DEAD_LETTER_PATH',
+                                   os.path.splitext(ESSAY_SPILL_PATH)[0] + '.rejected.jsonl')
+
+def is_rejected_write(e):
+    """写入失败是否因为数据本身 (重试也不会成功)：违反外键 / 主键等约束 (IntegrityError)、字段超长等 (DataError)。"""
+    return isinstance(e, (mysql.connector.IntegrityError, mysql.connector.DataError))
+
+essay_writer = WriteBehindBuffer(
+    write_essays,
+    ESSAY_SPILL_PATH,
+    max_batch=int(os.getenv('ESSAY_WRITE_MAX_BATCH', '200')),
+    linger=float(os.getenv('ESSAY_WRITE_LINGER_MS', '0')) / 1000,
+    max_depth=int(os.getenv('ESSAY_WRITE_MAX_DEPTH', '10000')),
+    max_retries=int(os.getenv('ESSAY_WRITE_MAX_RETRIES', '3')),
+    backoff=float(os.getenv('ESSAY_WRITE_RETRY_BACKOFF', '0.2')),
+    replay_interval=float(os.getenv('ESSAY_SPILL_REPLAY_INTERVAL', '30')),
+    on_flush=metrics.record_write_behind_flush,
+    on_depth=metrics.set_write_behind_depth,
+    is_rejected=is_rejected_write,
+    dead_letter_path=ESSAY_DEAD_LETTER_PATH
+)
+
+def save_essays(username, essays):
+    """
+    保存同一用户的多条作文记录。开启写后缓冲时提交到 essay_writer 并最多等待 ESSAY_WRITE_ACK_TIMEOUT 秒，
+    返回 written (已提交) / spilled (已溢写到本地文件) / None (仍在缓冲中)；关闭时同步写入并返回 written。
+    缓冲已满且溢写失败，或记录被数据库拒绝 (已移到死信文件) 时抛出 RuntimeError；关闭缓冲时同 write_essays。
+    """
+    if not essays:
+        return WRITTEN
+    records = [{'username': username, 'essay': e} for e in essays]
+    if not ESSAY_WRITE_BEHIND:
+        write_essays(records)
+        return WRITTEN
+    try:
+        entry = essay_writer.submit(records)
+    except BufferFull as e:
+        raise RuntimeError(f"数据保存失败: {e}")
+    with track('db_write_wait'):
+        status = essay_writer.wait(entry, ESSAY_WRITE_ACK_TIMEOUT)
+    if status == REJECTED:
+        raise RuntimeError("数据保存失败: 记录被数据库拒绝")
+    if status != WRITTEN:
+        logger.warning("essay write deferred", extra={'fields': {'essays': len(essays), 'status': status}})
+    return status
+
+def save_essay(username, topic, title, content, score, feedback, revised_content, essay_id=None):
+    """
+    将评分结果写入 essays 表，返回前端使用的作文字典。
+    数据库不可用时抛出 RuntimeError，写入失败时抛出 mysql.connector.Error。
+    """
+    essay = _essay_record(topic, title, content, score, feedback, revised_content, essay_id)
+    save_essays(username, [essay])
+    return essay
 
+def run_score_job(payload):
+    """
+    后台任务：评分并保存，返回值即任务结果。
+    """
+    timer = metrics.start_request('score_job')
+    caller = llm_caller.set((payload['username'], INTERACTIVE, LLM_JOB_QUEUE_MAX_WAIT))
+    try:
+        score, feedback, revised_content = ai_score_and_refine(payload['topic'], payload['content'],
+                                                               mode=payload.get('mode', 'full'))
+        similar = find_similar_essays(payload['topic'], payload['content'], exclude_id=payload['essay_id'])
+        try:
+            essay = save_essay(payload['username'], payload['topic'], payload['title'], payload['content'],
+                               score, feedback, revised_content, essay_id=payload['essay_id'])
+        except mysql.connector.Error as e:
+            raise RuntimeError(f"数据保存失败: {e}")
+        return dict(essay, similarEssays=visible_similar_essays(similar, payload['username']))
+    finally:
+        llm_caller.reset(caller)
+        metrics.finish_request(timer)
+
+# 异步评分队列：SCORE_JOB_STORE=mysql 时任务状态写入 score_jobs 表，供所有 worker 查询
+SCORE_JOB_WORKERS = int(os.getenv('SCORE_JOB_WORKERS', '4'))
+SCORE_JOB_MAX_DEPTH = int(os.getenv('SCORE_JOB_MAX_DEPTH', '100'))
+SCORE_JOB_STORE = os.getenv('SCORE_JOB_STORE', 'mysql')
+# worker 退出时等待正在执行的任务完成的最长秒数，超时的任务标记为失败 (与写后缓冲的等待合计需小于 graceful_timeout)
+SCORE_JOB_CLOSE_TIMEOUT = float(os.getenv('SCORE_JOB_CLOSE_TIMEOUT', '10'))
+# 创建超过这么多秒仍未完成的任务视为所在 worker 已退出 (需大于排队上限 LLM_JOB_QUEUE_MAX_WAIT 加上评分耗时)
+SCORE_JOB_STALE_SECONDS = float(os.getenv('SCORE_JOB_STALE_SECONDS', '3600'))
+score_jobs = JobQueue(
+    run_score_job,
+    store=MySQLJobStore(get_db_connection) if SCORE_JOB_STORE == 'mysql' else InMemoryJobStore(),
+    workers=SCORE_JOB_WORKERS,
+    max_depth=SCORE_JOB_MAX_DEPTH
+)
+
+def _wants_async(data):
+    flag = request.args.get('async', data.get('async', False))
+    return str(flag).lower() in ('1', 'true', 'yes')
+
+@api.route('/api/v1/score', methods=['POST'])
+@require_auth
+def score_essay():
+    """
+    API 1: 提交作文，进行评分和保存。
+    mode 可选 score (只评分) / feedback (评分 + 反馈) / full (再加全文润色，默认)；
+    未润色的作文之后可以通过 /api/v1/essay/<id>/rewrite 按需生成。
+    revised=diff 时以 revisedDiff (相对原文的编辑脚本) 代替 revisedContent 返回。
+    请求体或查询参数带 async=true 时，只登记任务并立即返回 jobId (HTTP 202)。
+    返回结果中的 similarEssays 为同一题目下的相似作文 (见 visible_similar_essays)，查询失败时为 null。
+    """
+    data = request.get_json()
+    topic = data.get('topic')
+    title = data.get('title', '无标题作文')
+    content = data.get('content')
+    
+    if not topic or not content:
+        return jsonify({"error": "缺少作文题目描述或内容"}), 400
+    try:
+        validate_title(title)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        username = request_username(data.get('username'))
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    try:
+        mode = parse_score_mode(data.get('mode') or request.args.get('mode'))
+        revised_format = parse_revised_format(data.get('revised') or request.args.get('revised'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if _wants_async(data):
+        essay_id = str(uuid4())
+        payload = {'username': username, 'topic': topic, 'title': title,
+                   'content': content, 'essay_id': essay_id, 'mode': mode}
+        try:
+            job = score_jobs.submit(payload, username=username, job_id=essay_id)
+        except QueueFull as e:
+            return jsonify({"error": str(e)}), 503
+        except Exception as e:
+            current_app.logger.error(f"Job submit failed: {e}")
+            return jsonify({"error": "评分任务提交失败"}), 500
+        return jsonify({"jobId": job.id, "status": job.status}), 202
+
+    timer = metrics.start_request('score_essay')
+    # 1. AI 评分
+    try:
+        score, feedback, revised_content = ai_score_and_refine(topic, content, mode=mode)
+    except Overloaded as e:
+        current_app.logger.warning(f"AI scoring rejected: {e}", extra={'fields': timer.fields()})
+        return overloaded_response(e)
     except Exception as e:
-        # 记录详细的 API 调用错误并抛出，以便在 Flask 路由中捕获
-        print(f"LLM API Call Failed: {e}")
-        raise Exception(f"AI评分失败，请检查API Key和网络连接。错误信息: {e}")
+        current_app.logger.error(f"AI scoring failed: {e}", extra={'fields': timer.fields()})
+        return jsonify({"error": "评分服务调用失败"}), 500
 
-# --- Flask 应用配置 ---
-app = Flask(__name__)
-# 启用 CORS，允许前端（默认运行在不同端口）访问后端
-CORS(app) 
-init_db()
+    # 2. 查找相似的已有作文 (在写入之前查询，结果中不会包含本篇)
+    similar = find_similar_essays(topic, content)
+
+    # 3. 存入数据库
+    try:
+        essay = save_essay(username, topic, title, content, score, feedback, revised_content)
+    except RuntimeError as e:
+        # 数据库连接失败、缓冲已满且溢写失败，或记录被数据库拒绝
+        current_app.logger.error(f"Database save failed: {e}", extra={'fields': timer.fields()})
+        return jsonify({"error": str(e)}), 500
+    except mysql.connector.Error as e:
+        current_app.logger.error(f"Database save failed: {e}", extra={'fields': timer.fields()})
+        return jsonify({"error": f"数据保存失败: {e}"}), 500
+    essay = dict(essay, similarEssays=visible_similar_essays(similar, username))
+
+    # 4. 返回结果给前端
+    with timer.stage('serialize'):
+        response = jsonify(as_revised_diff(dict(essay)) if revised_format == 'diff' else essay)
+    logger.info("score_essay", extra={'fields': timer.fields(essay_id=essay['id'], mode=mode,
+                                                              content_chars=len(content))})
+    return response
+
+@api.route('/api/v1/score/stream', methods=['POST'])
+@require_auth
+def score_essay_stream():
+    """
+    API 1 的流式版本 (Server-Sent Events)：
+    score / feedback 字段一生成完整就推送，revised_content 逐段推送 (revised 事件)，
+    生成结束后写入 essays 表并以 done 事件返回完整记录。mode 参数同 /api/v1/score。
+    先查评分缓存，未命中时才在开始推送之前获取大模型配额，排不上队时直接返回 429 / 503 (见 overloaded_response)。
+    """
+    data = request.get_json()
+    topic = data.get('topic')
+    title = data.get('title', '无标题作文')
+    content = data.get('content')
+
+    if not topic or not content:
+        return jsonify({"error": "缺少作文题目描述或内容"}), 400
+    try:
+        validate_title(title)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        username = request_username(data.get('username'))
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    try:
+        mode = parse_score_mode(data.get('mode') or request.args.get('mode'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # 命中缓存时不调用大模型，也不排队占用配额 (与非流式接口的 ai_score_and_refine 一致)
+    key = score_cache_key(topic, content, mode)
+    cached = None
+    if LLM_CACHE_ENABLED:
+        cached = llm_cache.get(key) or (cached_full_result(topic, content) if mode != 'full' else None)
+    ticket = None
+    if cached is None:
+        llm_client = get_llm_client()
+        if llm_client is None:
+            return jsonify({"error": "评分服务调用失败"}), 500
+        messages = _build_score_messages(topic, content, mode)
+        try:
+            ticket = llm_admission.acquire(username, INTERACTIVE, estimate_llm_tokens(messages, mode))
+        except Overloaded as e:
+            return overloaded_response(e)
+
+    def sse(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    def generate():
+        essay_id = str(uuid4())
+        # 先发送一个事件，让客户端尽快收到首字节
+        yield sse('start', {'id': essay_id})
+
+        result = cached
+        if result is not None:
+            yield sse('score', {'score': result['score']})
+            if mode != 'score':
+                yield sse('feedback', {'feedback': result['feedback']})
+            if mode == 'full':
+                yield sse('revised', {'delta': result['revised_content']})
+        else:
+            parser = JsonFieldStream(stream_fields=('revised_content',))
+            parts = []
+            usage = None
+            try:
+                start = time.perf_counter()
+                stream = llm_client.chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=messages,
+                    response_format={"type": "json_object", "schema": SCORE_RESPONSE_SCHEMAS[mode]},
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                for chunk in stream:
+                    if getattr(chunk, 'usage', None):
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    parts.append(delta)
+                    for kind, field, value in parser.feed(delta):
+                        if kind == 'field' and field == 'score':
+                            yield sse('score', {'score': value})
+                        elif kind == 'field' and field == 'feedback':
+                            yield sse('feedback', {'feedback': _format_feedback(value)})
+                        elif kind == 'text':
+                            yield sse('revised', {'delta': value})
+                result = _parse_llm_result(json.loads(''.join(parts)))
+                metrics.record_llm_call(mode, time.perf_counter() - start, usage)
+            except Exception as e:
+                if is_llm_rate_limited(e):
+                    # 已经开始推送，不再重试：暂停调度，告诉客户端多久之后重试
+                    llm_admission.release(ticket, 0)
+                    delay = pause_for_rate_limit(e, 0)
+                    yield sse('error', {'error': "评分服务繁忙，请稍后重试", 'retryAfter': max(1, math.ceil(delay))})
+                    return
+                current_app.logger.error(f"AI streaming scoring failed: {e}")
+                yield sse('error', {'error': "评分服务调用失败"})
+                return
+            finally:
+                llm_admission.release(ticket, _usage_tokens(usage))
+            if LLM_CACHE_ENABLED:
+                llm_cache.set(key, result)
+
+        feedback = result['feedback'] if mode != 'score' else []
+        revised_content = result['revised_content'] if mode == 'full' else None
+        similar = find_similar_essays(topic, content, exclude_id=essay_id)
+        try:
+            essay = save_essay(username, topic, title, content, result['score'], feedback,
+                               revised_content, essay_id=essay_id)
+        except Exception as e:
+            current_app.logger.error(f"Database save failed: {e}")
+            yield sse('error', {'error': f"数据保存失败: {e}"})
+            return
+        yield sse('done', dict(essay, similarEssays=visible_similar_essays(similar, username)))
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    if ticket is not None:
+        # 客户端在生成开始前断开时 generate 不会执行，由这里释放并发名额 (release 可以重复调用)
+        response.call_on_close(lambda: llm_admission.release(ticket))
+    return response
+
+# 批量评分配置：并发上限、每秒请求数上限 (<=0 不限速)、可重试错误的重试次数
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '100'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '8'))
+BATCH_RATE_LIMIT = float(os.getenv('BATCH_RATE_LIMIT', '5'))
+BATCH_MAX_RETRIES = int(os.getenv('BATCH_MAX_RETRIES', '3'))
+BATCH_RETRY_BACKOFF = float(os.getenv('BATCH_RETRY_BACKOFF', '1'))
+# 同一进程内的所有批次共享一个限速器
+batch_limiter = RateLimiter(BATCH_RATE_LIMIT, burst=BATCH_CONCURRENCY)
+
+@api.route('/api/v1/score/batch', methods=['POST'])
+@require_auth
+def score_essay_batch():
+    """
+    API 1 的批量版本：一次提交整班作文 {"username", "items": [{topic, title, content}, ...]}。
+    以有限并发调用大模型，成功的结果用一次多行 INSERT 写入，返回每一项的状态。
+    mode 参数同 /api/v1/score，对整批作文生效。
+    """
+    data = request.get_json()
+    items = data.get('items') or []
+    try:
+        username = request_username(data.get('username'))
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    try:
+        mode = parse_score_mode(data.get('mode'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "缺少批量作文列表"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"单次最多提交 {BATCH_MAX_ITEMS} 篇作文"}), 400
+
+    # 并发不超过限速器的突发容量 (BATCH_CONCURRENCY)，多出的线程只会在限速器上等待
+    max_concurrency = int(batch_limiter.capacity)
+    try:
+        concurrency = max(1, min(int(data.get('concurrency') or max_concurrency), max_concurrency))
+    except (TypeError, ValueError, OverflowError):
+        return jsonify({"error": "concurrency 参数无效"}), 400
+
+    results = [None] * len(items)
+    pending = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('topic') or not item.get('content'):
+            results[index] = {"index": index, "status": "invalid", "error": "缺少作文题目描述或内容"}
+            continue
+        try:
+            validate_title(item.get('title'))
+        except ValueError as e:
+            results[index] = {"index": index, "status": "invalid", "error": str(e)}
+            continue
+        pending.append(index)
+
+    def score_one(index):
+        # 在批量评分的线程池中执行：以低优先级排队，不挤占交互式请求
+        item = items[index]
+        caller = llm_caller.set((username, BATCH, LLM_BATCH_QUEUE_MAX_WAIT))
+        try:
+            return ai_score_and_refine(item['topic'], item['content'], mode=mode)
+        finally:
+            llm_caller.reset(caller)
+
+    outcomes = run_batch(pending, score_one, concurrency=concurrency, limiter=batch_limiter,
+                         is_transient=is_transient_llm_error, max_retries=BATCH_MAX_RETRIES,
+                         backoff=BATCH_RETRY_BACKOFF)
+
+    essays = []
+    for index, outcome in zip(pending, outcomes):
+        if not outcome['ok']:
+            current_app.logger.error(f"AI scoring failed for batch item {index}: {outcome['error']}")
+            results[index] = {"index": index, "status": "failed", "error": "评分服务调用失败",
+                              "attempts": outcome['attempts']}
+            continue
+        item = items[index]
+        score, feedback, revised_content = outcome['value']
+        essay = _essay_record(item['topic'], item.get('title', '无标题作文'), item['content'],
+                              score, feedback, revised_content)
+        essays.append(essay)
+        results[index] = {"index": index, "status": "ok", "attempts": outcome['attempts'], "essay": essay}
+
+    try:
+        save_essays(username, essays)
+    except (RuntimeError, mysql.connector.Error) as e:
+        current_app.logger.error(f"Database batch save failed: {e}")
+        for result in results:
+            if result['status'] == 'ok':
+                result['status'] = 'unsaved'
+                result['error'] = f"数据保存失败: {e}"
+
+    succeeded = sum(1 for r in results if r['status'] == 'ok')
+    return jsonify({
+        "total": len(items),
+        "succeeded": succeeded,
+        "failed": len(items) - succeeded,
+        "items": results
+    })
+
+@api.route('/api/v1/llm/admission/stats', methods=['GET'])
+def llm_admission_stats():
+    """
+    大模型调用准入控制统计（当前 worker 进程）：各优先级排队数、并发数、拒绝次数与共享配额余量。
+    """
+    return jsonify(llm_admission.stats())
+
+@api.route('/api/v1/cache/stats', methods=['GET'])
+def llm_cache_stats():
+    """
+    评分结果缓存统计（当前 worker 进程）：命中/未命中次数、共享的并发调用次数。
+    """
+    return jsonify(llm_cache.stats())
+
+@api.route('/api/v1/jobs/stats', methods=['GET'])
+def score_job_stats():
+    """
+    异步评分队列统计（当前 worker 进程）：队列深度、运行中任务数、排队与执行耗时。
+    """
+    return jsonify(score_jobs.stats())
+
+@api.route('/api/v1/jobs/<job_id>', methods=['GET'])
+@require_auth
+def get_score_job(job_id):
+    """
+    查询异步评分任务状态；status 为 done 时 result 字段与同步接口的返回相同。
+    任务不属于当前登录用户时与不存在一样返回 404。
+    """
+    try:
+        job = score_jobs.get(job_id, owner=g.username)
+    except Exception as e:
+        current_app.logger.error(f"Job query failed: {e}")
+        return jsonify({"error": "任务状态查询失败"}), 500
+    if job is None:
+        return jsonify({"error": "任务未找到"}), 404
+    return jsonify(job)
+
+@api.route('/api/v1/jobs/<job_id>/events', methods=['GET'])
+@require_auth
+def stream_score_job(job_id):
+    """
+    以 Server-Sent Events 推送任务状态变化，任务结束后关闭连接。
+    """
+    try:
+        poll_interval = float(request.args.get('interval', 0.5))
+        if math.isnan(poll_interval):
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "interval 参数无效"}), 400
+    # 轮询间隔限制在 [0.1, 5] 秒：过小会让工作线程在整个推送期间不停查库
+    poll_interval = min(max(poll_interval, 0.1), 5.0)
+    # 生成器在请求上下文之外执行，先取出当前用户
+    owner = g.username
+
+    def generate():
+        last_status = None
+        deadline = time.monotonic() + 600
+        while time.monotonic() < deadline:
+            try:
+                job = score_jobs.get(job_id, owner=owner)
+            except Exception as e:
+                yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+                return
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'error': '任务未找到'}, ensure_ascii=False)}\n\n"
+                return
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield f"event: status\ndata: {json.dumps(job, ensure_ascii=False)}\n\n"
+            if last_status in FINISHED_STATUSES:
+                return
+            time.sleep(poll_interval)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# 历史列表分页：默认每页条数与单页上限
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '20'))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', '100'))
+
+def encode_history_cursor(timestamp, essay_id):
+    """
+    将上一页最后一条的 (timestamp, id) 编码为不透明的游标字符串。
+    """
+    return base64.urlsafe_b64encode(f"{timestamp}:{essay_id}".encode()).decode().rstrip('=')
+
+def decode_history_cursor(cursor):
+    """
+    解析游标，返回 (timestamp, id)；cursor 为空时返回 None，格式错误抛出 ValueError。
+    """
+    if not cursor:
+        return None
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    timestamp, essay_id = raw.split(':', 1)
+    return int(timestamp), essay_id
+
+@api.route('/api/v1/history/<username>', methods=['GET'])
+@require_auth
+def get_history(username):
+    """
+    API 2: 获取历史作文列表 (侧边栏用)。
+    带 limit 或 cursor 参数时按游标分页，返回 {"items": [...], "nextCursor": ...}；
+    nextCursor 为 null 表示已到最后一页。不带参数时保持原来的完整列表返回。
+    """
+    metrics.start_request('get_history')
+    try:
+        request_username(username)
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    paged = 'limit' in request.args or 'cursor' in request.args
+    try:
+        limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+        after = decode_history_cursor(request.args.get('cursor'))
+    except (ValueError, TypeError):
+        return jsonify({"error": "分页参数无效"}), 400
+
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({"error": "数据库连接失败"}), 500
+        
+    cursor = conn.cursor(dictionary=True) # 使用 dictionary=True 让结果以字典形式返回
+    
+    try:
+        # 回放溢写文件、延迟写入的作文时间戳可能早于已有作文，任意一页都可能变化，
+        # 因此各页的 ETag 都取决于用户的作文版本号：先按主键读出版本号 (早于列表读取，并发写入只会让 ETag 偏旧)，
+        # 客户端带了 ETag 时先比对
+        with track('db_query'):
+            cursor.execute("SELECT essays_version FROM users WHERE username = %s", (username,))
+            row = cursor.fetchone()
+        version = row['essays_version'] if row else 0
+        etag = history_etag(username, paged, limit, request.args.get('cursor'), version)
+        matched = request_etags().get(etag)
+        if matched:
+            return not_modified(matched)
+        # 获取列表所需的字段，按时间倒序；走 (username, timestamp, id) 索引，无需 filesort
+        sql = "SELECT id, title, timestamp FROM essays WHERE username = %s"
+        params = [username]
+        if after is not None:
+            sql += " AND (timestamp < %s OR (timestamp = %s AND id < %s))"
+            params += [after[0], after[0], after[1]]
+        sql += " ORDER BY timestamp DESC, id DESC"
+        if paged:
+            # 多取一条用于判断是否还有下一页
+            sql += " LIMIT %s"
+            params.append(limit + 1)
+        with track('db_query'):
+            cursor.execute(sql, tuple(params))
+            history_data = cursor.fetchall()
+    except mysql.connector.Error as e:
+        current_app.logger.error(f"Database query failed: {e}")
+        return jsonify({"error": "历史数据查询失败"}), 500
+    finally:
+        if conn.is_connected():
+            conn.close()
+
+    if not paged:
+        return cacheable_json(history_data, etag)
+
+    next_cursor = None
+    if len(history_data) > limit:
+        history_data = history_data[:limit]
+        last = history_data[-1]
+        next_cursor = encode_history_cursor(last['timestamp'], last['id'])
+    return cacheable_json({"items": history_data, "nextCursor": next_cursor}, etag)
+
+def history_etag(username, paged, limit, cursor, version):
+    """历史列表某一页 (cursor 为 None 时为第一页 / 完整列表) 的 ETag，由请求参数与该用户的作文版本号决定。"""
+    return f"h.{_short_hash(username, paged, limit, cursor, version)}"
+
+# 作文搜索：标题 + 题目、正文上各有一个 ngram 全文索引，标题 / 题目命中的得分乘以 SEARCH_TITLE_WEIGHT
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '20'))
+SEARCH_MAX_PAGE_SIZE = int(os.getenv('SEARCH_MAX_PAGE_SIZE', '50'))
+SEARCH_MAX_OFFSET = int(os.getenv('SEARCH_MAX_OFFSET', '1000'))
+SEARCH_MAX_TERMS = int(os.getenv('SEARCH_MAX_TERMS', '8'))
+SEARCH_TITLE_WEIGHT = float(os.getenv('SEARCH_TITLE_WEIGHT', '3'))
+# 与 MySQL 的 ngram_token_size 一致 (默认 2)：短于它的词无法按短语匹配，改为前缀匹配
+NGRAM_TOKEN_SIZE = int(os.getenv('NGRAM_TOKEN_SIZE', '2'))
+# 摘要：正文中第一个搜索词前后的片段
+SEARCH_SNIPPET_BEFORE = 20
+SEARCH_SNIPPET_LENGTH = 80
+_BOOLEAN_OPERATORS_RE = re.compile(r'[+\-<>()~*"@]')
+
+SEARCH_SQL = f"""
+    SELECT e.id, e.title, e.timestamp,
+           SUBSTRING(c.original_content,
+                     GREATEST(LOCATE(%(first)s, c.original_content) - {SEARCH_SNIPPET_BEFORE}, 1),
+                     {SEARCH_SNIPPET_LENGTH}) AS snippet,
+           MATCH(e.title, e.topic) AGAINST (%(query)s IN BOOLEAN MODE) * %(weight)s
+             + COALESCE(MATCH(c.original_content) AGAINST (%(query)s IN BOOLEAN MODE), 0) AS relevance
+    FROM essays e LEFT JOIN essay_contents c ON c.essay_id = e.id
+    WHERE e.username = %(username)s
+      AND (MATCH(e.title, e.topic) AGAINST (%(query)s IN BOOLEAN MODE)
+           OR MATCH(c.original_content) AGAINST (%(query)s IN BOOLEAN MODE))
+    ORDER BY relevance DESC, e.timestamp DESC, e.id DESC
+    LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+def build_search_query(text):
+    """
+    把用户输入转换为全文检索的 BOOLEAN MODE 查询，返回 (查询串, 搜索词列表)。
+    空格分隔的每个词都必须出现 (按短语匹配，「汶川地震」不会匹配到只含「地震」的作文)；
+    去掉用户输入中的布尔运算符，没有有效搜索词时抛出 ValueError。
+    """
+    terms = _BOOLEAN_OPERATORS_RE.sub(' ', text or '').split()[:SEARCH_MAX_TERMS]
+    if not terms:
+        raise ValueError("缺少搜索关键词")
+    query = ' '.join(f'+{term}*' if len(term) < NGRAM_TOKEN_SIZE else f'+"{term}"' for term in terms)
+    return query, terms
+
+@api.route('/api/v1/history/<username>/search', methods=['GET'])
+@require_auth
+def search_history(username):
+    """
+    在用户的作文中按标题、题目和正文搜索：?q=关键词 (空格分隔多个词，需全部出现)。
+    按相关度排序，返回 {"items": [{id, title, timestamp, snippet, relevance}], "nextOffset": ...}；
+    用 limit / offset 翻页，nextOffset 为 null 表示没有更多结果。
+    """
+    metrics.start_request('search_history')
+    try:
+        request_username(username)
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    try:
+        query, terms = build_search_query(request.args.get('q'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', SEARCH_PAGE_SIZE)), 1), SEARCH_MAX_PAGE_SIZE)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except (ValueError, TypeError):
+        return jsonify({"error": "分页参数无效"}), 400
+    if offset > SEARCH_MAX_OFFSET:
+        return jsonify({"error": f"最多翻到第 {SEARCH_MAX_OFFSET} 条结果，请缩小搜索范围"}), 400
+
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({"error": "数据库连接失败"}), 500
+    cursor = conn.cursor(dictionary=True)
+    try:
+        with track('db_query'):
+            # 多取一条用于判断是否还有下一页
+            cursor.execute(SEARCH_SQL, {'first': terms[0], 'query': query, 'weight': SEARCH_TITLE_WEIGHT,
+                                        'username': username, 'limit': limit + 1, 'offset': offset})
+            rows = cursor.fetchall()
+    except mysql.connector.Error as e:
+        current_app.logger.error(f"Essay search failed: {e}")
+        return jsonify({"error": "作文搜索失败"}), 500
+    finally:
+        if conn.is_connected():
+            conn.close()
+
+    next_offset = offset + limit if len(rows) > limit else None
+    items = rows[:limit]
+    for item in items:
+        item['relevance'] = round(float(item['relevance'] or 0), 4)
+    logger.info("search_history", extra={'fields': {'terms': len(terms), 'results': len(items), 'offset': offset}})
+    return jsonify({"items": items, "nextOffset": next_offset})
+
+# 详情接口可选字段（前端 camelCase 名称）-> SQL 表达式
+# 新作文的正文存放在 essay_contents 表；旧数据仍在 essays 表中，用 COALESCE 兼容
+ESSAY_DETAIL_FIELDS = {
+    'id': 'e.id',
+    'topic': 'e.topic',
+    'title': 'e.title',
+    'score': 'e.score',
+    'feedback': 'e.feedback',
+    'timestamp': 'e.timestamp',
+    'originalContent': 'COALESCE(c.original_content, e.original_content)',
+    'revisedContent': 'COALESCE(c.revised_content, e.revised_content)',
+}
+ESSAY_BODY_FIELDS = {'originalContent', 'revisedContent'}
+ESSAY_FIELD_ALIASES = {'original_content': 'originalContent', 'revised_content': 'revisedContent'}
+
+def _analytics_request(username):
+    """统计接口的公共校验，返回错误响应或 None。"""
+    try:
+        request_username(username)
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    return None
+
+def _score_stats(essays, score_sum, score_min, score_max):
+    return {"essays": int(essays), "average": round(int(score_sum) / essays, 1) if essays else None,
+            "min": score_min, "max": score_max}
+
+@api.route('/api/v1/analytics/<username>/trend', methods=['GET'])
+@require_auth
+def score_trend(username):
+    """
+    分数趋势：最近 days 天 (默认 90) 按 granularity (day / week / month，默认 day) 汇总的篇数与平均 / 最低 / 最高分。
+    读取 user_score_daily，行数只与天数有关，与作文总数无关。
+    """
+    metrics.start_request('score_trend')
+    error = _analytics_request(username)
+    if error:
+        return error
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in ('day', 'week', 'month'):
+        return jsonify({"error": "granularity 只能是 day、week 或 month"}), 400
+    try:
+        days = min(max(int(request.args.get('days', 90)), 1), ANALYTICS_MAX_DAYS)
+    except ValueError:
+        return jsonify({"error": "days 参数无效"}), 400
+    today = new_aggregates().day(int(time.time() * 1000))
+    since = today - timedelta(days=days - 1)
+
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({"error": "数据库连接失败"}), 500
+    cursor = conn.cursor()
+    try:
+        with track('db_query'):
+            cursor.execute(
+                """
+                SELECT day, essays, score_sum, score_min, score_max FROM user_score_daily
+                WHERE username = %s AND day >= %s ORDER BY day
+                """,
+                (username, since)
+            )
+            rows = cursor.fetchall()
+    except mysql.connector.Error as e:
+        current_app.logger.error(f"Score trend query failed: {e}")
+        return jsonify({"error": "统计查询失败"}), 500
+    finally:
+        if conn.is_connected():
+            conn.close()
 
+    periods = {}
+    for day, essays, score_sum, score_min, score_max in rows:
+        key = analytics.start_of_period(day, granularity)
+        period = periods.setdefault(key, [0, 0, score_min, score_max])
+        period[0] += essays
+        period[1] += int(score_sum)
+        period[2] = min(period[2], score_min)
+        period[3] = max(period[3], score_max)
+    points = [dict(date=key.isoformat(), **_score_stats(*values)) for key, values in periods.items()]
+    return jsonify({"granularity": granularity, "since": since.isoformat(), "points": points})
 
-@app.route('/api/v1/score', methods=['POST'])
-def score_essay():
+@api.route('/api/v1/analytics/<username>/topics', methods=['GET'])
+@require_auth
+def topic_stats(username):
     """
-    API 1: 提交作文，进行评分和保存。
+    各题目的篇数、平均 / 最低 / 最高分与分数段分布 (按篇数从多到少，最多 ANALYTICS_MAX_TOPICS 个)，
+    以及全部作文的汇总 (overall)。读取 user_topic_stats / user_score_buckets。
     """
-    data = request.get_json()
-    topic = data.get('topic')
-    title = data.get('title', '无标题作文')
-    content = data.get('content')
-    
-    if not topic or not content:
-        return jsonify({"error": "缺少作文题目描述或内容"}), 400
-
-    # 1. AI 评分
-    try:
-        score, feedback, revised_content = ai_score_and_refine(topic, content)
-    except Exception as e:
-        app.logger.error(f"AI scoring failed: {e}")
-        return jsonify({"error": "评分服务调用失败"}), 500
+    metrics.start_request('topic_stats')
+    error = _analytics_request(username)
+    if error:
+        return error
 
-    # 2. 存入数据库
-    essay_id = str(uuid4())
-    timestamp = int(time.time() * 1000)
-    username = data.get('username')
     conn = get_db_connection()
     if conn is None:
         return jsonify({"error": "数据库连接失败"}), 500
-
     cursor = conn.cursor()
     try:
-        # MySQL 中可以直接存储 JSON 对象，但为了兼容性，我们仍将 Python 列表转为 JSON 字符串
-        feedback_json = json.dumps(feedback, ensure_ascii=False)
-        
-        # 使用 %s 作为 MySQL 的参数占位符
-        cursor.execute(
-            """
-            INSERT INTO essays (id, username, topic, title, original_content, score, feedback, revised_content, timestamp)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (essay_id, username, topic, title, content, score, feedback_json, revised_content, timestamp)
-        )
-        conn.commit()
+        with track('db_query'):
+            cursor.execute(
+                """
+                SELECT topic_hash, topic, essays, score_sum, score_min, score_max, last_timestamp
+                FROM user_topic_stats WHERE username = %s
+                """,
+                (username,)
+            )
+            topic_rows = cursor.fetchall()
+            cursor.execute("SELECT topic_hash, bucket, essays FROM user_score_buckets WHERE username = %s",
+                           (username,))
+            bucket_rows = cursor.fetchall()
     except mysql.connector.Error as e:
-        app.logger.error(f"Database save failed: {e}")
-        return jsonify({"error": f"数据保存失败: {e}"}), 500
+        current_app.logger.error(f"Topic stats query failed: {e}")
+        return jsonify({"error": "统计查询失败"}), 500
     finally:
         if conn.is_connected():
             conn.close()
 
-    # 3. 返回结果给前端
-    return jsonify({
-        "id": essay_id,
-        "topic": topic,
-        "title": title,
-        "originalContent": content,
-        "score": score,
-        "feedback": feedback, # 返回时仍使用 Python 对象
-        "revisedContent": revised_content,
-        "timestamp": timestamp
-    })
+    distributions = {}
+    overall_distribution = {}
+    for digest, bucket, essays in sorted(bucket_rows, key=lambda row: row[1]):
+        label = analytics.bucket_label(bucket, ANALYTICS_SCORE_BUCKET)
+        distributions.setdefault(digest, {})[label] = essays
+        overall_distribution[label] = overall_distribution.get(label, 0) + essays
+    topics = []
+    for digest, topic, essays, score_sum, score_min, score_max, last_timestamp in topic_rows:
+        topics.append(dict(topic=topic, lastTimestamp=last_timestamp,
+                           distribution=distributions.get(digest, {}),
+                           **_score_stats(essays, score_sum, score_min, score_max)))
+    topics.sort(key=lambda item: (item['essays'], item['lastTimestamp']), reverse=True)
+    overall = _score_stats(sum(r[2] for r in topic_rows), sum(int(r[3]) for r in topic_rows),
+                           min((r[4] for r in topic_rows), default=None),
+                           max((r[5] for r in topic_rows), default=None))
+    overall['distribution'] = overall_distribution
+    return jsonify({"overall": overall, "topics": topics[:ANALYTICS_MAX_TOPICS], "totalTopics": len(topics)})
 
-@app.route('/api/v1/history/<username>', methods=['GET'])
-def get_history(username):
+@api.route('/api/v1/analytics/<username>/feedback', methods=['GET'])
+@require_auth
+def feedback_stats(username):
     """
-    API 2: 获取历史作文列表 (侧边栏用)。
+    反馈分类统计：各类反馈 (优点 / 不足 / 建议) 中各分类 (结构、语言表达等，见 analytics.FEEDBACK_CATEGORIES)
+    出现的篇数，按篇数从多到少排列。读取 user_feedback_categories。
     """
+    metrics.start_request('feedback_stats')
+    error = _analytics_request(username)
+    if error:
+        return error
+
     conn = get_db_connection()
     if conn is None:
         return jsonify({"error": "数据库连接失败"}), 500
-        
-    cursor = conn.cursor(dictionary=True) # 使用 dictionary=True 让结果以字典形式返回
-    
+    cursor = conn.cursor()
     try:
-        # 获取列表所需的字段，按时间倒序
-        cursor.execute(
-            "SELECT id, title, timestamp FROM essays WHERE username = %s ORDER BY timestamp DESC",
-            (username,)
-        )
-        history_data = cursor.fetchall()
+        with track('db_query'):
+            cursor.execute(
+                "SELECT feedback_type, category, essays FROM user_feedback_categories WHERE username = %s",
+                (username,)
+            )
+            rows = cursor.fetchall()
     except mysql.connector.Error as e:
-        app.logger.error(f"Database query failed: {e}")
-        return jsonify({"error": "历史数据查询失败"}), 500
+        current_app.logger.error(f"Feedback stats query failed: {e}")
+        return jsonify({"error": "统计查询失败"}), 500
     finally:
         if conn.is_connected():
             conn.close()
-    
-    return jsonify(history_data)
 
-@app.route('/api/v1/essay/<essay_id>', methods=['GET'])
-def get_essay_detail(essay_id):
+    by_type = {}
+    for feedback_type, category, essays in sorted(rows, key=lambda row: row[2], reverse=True):
+        by_type.setdefault(feedback_type, []).append({"category": category, "essays": essays})
+    return jsonify({"types": by_type})
+
+def parse_essay_fields(fields_param):
     """
-    API 3: 根据 ID 获取单篇作文详情 (结果页用)。
+    解析 ?fields= 参数，返回字段名列表（总是包含 id）；参数为空时返回全部字段。
+    """
+    if not fields_param:
+        return list(ESSAY_DETAIL_FIELDS)
+    fields = ['id']
+    for name in fields_param.split(','):
+        name = ESSAY_FIELD_ALIASES.get(name.strip(), name.strip())
+        if not name or name in fields:
+            continue
+        if name not in ESSAY_DETAIL_FIELDS:
+            raise ValueError(f"不支持的字段: {name}")
+        fields.append(name)
+    return fields
+
+def parse_revised_format(value):
     """
+    解析 revised 参数：text 返回润色全文 (revisedContent)，diff 返回相对原文的编辑脚本 (revisedDiff)。
+    """
+    revised_format = (value or 'text').strip().lower()
+    if revised_format not in ('text', 'diff'):
+        raise ValueError(f"不支持的 revised 参数: {revised_format}，可选 text, diff")
+    return revised_format
+
+def as_revised_diff(essay, stored_diff=None):
+    """
+    把作文字典中的 revisedContent 换成 revisedDiff；前端用原文加编辑脚本即可还原全文并高亮修改处。
+    """
+    revised_content = essay.pop('revisedContent', None)
+    if stored_diff:
+        essay['revisedDiff'] = essay_diff.loads(stored_diff)
+    elif revised_content is not None:
+        essay['revisedDiff'] = essay_diff.encode(essay['originalContent'], revised_content)
+    else:
+        essay['revisedDiff'] = None
+    return essay
+
+def fetch_essay(essay_id, fields=None, revised_format='text', owner=None):
+    """
+    读取单篇作文，返回 camelCase 键名的字典，不存在 (或指定了 owner 而作文不属于该用户) 时返回 None。
+    只有请求了正文字段时才关联 essay_contents 表；只存了编辑脚本的润色全文在这里还原，
+    revised_format='diff' 时改为返回 revisedDiff。
+    数据库不可用时抛出 RuntimeError，查询失败时抛出 mysql.connector.Error。
+    """
+    fields = fields or list(ESSAY_DETAIL_FIELDS)
+    wants_revised = 'revisedContent' in fields
+    # 还原或计算编辑脚本都需要原文
+    selected = fields + ['originalContent'] if wants_revised and 'originalContent' not in fields else fields
+    columns = ", ".join(f"{ESSAY_DETAIL_FIELDS[name]} AS `{name}`" for name in selected)
+    if wants_revised:
+        columns += ", c.revised_diff AS `storedDiff`"
+    sql = f"SELECT {columns} FROM essays e"
+    if ESSAY_BODY_FIELDS.intersection(fields):
+        sql += " LEFT JOIN essay_contents c ON c.essay_id = e.id"
+    sql += " WHERE e.id = %s"
+    params = [essay_id]
+    if owner is not None:
+        sql += " AND e.username = %s"
+        params.append(owner)
+
     conn = get_db_connection()
     if conn is None:
-        return jsonify({"error": "数据库连接失败"}), 500
+        raise RuntimeError("数据库连接失败")
 
     cursor = conn.cursor(dictionary=True) # 使用 dictionary=True 让结果以字典形式返回
+    try:
+        with track('db_query'):
+            cursor.execute(sql, tuple(params))
+            essay = cursor.fetchone()
+    finally:
+        if conn.is_connected():
+            conn.close()
+
+    # 确保将数据库中的 JSON 字符串反序列化为 Python 对象，以便前端处理
+    if essay and essay.get('feedback'):
+        try:
+            essay['feedback'] = json.loads(essay['feedback'])
+        except (json.JSONDecodeError, TypeError):
+            essay['feedback'] = [] # 如果解析失败，返回空列表
+    if essay and wants_revised:
+        stored_diff = essay.pop('storedDiff')
+        if revised_format == 'diff':
+            as_revised_diff(essay, stored_diff)
+        elif essay['revisedContent'] is None and stored_diff:
+            essay['revisedContent'] = essay_diff.apply(essay['originalContent'], essay_diff.loads(stored_diff))
+        if 'originalContent' not in fields:
+            del essay['originalContent']
+    return essay
 
+@api.route('/api/v1/essay/<essay_id>', methods=['GET'])
+@require_auth
+def get_essay_detail(essay_id):
+    """
+    API 3: 根据 ID 获取单篇作文详情 (结果页用)。
+    可用 ?fields=score,feedback 只取部分字段；未请求正文字段时不会读取 essay_contents。
+    ?revised=diff 时以 revisedDiff (相对原文的编辑脚本) 代替 revisedContent。
+    只返回令牌用户自己的作文，其他用户的作文按未找到处理。
+    """
+    metrics.start_request('get_essay_detail')
     try:
-        cursor.execute(
-            "SELECT id, topic, title, original_content, score, feedback, revised_content, timestamp FROM essays WHERE id = %s",
-            (essay_id,)
-        )
-        essay = cursor.fetchone()
+        fields = parse_essay_fields(request.args.get('fields'))
+        revised_format = parse_revised_format(request.args.get('revised'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    variant = _short_hash(','.join(fields), revised_format)[:8]
+    # 评分后的作文不再变化，客户端持有的 ETag 只需确认作文仍存在且属于当前用户 (按主键查 essays，不读正文)；
+    # 唯一的例外是尚未润色 (n) 的作文之后可能通过 rewrite 补上润色全文，需要完整查询
+    sent = next((sent for tag, sent in request_etags().items()
+                 if _etag_still_valid(tag, essay_id, variant)), None)
+    try:
+        if sent is not None:
+            if fetch_essay(essay_id, ['id'], owner=g.username):
+                return not_modified(sent)
+            return jsonify({"error": "作文未找到"}), 404
+        essay = fetch_essay(essay_id, fields, revised_format, owner=g.username)
+    except RuntimeError:
+        return jsonify({"error": "数据库连接失败"}), 500
     except mysql.connector.Error as e:
-        app.logger.error(f"Database query failed: {e}")
+        current_app.logger.error(f"Database query failed: {e}")
         return jsonify({"error": "作文详情查询失败"}), 500
+
+    if essay:
+        return cacheable_json(essay, essay_etag(essay, fields, variant))
+
+    return jsonify({"error": "作文未找到"}), 404
+
+def _etag_still_valid(tag, essay_id, variant):
+    parts = tag.split('.')
+    return len(parts) == 4 and parts[0] == essay_id and parts[3] == variant and parts[2] != 'n'
+
+def essay_etag(essay, fields, variant):
+    """
+    作文详情的强 ETag：作文 id + 评分时间 + 是否已有润色全文 + 请求的字段组合。
+    """
+    if 'revisedContent' not in fields:
+        revision = '-'
+    else:
+        revision = 'r' if essay.get('revisedContent') is not None or essay.get('revisedDiff') is not None else 'n'
+    return f"{essay['id']}.{essay.get('timestamp', '-')}.{revision}.{variant}"
+
+# 旧数据没有 essay_contents 行时，连同 essays 表中的原文一起写入
+REVISED_CONTENT_UPSERT_SQL = """
+    INSERT INTO essay_contents (essay_id, original_content, revised_content, revised_diff)
+    SELECT id, original_content, %s, %s FROM essays WHERE id = %s
+    ON DUPLICATE KEY UPDATE revised_content = VALUES(revised_content), revised_diff = VALUES(revised_diff)
+"""
+
+def save_revised_content(essay_id, original_content, revised_content):
+    """
+    写回按需生成的润色全文。
+    数据库不可用时抛出 RuntimeError，写入失败时抛出 mysql.connector.Error。
+    """
+    conn = get_db_connection()
+    if conn is None:
+        raise RuntimeError("数据库连接失败")
+    try:
+        cursor = conn.cursor()
+        with track('db_query'):
+            cursor.execute(REVISED_CONTENT_UPSERT_SQL,
+                           (*pack_revised_content(original_content, revised_content), essay_id))
+            conn.commit()
     finally:
         if conn.is_connected():
             conn.close()
 
-    if essay:
-        # 确保将数据库中的 JSON 字符串反序列化为 Python 对象，以便前端处理
-        if essay.get('feedback'):
-             try:
-                essay['feedback'] = json.loads(essay['feedback'])
-             except (json.JSONDecodeError, TypeError):
-                 essay['feedback'] = [] # 如果解析失败，返回空列表
-        
-        # 确保键名与前端使用的 camelCase 保持一致
-        response_essay = {
-            "id": essay['id'],
-            "topic": essay['topic'],
-            "title": essay['title'],
-            "originalContent": essay['original_content'],
-            "score": essay['score'],
-            "feedback": essay['feedback'],
-            "revisedContent": essay['revised_content'],
-            "timestamp": essay['timestamp']
-        }
-        return jsonify(response_essay)
-    
-    return jsonify({"error": "作文未找到"}), 404
-@app.route('/api/v1/register', methods=['POST'])
+@api.route('/api/v1/essay/<essay_id>/rewrite', methods=['POST'])
+@require_auth
+def rewrite_essay(essay_id):
+    """
+    为以 score / feedback 模式评分的作文按需生成润色全文，并写回 revised_content。
+    已有润色结果时直接返回、不会重新生成：作文一经写入润色全文即不再变化，详情接口的 ETag 依赖这一点。
+    """
+    timer = metrics.start_request('rewrite_essay')
+    try:
+        essay = fetch_essay(essay_id, ['id', 'topic', 'originalContent', 'revisedContent'], owner=g.username)
+    except RuntimeError:
+        return jsonify({"error": "数据库连接失败"}), 500
+    except mysql.connector.Error as e:
+        current_app.logger.error(f"Database query failed: {e}")
+        return jsonify({"error": "作文详情查询失败"}), 500
+    if not essay:
+        return jsonify({"error": "作文未找到"}), 404
+    if essay['revisedContent']:
+        return jsonify({"id": essay_id, "revisedContent": essay['revisedContent']})
+
+    try:
+        revised_content = ai_rewrite(essay['topic'], essay['originalContent'])
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        current_app.logger.error(f"AI rewrite failed: {e}", extra={'fields': timer.fields()})
+        return jsonify({"error": "润色服务调用失败"}), 500
+
+    try:
+        save_revised_content(essay_id, essay['originalContent'], revised_content)
+    except RuntimeError:
+        return jsonify({"error": "数据库连接失败"}), 500
+    except mysql.connector.Error as e:
+        current_app.logger.error(f"Database save failed: {e}", extra={'fields': timer.fields()})
+        return jsonify({"error": f"数据保存失败: {e}"}), 500
+
+    logger.info("rewrite_essay", extra={'fields': timer.fields(essay_id=essay_id)})
+    return jsonify({"id": essay_id, "revisedContent": revised_content})
+
+@api.route('/api/v1/admin/essay/<essay_id>/similar', methods=['GET'])
+@require_admin
+def admin_similar_essays(essay_id):
+    """
+    管理接口：查询与指定作文相似的已有作文，包括其他用户的作文及其作者 (见 find_similar_essays)。
+    """
+    metrics.start_request('admin_similar_essays')
+    try:
+        essay = fetch_essay(essay_id, ['id', 'topic', 'originalContent'])
+    except RuntimeError:
+        return jsonify({"error": "数据库连接失败"}), 500
+    except mysql.connector.Error as e:
+        current_app.logger.error(f"Database query failed: {e}")
+        return jsonify({"error": "作文详情查询失败"}), 500
+    if not essay:
+        return jsonify({"error": "作文未找到"}), 404
+
+    similar = find_similar_essays(essay['topic'], essay['originalContent'], exclude_id=essay_id)
+    if similar is None:
+        return jsonify({"error": "相似作文查询失败"}), 500
+    return jsonify({"id": essay_id, "similarEssays": similar})
+
+@api.route('/api/v1/register', methods=['POST'])
 def register_user():
     """
     API 4: 用户注册接口。
@@ -337,6 +2107,14 @@ def register_user():
     if len(username) < 3 or len(password) < 6:
         return jsonify({"message": "用户名和密码必须满足最低长度要求"}), 400
 
+    # --- 密码哈希化 ---
+    # 在取数据库连接之前计算，避免哈希的几百毫秒里占着连接池
+    try:
+        with track('password_hash'):
+            hashed_password = password_hasher.hash(password)
+    except HasherBusy as e:
+        return jsonify({"message": str(e)}), 503, {'Retry-After': '1'}
+
     conn = get_db_connection()
     if conn is None:
         return jsonify({"message": "服务器数据库连接失败"}), 500
@@ -351,17 +2129,13 @@ def register_user():
             # HTTP 409 Conflict，前端捕获此信息
             return jsonify({"message": f"用户 '{username}' 已存在，请直接登录。"}), 409
 
-        # --- 3. 密码哈希化 ---
-        # 使用 generate_password_hash 安全地哈希密码
-        hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
-
-        # --- 4. 插入新用户 ---
+        # --- 3. 插入新用户 ---
         sql = "INSERT INTO users (username, password_hash) VALUES (%s, %s)"
         cursor.execute(sql, (username, hashed_password))
         
         conn.commit()
         
-        # --- 5. 注册成功响应 ---
+        # --- 4. 注册成功响应 ---
         # 返回 201 Created 状态码，通知前端操作成功
         return jsonify({
             "message": "注册成功",
@@ -369,7 +2143,7 @@ def register_user():
         }), 201
 
     except mysql.connector.Error as e:
-        app.logger.error(f"Database error during registration: {e}")
+        current_app.logger.error(f"Database error during registration: {e}")
         conn.rollback()
         # HTTP 500 Internal Server Error
         return jsonify({"message": "注册过程中发生数据库错误"}), 500
@@ -379,11 +2153,14 @@ def register_user():
         if conn and conn.is_connected():
             cursor.close()
             conn.close()
-@app.route('/api/v1/login', methods=['POST'])
+@api.route('/api/v1/login', methods=['POST'])
 def login_user():
     """
     API 5: 用户登录接口。
+    成功时返回访问令牌 access_token (expires_in 秒后过期) 和刷新令牌 refresh_token，
+    之后的请求以 Authorization: Bearer <access_token> 发送，过期后调用 /api/v1/token/refresh 换取新令牌。
     """
+    metrics.start_request('login_user')
     data = request.get_json()
     username = data.get('username')
     password = data.get('password')
@@ -400,47 +2177,238 @@ def login_user():
     try:
         # --- 1. 查询用户及哈希密码 ---
         # 字段名为 password_hash
-        cursor.execute("SELECT username, password_hash FROM users WHERE username = %s", (username,))
-        user_record = cursor.fetchone()
-        
-        if user_record is None:
-            # 用户名不存在
-            # 返回 401 Unauthorized，并给出模糊的错误信息以提高安全性
-            return jsonify({"message": "用户名或密码错误。"}), 401
-
-        stored_hash = user_record['password_hash']
-
-        # --- 2. 验证密码 ---
-        # 使用 check_password_hash 验证用户输入的密码是否与存储的哈希匹配
-        if not check_password_hash(stored_hash, password):
-            # 密码不匹配
-            return jsonify({"message": "用户名或密码错误。"}), 401
-
-        # --- 3. 登录成功，生成 token ---
-        # 简单地使用 UUID 作为模拟的 access_token
-        access_token = str(uuid4())
-        
-        # **注意：在生产环境，这里应该使用 JWT (Flask-JWT-Extended) 来生成和管理 token。**
-
-        # --- 4. 返回成功响应 ---
-        return jsonify({
-            "access_token": access_token,
-            # 前端期望 user 对象，这里只返回 username
-            "user": {
-                "username": user_record['username'] 
-            },
-            "message": "登录成功"
-        }), 200
-
+        with track('db_query'):
+            cursor.execute("SELECT username, password_hash FROM users WHERE username = %s", (username,))
+            user_record = cursor.fetchone()
     except mysql.connector.Error as e:
-        app.logger.error(f"Database error during login: {e}")
+        current_app.logger.error(f"Database error during login: {e}")
         return jsonify({"message": "登录过程中发生数据库错误"}), 500
-        
     finally:
+        # 校验密码前就归还连接，哈希计算期间不占用连接池
         if conn and conn.is_connected():
             cursor.close()
             conn.close()
 
+    if user_record is None:
+        # 用户名不存在
+        # 返回 401 Unauthorized，并给出模糊的错误信息以提高安全性
+        return jsonify({"message": "用户名或密码错误。"}), 401
+
+    # --- 2. 验证密码 ---
+    # check_password_hash 在密码哈希线程池中执行
+    try:
+        with track('password_hash'):
+            matched = password_hasher.check(user_record['password_hash'], password)
+    except HasherBusy as e:
+        return jsonify({"message": str(e)}), 503, {'Retry-After': '1'}
+    if not matched:
+        # 密码不匹配
+        return jsonify({"message": "用户名或密码错误。"}), 401
+
+    # --- 3. 登录成功，签发令牌并返回 ---
+    tokens = token_signer.issue_pair(user_record['username'])
+    return jsonify({
+        **tokens,
+        # 前端期望 user 对象，这里只返回 username
+        "user": {
+            "username": user_record['username']
+        },
+        "message": "登录成功"
+    }), 200
+
+@api.route('/api/v1/token/refresh', methods=['POST'])
+def refresh_token():
+    """
+    用刷新令牌换取新的访问令牌 (同时轮换刷新令牌)，只校验签名与有效期，不查数据库。
+    刷新令牌放在请求体 {"refresh_token": ...} 或 Authorization: Bearer 请求头中。
+    """
+    data = request.get_json(silent=True) or {}
+    token = data.get('refresh_token') or bearer_token(request.headers.get('Authorization'))
+    if not token:
+        return auth_error("缺少刷新令牌", invalid=False)
+    try:
+        claims = token_signer.verify(token, kind='refresh')
+    except InvalidToken as e:
+        return auth_error(str(e))
+    return jsonify(token_signer.issue_pair(claims['sub']))
+
+@api.route('/api/v1/db/pool', methods=['GET'])
+def db_pool_stats():
+    """
+    连接池统计（当前 worker 进程）：使用中/空闲连接数、等待次数与等待耗时。
+    """
+    return jsonify(db_pool.stats())
+
+
+@api.route('/api/v1/essays/write-behind/stats', methods=['GET'])
+def essay_write_stats():
+    """
+    评分结果写后缓冲统计（当前 worker 进程）：缓冲深度、批量写入次数与耗时、溢写与回放条数。
+    """
+    return jsonify(essay_writer.stats())
+
+
+@api.cli.command('migrate')
+def migrate_command():
+    """
+    flask --app app migrate：创建 / 升级表结构。部署时执行一次，可重复执行；失败时以非零状态退出。
+    """
+    try:
+        init_db()
+    except Exception as e:
+        raise click.ClickException(f"Database migration failed: {e}")
+    print("Database migration finished.")
+
+
+@api.cli.command('backfill-contents')
+def backfill_contents_command():
+    """
+    flask --app app backfill-contents：把旧作文正文搬到 essay_contents 表。
+    """
+    moved = backfill_essay_contents()
+    print(f"Backfill finished, {moved} essays moved.")
+
+def compact_revised_contents(batch_size=500):
+    """
+    把 essay_contents 中已存全文的润色结果分批改存为编辑脚本 (满足 REVISED_DIFF_MAX_RATIO 的行)，
+    每批单独提交。返回改存的行数。
+    """
+    compacted = 0
+    last_id = ''
+    while True:
+        conn = get_db_connection()
+        if conn is None:
+            raise RuntimeError("数据库连接失败")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT essay_id, original_content, revised_content FROM essay_contents
+                WHERE essay_id > %s AND revised_content IS NOT NULL AND revised_diff IS NULL
+                ORDER BY essay_id LIMIT %s
+                """,
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return compacted
+            last_id = rows[-1][0]
+            updates = []
+            for essay_id, original_content, revised_content in rows:
+                _, revised_diff = pack_revised_content(original_content, revised_content)
+                if revised_diff is not None:
+                    updates.append((revised_diff, essay_id))
+            if updates:
+                cursor.executemany(
+                    "UPDATE essay_contents SET revised_content = NULL, revised_diff = %s WHERE essay_id = %s",
+                    updates
+                )
+                conn.commit()
+            compacted += len(updates)
+        finally:
+            conn.close()
+
+@api.cli.command('compact-revised')
+def compact_revised_command():
+    """
+    flask --app app compact-revised：把已有作文的润色全文改存为编辑脚本。
+    """
+    compacted = compact_revised_contents()
+    print(f"Compaction finished, {compacted} revised essays stored as diffs.")
+
+@api.cli.command('rebuild-analytics')
+@click.option('--check', is_flag=True, help='只比较统计表与从头计算的结果，不修改；不一致时以非零状态退出')
+@click.option('--batch-size', default=5000, show_default=True, help='每批读取的作文数')
+def rebuild_analytics_command(check, batch_size):
+    """
+    flask --app app rebuild-analytics：从 essays 表从头计算成绩统计并替换统计表。
+    加 --check 时只做一致性检查 (在一致性快照中比较，可在线执行)；重建应在暂停写入时执行。
+    """
+    conn = get_db_connection()
+    if conn is None:
+        raise click.ClickException("数据库连接失败")
+    day_offset = int(ANALYTICS_UTC_OFFSET_HOURS * 3600)
+    try:
+        cursor = conn.cursor()
+        if check:
+            mismatches = analytics.check(cursor, day_offset, ANALYTICS_SCORE_BUCKET, batch_size)
+            for table, rows in mismatches.items():
+                print(f"{table}: {len(rows)} mismatched rows")
+                for key, stored, expected in rows[:10]:
+                    print(f"  {key}: stored={stored} expected={expected}")
+            if mismatches:
+                raise click.ClickException("Analytics tables are inconsistent, run rebuild-analytics to fix.")
+            print("Analytics tables are consistent.")
+            return
+        counted = analytics.rebuild(cursor, day_offset, ANALYTICS_SCORE_BUCKET, batch_size)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Rebuild finished, {counted} essays aggregated.")
+
+def rebuild_similarity_index(batch_size=500):
+    """
+    清空 essay_minhash / essay_lsh 后按作文 id 分批重新计算签名并写入，每批单独提交。返回写入的作文数。
+    用于首次启用相似度检测时为已有作文建索引，以及修改 SIMILARITY_NUM_PERM 等参数之后；
+    执行期间相似作文查询的结果不完整，应在低峰期执行。
+    """
+    conn = get_db_connection()
+    if conn is None:
+        raise RuntimeError("数据库连接失败")
+    try:
+        cursor = conn.cursor()
+        cursor.execute("TRUNCATE TABLE essay_lsh")
+        cursor.execute("TRUNCATE TABLE essay_minhash")
+    finally:
+        conn.close()
+
+    indexed = 0
+    last_id = ''
+    while True:
+        conn = get_db_connection()
+        if conn is None:
+            raise RuntimeError("数据库连接失败")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT e.id, e.topic, COALESCE(c.original_content, e.original_content)
+                FROM essays e LEFT JOIN essay_contents c ON c.essay_id = e.id
+                WHERE e.id > %s ORDER BY e.id LIMIT %s
+                """,
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return indexed
+            last_id = rows[-1][0]
+            minhash_rows = []
+            lsh_rows = []
+            for essay_id, topic, content in rows:
+                index_rows = similarity_index_rows(essay_id, topic, content)
+                if index_rows:
+                    minhash_rows.append(index_rows[0])
+                    lsh_rows.extend(index_rows[1])
+            if minhash_rows:
+                cursor.executemany(ESSAY_MINHASH_INSERT_SQL, minhash_rows)
+                cursor.executemany(ESSAY_LSH_INSERT_SQL, lsh_rows)
+                conn.commit()
+            indexed += len(minhash_rows)
+            logger.info(f"Indexed {indexed} essays for similarity search")
+        finally:
+            conn.close()
+
+@api.cli.command('rebuild-similarity')
+@click.option('--batch-size', default=500, show_default=True, help='每批处理的作文数')
+def rebuild_similarity_command(batch_size):
+    """
+    flask --app app rebuild-similarity：重建近似重复检测索引。
+    """
+    if not SIMILARITY_ENABLED:
+        raise click.ClickException("SIMILARITY_ENABLED is off, nothing to rebuild.")
+    indexed = rebuild_similarity_index(batch_size)
+    print(f"Rebuild finished, {indexed} essays indexed.")
+
 
 # 配置允许的文本和图片扩展名
 ALLOWED_TEXT_EXTENSIONS = {'txt'}
@@ -450,102 +2418,245 @@ def allowed_file(filename, extensions):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in extensions
 
-def classify_left_baselines_by_index(left_coords, tolerance):
+class OCRError(Exception):
+    """百度 OCR 调用失败或返回错误码，异常信息可直接展示给用户。"""
+
+# 多页 OCR：单次请求最多页数、并发调用百度 OCR 的线程数
+OCR_MAX_PAGES = int(os.getenv('OCR_MAX_PAGES', '10'))
+OCR_MAX_WORKERS = int(os.getenv('OCR_MAX_WORKERS', '4'))
+# OCR 会话的 HTTP 连接池大小；gthread worker 下单图识别直接在请求线程里调用，应不小于线程数
+OCR_HTTP_POOL_SIZE = int(os.getenv('OCR_HTTP_POOL_SIZE', '64'))
+# 百度 OCR 服务地址，默认为官方地址；压测时指向 bench/stubs.py 启动的桩服务
+OCR_BASE_URL = os.getenv('OCR_BASE_URL', '').rstrip('/')
+ocr_executor = ThreadPoolExecutor(max_workers=OCR_MAX_WORKERS, thread_name_prefix='ocr')
+
+# OCR 结果缓存：按图片字节的 SHA-256 缓存 words_result，重复上传同一张照片时直接返回
+OCR_CACHE_TTL = int(os.getenv('OCR_CACHE_TTL', str(24 * 3600)))
+OCR_CACHE_MAX_ENTRIES = int(os.getenv('OCR_CACHE_MAX_ENTRIES', '512'))
+ocr_cache = ResultCache(ttl=OCR_CACHE_TTL, max_entries=OCR_CACHE_MAX_ENTRIES)
+
+class SharedOcrClient:
     """
-    尝试从 left 坐标中找出两个主要的基线 (标准左边缘和缩进左边缘)。
-    
-    Args:
-        left_coords: 所有识别块的 left 坐标列表。
-        tolerance: 允许坐标值接近的像素容忍度。
-        
-    Returns:
-        Tuple[List[int], List[int]]: (standard_indices, indent_indices) - 
-                                     分别包含属于第一类和第二类的行索引列表。
-    """
-    if not left_coords:
-        return [], []
-    clusters = [[0], []]
-    current_cluster = 0
-    min_lefts  = [left_coords[0],9999999999]
-    #根据这行与上一行之间的left距离来分类，left距离接近，则这行与上一行为同一类,反之为另一类
-    for i in range(1, len(left_coords)):
-        current_coord = left_coords[i]
-        baseline_coord = left_coords[i-1]
-        if abs(current_coord - baseline_coord) <= tolerance:#判断这行与上行的left距离是否接近
-            clusters[current_cluster].append(i)
-            min_lefts [current_cluster] = min(min_lefts[current_cluster],left_coords[i])
-        else:
-            current_cluster = 1 - current_cluster  # 在 0 和 1 之间切换
-            clusters[current_cluster].append(i)
-            min_lefts[current_cluster] = min(min_lefts[current_cluster],left_coords[i])
-    if min_lefts[0] > min_lefts[1]:
-        return clusters[0]
-    else: return clusters[1]
-def recognize_handwriting_text(file):
+    进程内共享的百度 OCR 客户端，复用 access token 和 HTTP 会话。
+    AipOcr 在 token 过期时会在请求线程里刷新 token，并发时可能重复刷新；
+    这里在调用前先在锁内完成 token 检查/刷新，之后各线程只读取已缓存的 token。
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._auth_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'errors': 0, 'latency_ms_total': 0.0, 'latency_ms_max': 0.0}
+
+    def handwriting(self, image, options=None):
+        with self._auth_lock:
+            self._client._auth()
+        start = time.perf_counter()
+        try:
+            result = self._client.handwriting(image, options)
+        except Exception:
+            self._record(start, error=True)
+            raise
+        self._record(start, error='error_code' in result)
+        return result
+
+    def _record(self, start, error):
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats['calls'] += 1
+            self._stats['errors'] += int(error)
+            self._stats['latency_ms_total'] += elapsed
+            self._stats['latency_ms_max'] = max(self._stats['latency_ms_max'], elapsed)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['latency_ms_avg'] = stats['latency_ms_total'] / stats['calls'] if stats['calls'] else 0.0
+        return stats
+
+_ocr_client = None
+_ocr_client_lock = threading.Lock()
+
+def create_ocr_client():
+    # 百度 SDK 与 requests 在第一次识别时才导入
+    import requests
+    from aip import AipOcr
     APP_ID = '121329277'
     API_KEY = os.getenv('OCR_API_KEY')
     SECRET_KEY = os.getenv('OCR_SECRET_KEY')
-    client = AipOcr(APP_ID, API_KEY, SECRET_KEY)
-    image=file.read()
+    ocr_client = AipOcr(APP_ID, API_KEY, SECRET_KEY)
+    # requests 默认每个主机只保留 10 个连接，并发更高时会反复新建连接
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=OCR_HTTP_POOL_SIZE)
+    ocr_client.s.mount('https://', adapter)
+    ocr_client.s.mount('http://', adapter)
+    if OCR_BASE_URL:
+        # AipOcr 的接口地址写死在类属性里，压测时改到本地桩服务
+        ocr_client._AipBase__accessTokenUrl = f"{OCR_BASE_URL}/oauth/2.0/token"
+        ocr_client._AipOcr__handwritingUrl = f"{OCR_BASE_URL}/rest/2.0/ocr/v1/handwriting"
+    return ocr_client
+
+def get_ocr_client():
+    """
+    返回进程内共享的 OCR 客户端，第一次使用时创建。
+    """
+    global _ocr_client
+    if _ocr_client is None:
+        with _ocr_client_lock:
+            if _ocr_client is None:
+                _ocr_client = SharedOcrClient(create_ocr_client())
+    return _ocr_client
+
+# 图片预处理：最长边像素上限与 JPEG 质量，OCR_PREPROCESS=false 时直接上传原图
+OCR_PREPROCESS = os.getenv('OCR_PREPROCESS', 'true').lower() in ('1', 'true', 'yes')
+OCR_IMAGE_MAX_SIDE = int(os.getenv('OCR_IMAGE_MAX_SIDE', '2000'))
+OCR_JPEG_QUALITY = int(os.getenv('OCR_JPEG_QUALITY', '85'))
+image_preprocessor = ImagePreprocessor(max_side=OCR_IMAGE_MAX_SIDE, quality=OCR_JPEG_QUALITY)
+
+def _hash_stream(stream, chunk_size=64 * 1024):
+    """
+    分块计算流内容的 SHA-256，不把整张图片读进内存。
+    """
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def ocr_image(stream, ocr_client=None):
+    """
+    识别一张图片 (可 seek 的二进制流) 并返回 words_result，结果按原图 SHA-256 缓存；
+    未命中缓存时才做预处理并调用 OCR，同一张图片的并发请求只调用一次。
+    识别失败 (OCRError) 不会被缓存。
+    """
+    if ocr_client is None:
+        ocr_client = get_ocr_client()
+    key = _hash_stream(stream)
+
+    def compute():
+        if OCR_PREPROCESS:
+            with track('preprocess'):
+                image = image_preprocessor.process(stream)
+        else:
+            stream.seek(0)
+            image = stream.read()
+        return ocr_words_result(image, ocr_client)
+
+    return ocr_cache.get_or_compute(key, compute)
+
+def ocr_words_result(image, ocr_client):
+    """
+    调用手写识别接口，返回 words_result 列表；失败时抛出 OCRError。
+    ocr_client 只需实现 handwriting(image, options)，离线测试时可注入回放录制结果的桩对象。
+    """
     options={}
     options["detect_direction"] = "true"
     # 调用 API
     try:
-        res_image = client.handwriting(image, options)
+        with track('ocr'):
+            res_image = ocr_client.handwriting(image, options)
     except Exception as e:
         # 错误处理，例如网络错误或认证失败
-        print(f"Baidu OCR API call failed: {e}")
-        return f"OCR API 调用失败: {e}"
+        logger.error(f"Baidu OCR API call failed: {e}")
+        raise OCRError(f"OCR API 调用失败: {e}")
 
     if 'error_code' in res_image:
         error_msg = res_image.get('error_msg', '未知错误')
         error_code = res_image['error_code']
-        print(f"Baidu OCR API Error {error_code}: {error_msg}")
-        return f"OCR 识别失败: {error_msg} (代码: {error_code})"
+        logger.warning(f"Baidu OCR API Error {error_code}: {error_msg}")
+        raise OCRError(f"OCR 识别失败: {error_msg} (代码: {error_code})")
 
     words_results = res_image.get("words_result", [])
-    print(words_results)
-    if not words_results:
-        return "" # 图片中没有识别到任何文字
-
-     # 2. 识别作文的不同自然段
-    structured_lines = []
-    all_heights = []
-    all_lefts = []
-    for item in words_results:
-        if 'location' in item and 'words' in item:
-            left = item['location']['left']
-            height = item['location']['height']
-            top = item['location']['top']
-            structured_lines.append({
-                'words': item['words'],
-                'top': top,
-                'left': left,
-                'height': height
-            })
-            all_heights.append(height)
-            all_lefts.append(left)
-    # 平均行高 (H_avg)
-    H_avg = sum(all_heights) / len(all_heights)
-    # T_indent: 最小有效缩进距离，定义为平均行高的 1.5 倍
-    indent_idx = classify_left_baselines_by_index(all_lefts, 1.5*H_avg)
-    indent_idx_set = set(indent_idx)
-    is_indentation_present = len(indent_idx) > 0
+    log_content(logger, "OCR words_result", words_results)
+    return words_results
+
+def reconstruct_paragraphs(pages):
+    """
+    识别作文的自然段，把多页识别结果按顺序拼接成全文。
+
+    Args:
+        pages: 按页序排列的 words_result 列表。
+
+    段首判断见 paragraphs.segment_pages：逐页估计 (可倾斜的) 左边距，
+    缩进超过一个行高的行为段首；下一页首行没有缩进时与上一页末段相连。
+    """
+    # numpy 只在识别多页作文时才需要，延迟导入
+    from paragraphs import segment_pages
     reconstructed_essay = []
-    for idx, current_line in enumerate(structured_lines):
-        words = current_line['words']
-        print(words)
-        prefix = ""
-        if is_indentation_present and idx in indent_idx_set:
-            prefix = "\n\u3000\u3000"  # 中文段首缩进
+    for words, is_paragraph_start in segment_pages(pages):
+        prefix = "\n\u3000\u3000" if is_paragraph_start else ""  # 中文段首缩进
         reconstructed_essay.append(prefix + words)
     return "".join(reconstructed_essay)
-@app.route('/api/v1/ocr', methods=['POST'])
+
+def recognize_handwriting_text(file, ocr_client=None):
+    """
+    识别单张手写作文图片；失败时返回错误提示文本。
+    """
+    try:
+        words_results = ocr_image(file.stream, ocr_client)
+    except OCRError as e:
+        return str(e)
+    return reconstruct_paragraphs([words_results])
+
+def recognize_handwriting_pages(images, ocr_client=None):
+    """
+    并发识别多页手写作文 (images 为按页序排列的图片流)，按页序跨页重建段落；
+    任一页失败时返回该页的错误提示文本。
+    """
+    # 每页在页面线程里记到各自的 timer 上，取结果时再由请求线程合并，OCR 耗时也计入本次请求
+    timers = [metrics.child_timer() for _ in images]
+    futures = [ocr_executor.submit(contextvars.copy_context().run, metrics.run_with_timer,
+                                   timer, ocr_image, image, ocr_client)
+               for timer, image in zip(timers, images)]
+    pages = []
+    for page_no, (timer, future) in enumerate(zip(timers, futures), start=1):
+        try:
+            pages.append(future.result())
+        except OCRError as e:
+            for pending in futures:
+                pending.cancel()
+            return f"第 {page_no} 页{e}"
+        finally:
+            metrics.merge_child(timer)
+    return reconstruct_paragraphs(pages)
+
+@api.route('/api/v1/ocr/stats', methods=['GET'])
+def ocr_stats():
+    """
+    OCR 统计（当前 worker 进程）：百度 OCR 调用次数、错误数与耗时，结果缓存命中率，
+    以及图片预处理节省的字节数和耗时。
+    """
+    client_stats = _ocr_client.stats() if _ocr_client is not None else {}
+    return jsonify({'client': client_stats, 'cache': ocr_cache.stats(), 'preprocess': image_preprocessor.stats()})
+
+@api.route('/api/v1/ocr', methods=['POST'])
 def ocr_handler():
     """
     处理文件上传，根据文件类型返回文本内容或 OCR 占位符。
+    多页作文可以在 files 字段中一次上传多张图片，按上传顺序拼接识别结果。
     """
-    file = request.files.get('file')
+    files = [f for f in request.files.getlist('files') + request.files.getlist('file') if f and f.filename]
+    if not files:
+        return jsonify({'error': 'No file uploaded.'}), 400
+
+    if len(files) > 1:
+        # --- 多页图片处理 ---
+        if len(files) > OCR_MAX_PAGES:
+            return jsonify({'error': f'Too many pages, at most {OCR_MAX_PAGES} images per request.'}), 413
+        if not all(allowed_file(f.filename, ALLOWED_IMAGE_EXTENSIONS) for f in files):
+            return jsonify({
+                'error': f"Multi-page upload only accepts image files ({', '.join(ALLOWED_IMAGE_EXTENSIONS)})."
+            }), 415
+        timer = metrics.start_request('ocr_handler')
+        image_content = recognize_handwriting_pages([f.stream for f in files])
+        logger.info("ocr_handler", extra={'fields': timer.fields(pages=len(files))})
+        return jsonify({
+            'status': 'success',
+            'content': image_content,
+            'pages': len(files),
+        })
+
+    file = files[0]
     filename = file.filename
 
     if allowed_file(filename, ALLOWED_TEXT_EXTENSIONS):
@@ -554,8 +2665,8 @@ def ocr_handler():
             # 读取文件内容 (假设文件编码为 UTF-8)
             text_content = file.read().decode('utf-8')
             
-            print(f"File {filename} content read successfully.")
-            print(text_content)
+            logger.info(f"File {filename} content read successfully.")
+            log_content(logger, "Uploaded text file", text_content)
             return jsonify({
                 'status': 'success',
                 'content': text_content
@@ -567,7 +2678,9 @@ def ocr_handler():
 
     elif allowed_file(filename, ALLOWED_IMAGE_EXTENSIONS):
         # --- 图片文件处理---
+        timer = metrics.start_request('ocr_handler')
         image_content = recognize_handwriting_text(file)
+        logger.info("ocr_handler", extra={'fields': timer.fields(pages=1)})
         return jsonify({
             'status': 'success',
             'content': image_content,
@@ -581,7 +2694,44 @@ def ocr_handler():
         }), 415
 
 
+def create_app():
+    """
+    应用工厂：gunicorn 以 app:create_app() 启动，每个 worker 在 fork 之后各自创建应用。
+    导入本模块不连接数据库，也不创建大模型 / OCR 客户端；表结构由 flask --app app migrate 在部署时创建一次。
+    """
+    # 结构化日志：QueueHandler 异步写出，LOG_LEVEL=DEBUG 时才记录作文正文等内容
+    setup_logging_from_env()
+    app = Flask(__name__)
+    # 启用 CORS，允许前端（默认运行在不同端口）访问后端
+    CORS(app)
+    app.register_blueprint(api)
+    if not os.getenv('AUTH_SECRET_KEY'):
+        logger.warning("未设置 AUTH_SECRET_KEY，使用随机密钥：多进程部署时各进程签发的令牌互不认可")
+    return app
+
+def start_background_workers():
+    """
+    启动只有对外服务的进程才需要的后台任务：写后缓冲的写入线程 (先回放上次运行留下的溢写文件)、
+    清理已退出的 worker 遗留的异步评分任务，以及大模型客户端预热。
+    由 gunicorn 的 post_worker_init 在每个 worker 中调用；flask 命令行 (migrate、rebuild-* 等) 只调用 create_app()，
+    不会回放溢写文件或创建大模型客户端。
+    """
+    if ESSAY_WRITE_BEHIND:
+        essay_writer.start()
+    # 上次运行中 worker 被杀掉 (崩溃、超时) 时遗留的任务永远不会完成，标记为失败让客户端的轮询结束
+    try:
+        stale = score_jobs.fail_stale(SCORE_JOB_STALE_SECONDS)
+        if stale:
+            logger.warning(f"Marked {stale} stale score jobs as failed")
+    except Exception as e:
+        logger.warning(f"Stale score job cleanup failed: {e}")
+    if LLM_CLIENT_WARMUP:
+        threading.Thread(target=get_llm_client, name='llm-client-warmup', daemon=True).start()
+
+
 if __name__ == '__main__':
     # 注意：默认运行在 http://127.0.0.1:5000/
     # 在生产环境中，请不要使用 debug=True
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    application = create_app()
+    start_background_workers()
+    application.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,136 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+ACCESS = 'access'
+REFRESH = 'refresh'
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class TokenSigner:
+    """
+    签发与校验无状态令牌 (JWT，HS256)：校验只做一次 HMAC 和过期时间比较，不查数据库。
+    typ 区分访问令牌 (access，有效期短，随每个请求发送) 与刷新令牌 (refresh，只用于换取新的访问令牌)。
+    所有 worker 进程必须使用同一个 secret，否则一个进程签发的令牌在其他进程校验不通过。
+    """
+
+    HEADER = _b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(',', ':')).encode())
+
+    def __init__(self, secret, access_ttl=900, refresh_ttl=14 * 86400, leeway=30):
+        self.secret = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.ttls = {ACCESS: access_ttl, REFRESH: refresh_ttl}
+        self.leeway = leeway
+
+    def _sign(self, signing_input):
+        return _b64encode(hmac.new(self.secret, signing_input.encode('ascii'), hashlib.sha256).digest())
+
+    def issue(self, subject, kind=ACCESS, now=None):
+        now = int(now if now is not None else time.time())
+        claims = {"sub": subject, "typ": kind, "iat": now, "exp": now + self.ttls[kind]}
+        signing_input = f"{self.HEADER}.{_b64encode(json.dumps(claims, separators=(',', ':')).encode())}"
+        return f"{signing_input}.{self._sign(signing_input)}"
+
+    def issue_pair(self, subject):
+        """登录与刷新接口的返回内容。"""
+        return {
+            "access_token": self.issue(subject, ACCESS),
+            "refresh_token": self.issue(subject, REFRESH),
+            "token_type": "Bearer",
+            "expires_in": self.ttls[ACCESS],
+        }
+
+    def verify(self, token, kind=ACCESS, now=None):
+        """校验签名、类型与有效期，返回 claims；不通过时抛出 InvalidToken。"""
+        try:
+            header, payload, signature = token.split('.')
+        except (AttributeError, ValueError):
+            raise InvalidToken("令牌格式错误")
+        if header != self.HEADER or not hmac.compare_digest(signature, self._sign(f"{header}.{payload}")):
+            raise InvalidToken("令牌签名无效")
+        try:
+            claims = json.loads(_b64decode(payload))
+        except ValueError:
+            raise InvalidToken("令牌格式错误")
+        if claims.get('typ') != kind or not claims.get('sub'):
+            raise InvalidToken("令牌类型错误")
+        now = now if now is not None else time.time()
+        if not isinstance(claims.get('exp'), int) or claims['exp'] + self.leeway < now:
+            raise InvalidToken("令牌已过期")
+        return claims
+
+
+def bearer_token(header):
+    """从 Authorization 请求头中取出 Bearer 令牌，没有时返回 None。"""
+    scheme, _, token = (header or '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+
+class PasswordHasher:
+    """
+    在独立的小线程池中计算密码哈希 (pbkdf2 单次约数百毫秒 CPU)。
+
+    hashlib 计算 pbkdf2 时会释放 GIL，但直接在请求线程里算，并发登录会占满全部 CPU，
+    同进程其他请求 (读历史、查详情) 的延迟随之飙升。线程池把哈希的并发度限制在 workers 个，
+    并可通过 nice 降低这些线程的调度优先级；排队超过 max_pending 时抛出 HasherBusy，
+    由调用方返回 503。workers 为 0 时退化为在调用线程中直接计算。
+    """
+
+    def __init__(self, hash_func, check_func, workers=1, max_pending=32, nice=0, timeout=30):
+        self.hash_func = hash_func
+        self.check_func = check_func
+        self.workers = workers
+        self.nice = nice
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending) if workers > 0 else None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash',
+                                            initializer=self._lower_priority) if workers > 0 else None
+
+    def _lower_priority(self):
+        if not self.nice:
+            return
+        try:
+            # Linux 上每个线程有独立的 nice 值
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+        except (AttributeError, OSError) as e:
+            logger.warning(f"无法调整密码哈希线程优先级: {e}")
+
+    def _run(self, func, *args):
+        if self._executor is None:
+            return func(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy("登录请求过多，请稍后重试")
+        try:
+            return self._executor.submit(func, *args).result(timeout=self.timeout)
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(self.hash_func, password)
+
+    def check(self, stored_hash, password):
+        return self._run(self.check_func, stored_hash, password)
@@ -0,0 +1,73 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RateLimiter:
+    """
+    令牌桶限速器：平均每秒 rate 次，允许 burst 次突发。rate <= 0 表示不限速。
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(burst))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def call_with_retry(fn, is_transient, max_retries=3, backoff=1.0, max_backoff=20.0):
+    """
+    调用 fn()，遇到 is_transient(e) 为真的异常时按指数退避 (带随机抖动) 重试。
+    返回 (结果, 尝试次数)；不可重试或重试耗尽时抛出最后一次的异常。
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return fn(), attempt
+        except Exception as e:
+            if attempt > max_retries or not is_transient(e):
+                e.attempts = attempt
+                raise
+            delay = min(max_backoff, backoff * (2 ** (attempt - 1)))
+            time.sleep(delay * random.uniform(0.5, 1.0))
+
+
+def run_batch(items, fn, concurrency=4, limiter=None, is_transient=lambda e: False,
+              max_retries=3, backoff=1.0):
+    """
+    以有限并发对每个 item 执行 fn(item)，结果按输入顺序返回：
+    每一项为 {'ok': True, 'value': ..., 'attempts': n} 或 {'ok': False, 'error': ..., 'attempts': n}。
+    limiter 控制整个批次调用 fn 的速率（包括重试）。
+    """
+    def run_one(item):
+        def attempt():
+            if limiter is not None:
+                limiter.acquire()
+            return fn(item)
+        try:
+            value, attempts = call_with_retry(attempt, is_transient, max_retries, backoff)
+            return {'ok': True, 'value': value, 'attempts': attempts}
+        except Exception as e:
+            return {'ok': False, 'error': str(e), 'attempts': getattr(e, 'attempts', 1)}
+
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items)))) as pool:
+        return list(pool.map(run_one, items))
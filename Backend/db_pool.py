@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """在超时时间内没有借到空闲连接。"""
+
+
+class PooledConnection:
+    """
+    从连接池借出的连接。
+
+    除 close() / is_connected() 外的属性全部透传给底层 MySQL 连接，
+    因此路由里原有的 conn.cursor() / conn.commit() / conn.close() 写法不用改动；
+    close() 只是把连接归还连接池，并不会真正断开。
+    """
+
+    def __init__(self, pool, raw_conn):
+        self._pool = pool
+        self._conn = raw_conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise AttributeError(f"connection already returned to pool: {name}")
+        return getattr(self._conn, name)
+
+    def is_connected(self):
+        # 底层 is_connected() 每次都会发一次 ping，这里只判断是否已归还
+        return self._conn is not None
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._pool.release(conn)
+
+
+class ConnectionPool:
+    """
+    每个进程一个的有界连接池。
+
+    - 连接按需创建，最多 size 个；借不到时最多等待 timeout 秒，超时抛出 PoolTimeout。
+    - 空闲超过 ping_interval 秒的连接在借出前先 ping 一次，失效则丢弃并重建。
+    - 归还时回滚未提交的事务，保证下一个使用者拿到干净的连接。
+    - fork 之后（gunicorn 预加载等场景）检测到 pid 变化会丢弃继承来的连接。
+    """
+
+    def __init__(self, factory, size=8, timeout=5.0, ping_interval=30.0):
+        self._factory = factory
+        self.size = max(1, int(size))
+        self.timeout = float(timeout)
+        self.ping_interval = float(ping_interval)
+        self._cond = threading.Condition()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._idle = deque()  # (conn, last_used)，后进先出，优先复用最近用过的连接
+        self._created = 0
+        self._in_use = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'connects': 0,
+            'connect_errors': 0,
+            'discarded': 0,
+        }
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            with self._cond:
+                if self._pid != os.getpid():
+                    # 继承自父进程的 socket 不能共用，直接丢弃
+                    self._reset_state()
+
+    def acquire(self):
+        """借出一个连接，返回 PooledConnection。"""
+        self._check_fork()
+        start = time.monotonic()
+        waited = False
+        conn = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    last_used = None
+                    break
+                waited = True
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f"no connection available within {self.timeout}s (pool size {self.size})")
+                self._cond.wait(remaining)
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            if waited:
+                wait_time = time.monotonic() - start
+                self._stats['waits'] += 1
+                self._stats['wait_time_total'] += wait_time
+                self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+
+        # 网络操作放在锁外进行
+        if conn is not None and not self._healthy(conn, last_used):
+            self._discard_raw(conn)
+            conn = None
+        if conn is None:
+            try:
+                conn = self._factory()
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._in_use -= 1
+                    self._stats['connect_errors'] += 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats['connects'] += 1
+        return PooledConnection(self, conn)
+
+    def _healthy(self, conn, last_used):
+        if time.monotonic() - last_used < self.ping_interval:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _discard_raw(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats['discarded'] += 1
+
+    def release(self, conn):
+        """归还连接；已失效的连接会被丢弃，空出的名额留给下一次 acquire 重建。"""
+        if self._pid != os.getpid():
+            return
+        reusable = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            reusable = False
+        with self._cond:
+            self._in_use -= 1
+            if reusable:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._created -= 1
+                self._stats['discarded'] += 1
+            self._cond.notify()
+        if not reusable:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        """连接池使用情况，用于确定 MYSQL_POOL_SIZE。"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'pid': self._pid,
+                'size': self.size,
+                'created': self._created,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+            })
+        stats['wait_time_avg'] = stats['wait_time_total'] / stats['waits'] if stats['waits'] else 0.0
+        return stats
@@ -0,0 +1,140 @@
+import json
+import re
+from difflib import SequenceMatcher
+
+# 按句末标点和换行切句，切出的片段首尾相接即为原文
+_SENTENCE_RE = re.compile(r'[^。！？!?；;\n]*(?:[。！？!?；;]+[”’」』）)]*|\n)|[^。！？!?；;\n]+$')
+
+# 两处修改之间少于该长度的未修改片段并入修改，避免「删一个字、留一个字」的碎片化结果
+MIN_KEEP = 2
+
+
+def split_sentences(text):
+    return _SENTENCE_RE.findall(text)
+
+
+class _Builder:
+    """合并相邻的同类操作，并把夹在修改之间的过短保留片段并入修改。"""
+
+    def __init__(self, original):
+        self.original = original
+        self.ops = []
+        self.pos = 0
+
+    def keep(self, n):
+        if n <= 0:
+            return
+        if (n < MIN_KEEP and self.ops and not self._is_keep(self.ops[-1])
+                and self.pos + n < len(self.original)):
+            text = self.original[self.pos:self.pos + n]
+            self.delete(n)
+            self.insert(text)
+            return
+        self.pos += n
+        if self.ops and self._is_keep(self.ops[-1]):
+            self.ops[-1] += n
+        else:
+            self.ops.append(n)
+
+    def delete(self, n):
+        if n <= 0:
+            return
+        self.pos += n
+        # 保持「删除在前、插入在后」的顺序，便于合并与高亮
+        inserted = self.ops.pop() if self.ops and isinstance(self.ops[-1], str) else None
+        if self.ops and self._is_delete(self.ops[-1]):
+            self.ops[-1] -= n
+        else:
+            self.ops.append(-n)
+        if inserted is not None:
+            self.ops.append(inserted)
+
+    def insert(self, text):
+        if not text:
+            return
+        if self.ops and isinstance(self.ops[-1], str):
+            self.ops[-1] += text
+        else:
+            self.ops.append(text)
+
+    @staticmethod
+    def _is_keep(op):
+        return isinstance(op, int) and op > 0
+
+    @staticmethod
+    def _is_delete(op):
+        return isinstance(op, int) and op < 0
+
+
+def encode(original, revised):
+    """
+    计算把 original 改写为 revised 的编辑脚本：先按句子对齐，被改动的句子再逐字比较。
+    脚本是一个列表：正整数表示保留原文接下来的 n 个字符，负整数表示删除 n 个字符，字符串表示插入的文本。
+    长度以 Unicode 字符 (code point) 计。
+    """
+    builder = _Builder(original)
+    a = split_sentences(original)
+    b = split_sentences(revised)
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        old = ''.join(a[i1:i2])
+        new = ''.join(b[j1:j2])
+        if tag == 'equal':
+            builder.keep(len(old))
+        elif tag == 'delete':
+            builder.delete(len(old))
+        elif tag == 'insert':
+            builder.insert(new)
+        else:
+            for ctag, k1, k2, l1, l2 in SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+                if ctag == 'equal':
+                    builder.keep(k2 - k1)
+                else:
+                    builder.delete(k2 - k1)
+                    builder.insert(new[l1:l2])
+    # 末尾的保留操作可以省略
+    if builder.ops and _Builder._is_keep(builder.ops[-1]):
+        builder.ops.pop()
+    return builder.ops
+
+
+def apply(original, ops):
+    """按编辑脚本还原修改后的全文；脚本与原文不匹配时抛出 ValueError。"""
+    parts = []
+    pos = 0
+    for op in ops:
+        if isinstance(op, str):
+            parts.append(op)
+        elif op > 0:
+            if pos + op > len(original):
+                raise ValueError("edit script does not match original text")
+            parts.append(original[pos:pos + op])
+            pos += op
+        else:
+            pos -= op
+            if pos > len(original):
+                raise ValueError("edit script does not match original text")
+    parts.append(original[pos:])
+    return ''.join(parts)
+
+
+def dumps(ops):
+    return json.dumps(ops, ensure_ascii=False, separators=(',', ':'))
+
+
+def loads(data):
+    return json.loads(data)
+
+
+def pack(original, revised, max_ratio=0.6):
+    """
+    决定润色全文的存储形式，返回 (revised_content, revised_diff)，二者只有一个非空。
+    编辑脚本的 UTF-8 字节数不超过全文的 max_ratio 时存脚本，否则 (改动很大时) 仍存全文。
+    """
+    if revised is None:
+        return None, None
+    if not original or max_ratio <= 0:
+        return revised, None
+    script = dumps(encode(original, revised))
+    if len(script.encode('utf-8')) <= len(revised.encode('utf-8')) * max_ratio:
+        return None, script
+    return revised, None
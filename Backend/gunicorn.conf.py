@@ -0,0 +1,50 @@
+import os
+import secrets
+import shutil
+import sys
+
+from prometheus_client import multiprocess
+
+# 请求几乎全部时间都在等待大模型 / 百度 OCR 返回，用 gthread worker：
+# 每个进程一个线程池，最多同时处理 workers * threads 个请求；
+# 空闲的 keep-alive 连接由主线程的事件循环托管，不占用工作线程。
+# OpenAI 客户端、OCR 客户端、数据库连接池均为进程内共享且线程安全。
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', '64'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '300'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+
+def on_starting(server):
+    # 各 worker 必须用同一个密钥签发 / 校验登录令牌：未配置时在主进程生成一个，fork 出的 worker 继承
+    if not os.getenv('AUTH_SECRET_KEY'):
+        server.log.warning("AUTH_SECRET_KEY is not set, generated a random key; tokens will not survive a restart")
+        os.environ['AUTH_SECRET_KEY'] = secrets.token_hex(32)
+    # 清掉上次运行残留的指标文件，避免重启后计数叠加
+    path = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def post_worker_init(worker):
+    # worker 加载应用后再启动写后缓冲 (回放溢写文件) 与大模型客户端预热；flask 命令行进程不经过这里
+    backend = sys.modules.get('app')
+    if backend is not None:
+        backend.start_background_workers()
+
+
+def worker_exit(server, worker):
+    # worker 退出 (重启 / 发布) 前结束异步评分任务 (来不及完成的标记为失败)，
+    # 再写完写后缓冲中已确认的作文，来不及写入的溢写到本地文件，下次启动时回放
+    backend = sys.modules.get('app')
+    if backend is not None:
+        backend.score_jobs.close(backend.SCORE_JOB_CLOSE_TIMEOUT)
+        backend.essay_writer.close(backend.ESSAY_WRITE_CLOSE_TIMEOUT)
+
+
+def child_exit(server, worker):
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,363 @@
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from uuid import uuid4
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+FINISHED_STATUSES = (JOB_DONE, JOB_FAILED)
+
+
+class QueueFull(Exception):
+    """排队中的任务数已达上限。"""
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def _worker_id():
+    # 执行任务的进程：主机名 + pid，worker 重启后用来找出它遗留的未完成任务
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Job:
+    """一次异步评分任务。payload 只在本进程内使用，不写入任务存储。"""
+
+    def __init__(self, job_id, payload, username=None):
+        self.id = job_id
+        self.payload = payload
+        self.username = username
+        self.status = JOB_QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = _now_ms()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        data = {
+            'jobId': self.id,
+            'status': self.status,
+            'createdAt': self.created_at,
+            'startedAt': self.started_at,
+            'finishedAt': self.finished_at,
+        }
+        if self.started_at is not None:
+            data['queueWaitMs'] = self.started_at - self.created_at
+        if self.finished_at is not None:
+            data['runMs'] = self.finished_at - self.started_at
+        if self.status == JOB_DONE:
+            data['result'] = self.result
+        if self.status == JOB_FAILED:
+            data['error'] = self.error
+        return data
+
+
+class InMemoryJobStore:
+    """
+    进程内任务存储，只保留最近 max_finished 个已完成任务。
+    适用于单进程部署和离线测试；多 worker 部署请使用 MySQLJobStore。
+    """
+
+    def __init__(self, max_finished=1000):
+        self._jobs = {}
+        self._finished = []
+        self._max_finished = max_finished
+        self._lock = threading.Lock()
+
+    def save(self, job):
+        with self._lock:
+            self._jobs[job.id] = (job.username, job.to_dict())
+            if job.status in FINISHED_STATUSES:
+                self._finished.append(job.id)
+                while len(self._finished) > self._max_finished:
+                    self._jobs.pop(self._finished.pop(0), None)
+
+    def get(self, job_id, owner=None):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is None or (owner is not None and entry[0] != owner):
+                return None
+            return dict(entry[1])
+
+    def fail_stale(self, error, max_age_ms):
+        # 任务只存在于本进程内存中，进程退出后随之消失，没有遗留的任务
+        return 0
+
+
+class MySQLJobStore:
+    """
+    基于 score_jobs 表的任务存储，所有 gunicorn worker 共享，
+    因此轮询请求落到哪个 worker 上都能查到任务状态。
+    """
+
+    def __init__(self, get_connection):
+        self._get_connection = get_connection
+
+    def save(self, job):
+        conn = self._get_connection()
+        if conn is None:
+            raise RuntimeError("数据库连接失败")
+        try:
+            cursor = conn.cursor()
+            result_json = json.dumps(job.result, ensure_ascii=False) if job.result is not None else None
+            cursor.execute(
+                """
+                INSERT INTO score_jobs (id, username, status, result, error, created_at, started_at, finished_at,
+                                        worker)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE status = VALUES(status), result = VALUES(result), error = VALUES(error),
+                    started_at = VALUES(started_at), finished_at = VALUES(finished_at), worker = VALUES(worker)
+                """,
+                (job.id, job.username, job.status, result_json, job.error,
+                 job.created_at, job.started_at, job.finished_at, _worker_id())
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, job_id, owner=None):
+        conn = self._get_connection()
+        if conn is None:
+            raise RuntimeError("数据库连接失败")
+        sql = "SELECT id, status, result, error, created_at, started_at, finished_at FROM score_jobs WHERE id = %s"
+        params = [job_id]
+        if owner is not None:
+            sql += " AND username = %s"
+            params.append(owner)
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(sql, tuple(params))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        job = Job(row['id'], None)
+        job.status = row['status']
+        job.result = json.loads(row['result']) if row['result'] else None
+        job.error = row['error']
+        job.created_at = row['created_at']
+        job.started_at = row['started_at']
+        job.finished_at = row['finished_at']
+        return job.to_dict()
+
+    def fail_stale(self, error, max_age_ms):
+        """
+        把已退出的 worker 遗留的 queued / running 任务标记为 failed，返回标记的任务数：
+        本机上 pid 已不存在的 worker 的任务，以及创建超过 max_age_ms 仍未完成的任务
+        (容器重建后主机名改变，旧 worker 的任务只能按时间判断)。
+        """
+        conn = self._get_connection()
+        if conn is None:
+            raise RuntimeError("数据库连接失败")
+        now = _now_ms()
+        prefix = socket.gethostname() + ':'
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT DISTINCT worker FROM score_jobs WHERE status IN (%s, %s)", (JOB_QUEUED, JOB_RUNNING))
+            dead = []
+            for (worker,) in cursor.fetchall():
+                pid = (worker or '')[len(prefix):]
+                if worker and worker.startswith(prefix) and pid.isdigit() and not _pid_alive(int(pid)):
+                    dead.append(worker)
+            sql = ("UPDATE score_jobs SET status = %s, error = %s, finished_at = %s "
+                   "WHERE status IN (%s, %s) AND (created_at < %s")
+            params = [JOB_FAILED, error, now, JOB_QUEUED, JOB_RUNNING, now - max_age_ms]
+            if dead:
+                sql += f" OR worker IN ({', '.join(['%s'] * len(dead))})"
+                params += dead
+            cursor.execute(sql + ")", tuple(params))
+            count = cursor.rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        return count
+
+
+class JobQueue:
+    """
+    有界的后台评分队列。
+
+    handler(payload) 在工作线程中执行（调用大模型并写入 essays），返回值作为任务结果；
+    抛出的异常会把任务标记为 failed。排队数超过 max_depth 时 submit 抛出 QueueFull。
+    工作线程在第一次 submit 时才启动，避免 gunicorn fork 前创建线程。
+    工作线程是守护线程，进程退出前应调用 close()：未开始的任务与来不及完成的任务标记为 failed，客户端轮询能结束。
+    """
+
+    def __init__(self, handler, store=None, workers=4, max_depth=100):
+        self._handler = handler
+        self.store = store if store is not None else InMemoryJobStore()
+        self.workers = max(1, int(workers))
+        self.max_depth = max(1, int(max_depth))
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._threads = []
+        self._running = {}
+        self._closing = False
+        self._stats = {
+            'submitted': 0,
+            'rejected': 0,
+            'completed': 0,
+            'failed': 0,
+            'queue_wait_ms_total': 0,
+            'queue_wait_ms_max': 0,
+            'run_ms_total': 0,
+            'run_ms_max': 0,
+        }
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=self.max_depth)
+            self._running = {}
+            self._closing = False
+            self._threads = []
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"score-job-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, payload, username=None, job_id=None):
+        """登记任务并放入队列，立即返回 Job（状态为 queued）。"""
+        self._ensure_started()
+        if self._closing:
+            raise QueueFull("服务正在重启，请稍后重试")
+        job = Job(job_id or str(uuid4()), payload, username)
+        self.store.save(job)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            job.status = JOB_FAILED
+            job.error = "评分队列已满，请稍后重试"
+            job.finished_at = job.started_at = job.created_at
+            self.store.save(job)
+            raise QueueFull(job.error)
+        with self._lock:
+            self._stats['submitted'] += 1
+        return job
+
+    def get(self, job_id, owner=None):
+        """返回任务状态字典；任务不存在，或指定了 owner 而任务不属于该用户时返回 None。"""
+        return self.store.get(job_id, owner)
+
+    def close(self, timeout=5.0):
+        """
+        停止接收新任务：排队中的任务直接标记为 failed，正在执行的任务最多再等 timeout 秒，
+        仍未完成的同样标记为 failed (之后若赶在进程退出前完成，会被正常结果覆盖)。本进程没有启动过队列时什么也不做。
+        """
+        if self._pid != os.getpid() or self._closing:
+            return
+        self._closing = True
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._fail(job, "服务重启，任务已取消，请重新提交")
+            self._queue.task_done()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._running:
+                    return
+            time.sleep(0.05)
+        with self._lock:
+            unfinished = list(self._running.values())
+        for job in unfinished:
+            self._fail(job, "服务重启，任务中断，请重新提交")
+
+    def fail_stale(self, max_age):
+        """worker 启动时调用：把已退出的 worker 遗留的未完成任务标记为 failed (见 MySQLJobStore.fail_stale)。"""
+        return self.store.fail_stale("服务重启，任务中断，请重新提交", int(max_age * 1000))
+
+    def _fail(self, job, error):
+        job.status = JOB_FAILED
+        job.error = error
+        job.finished_at = _now_ms()
+        job.started_at = job.started_at or job.finished_at
+        with self._lock:
+            self._stats['failed'] += 1
+        try:
+            self.store.save(job)
+        except Exception as e:
+            logger.warning(f"Job store update failed for {job.id}: {e}")
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._running[job.id] = job
+            try:
+                self._run(job)
+            finally:
+                with self._lock:
+                    self._running.pop(job.id, None)
+                self._queue.task_done()
+
+    def _run(self, job):
+        job.status = JOB_RUNNING
+        job.started_at = _now_ms()
+        try:
+            self.store.save(job)
+        except Exception as e:
+            logger.warning(f"Job store update failed for {job.id}: {e}")
+        try:
+            job.result = self._handler(job.payload)
+            job.status = JOB_DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = JOB_FAILED
+        job.finished_at = _now_ms()
+        job.payload = None
+        queue_wait = job.started_at - job.created_at
+        run_time = job.finished_at - job.started_at
+        with self._lock:
+            self._stats['completed' if job.status == JOB_DONE else 'failed'] += 1
+            self._stats['queue_wait_ms_total'] += queue_wait
+            self._stats['queue_wait_ms_max'] = max(self._stats['queue_wait_ms_max'], queue_wait)
+            self._stats['run_ms_total'] += run_time
+            self._stats['run_ms_max'] = max(self._stats['run_ms_max'], run_time)
+        try:
+            self.store.save(job)
+        except Exception as e:
+            logger.warning(f"Job store update failed for {job.id}: {e}")
+
+    def stats(self):
+        """队列深度与任务耗时统计（当前 worker 进程）。"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['workers'] = self.workers
+            stats['max_depth'] = self.max_depth
+            stats['depth'] = self._queue.qsize() if self._queue is not None else 0
+            stats['running'] = len(self._running)
+        finished = stats['completed'] + stats['failed']
+        stats['queue_wait_ms_avg'] = stats['queue_wait_ms_total'] / finished if finished else 0.0
+        stats['run_ms_avg'] = stats['run_ms_total'] / finished if finished else 0.0
+        return stats
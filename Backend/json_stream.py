@@ -0,0 +1,143 @@
+import json
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class JsonFieldStream:
+    """
+    增量解析大模型流式输出的顶层 JSON 对象。
+
+    feed(chunk) 返回本次新产生的事件列表：
+      ('field', key, value)  —— 某个普通字段的值已经完整；
+      ('text', key, delta)   —— stream_fields 中的字符串字段新增的一段文本（已反转义）；
+      ('end', key, None)     —— stream_fields 中的字段结束。
+    模型偶尔会在 JSON 外包一层 ```json 代码块，第一个 '{' 之前的内容会被忽略。
+    """
+
+    def __init__(self, stream_fields=('revised_content',)):
+        self.stream_fields = set(stream_fields)
+        self._state = 'before_object'
+        self._key = None
+        self._buf = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._unicode = None  # 正在读取的 \uXXXX 十六进制位
+        self._high_surrogate = None
+        self.done = False
+
+    def feed(self, chunk):
+        events = []
+        text_out = []
+        for ch in chunk:
+            state = self._state
+            if state == 'before_object':
+                if ch == '{':
+                    self._state = 'expect_key'
+            elif state == 'expect_key':
+                if ch == '"':
+                    self._state = 'key'
+                    self._buf = []
+                elif ch == '}':
+                    self._state = 'finished'
+                    self.done = True
+            elif state == 'key':
+                if self._escape:
+                    self._buf.append(_ESCAPES.get(ch, ch))
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._key = ''.join(self._buf)
+                    self._state = 'expect_colon'
+                else:
+                    self._buf.append(ch)
+            elif state == 'expect_colon':
+                if ch == ':':
+                    self._state = 'expect_value'
+            elif state == 'expect_value':
+                if ch.isspace():
+                    continue
+                if ch == '"' and self._key in self.stream_fields:
+                    self._state = 'stream_string'
+                    self._escape = False
+                    self._unicode = None
+                else:
+                    self._state = 'value'
+                    self._buf = []
+                    self._depth = 0
+                    self._in_string = False
+                    self._escape = False
+                    self._consume_value_char(ch, events)
+            elif state == 'value':
+                self._consume_value_char(ch, events)
+            elif state == 'stream_string':
+                closed = self._consume_string_char(ch, text_out)
+                if closed:
+                    if text_out:
+                        events.append(('text', self._key, ''.join(text_out)))
+                        text_out = []
+                    events.append(('end', self._key, None))
+                    self._state = 'after_value'
+            elif state == 'after_value':
+                if ch == ',':
+                    self._state = 'expect_key'
+                elif ch == '}':
+                    self._state = 'finished'
+                    self.done = True
+        if text_out:
+            events.append(('text', self._key, ''.join(text_out)))
+        return events
+
+    def _consume_value_char(self, ch, events):
+        if self._in_string:
+            self._buf.append(ch)
+            if self._escape:
+                self._escape = False
+            elif ch == '\\':
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+            return
+        if self._depth == 0 and ch in ',}':
+            events.append(('field', self._key, json.loads(''.join(self._buf))))
+            self._state = 'expect_key' if ch == ',' else 'finished'
+            self.done = ch == '}'
+            return
+        self._buf.append(ch)
+        if ch == '"':
+            self._in_string = True
+        elif ch in '{[':
+            self._depth += 1
+        elif ch in '}]':
+            self._depth -= 1
+
+    def _consume_string_char(self, ch, out):
+        """处理流式字符串字段的一个字符，遇到结束引号时返回 True。"""
+        if self._unicode is not None:
+            self._unicode.append(ch)
+            if len(self._unicode) == 4:
+                code = int(''.join(self._unicode), 16)
+                self._unicode = None
+                if 0xD800 <= code < 0xDC00:
+                    self._high_surrogate = code
+                elif 0xDC00 <= code < 0xE000 and self._high_surrogate is not None:
+                    out.append(chr(0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)))
+                    self._high_surrogate = None
+                else:
+                    out.append(chr(code))
+            return False
+        if self._escape:
+            self._escape = False
+            if ch == 'u':
+                self._unicode = []
+            else:
+                out.append(_ESCAPES.get(ch, ch))
+            return False
+        if ch == '\\':
+            self._escape = True
+            return False
+        if ch == '"':
+            return True
+        out.append(ch)
+        return False
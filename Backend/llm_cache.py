@@ -0,0 +1,214 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_content(text):
+    """
+    归一化作文正文：统一 Unicode 形式与换行符，去掉每行首尾空白和多余空行，
+    使仅有空白差异的重复提交命中同一个缓存项。
+    """
+    text = unicodedata.normalize('NFKC', text or '')
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    lines = [line.strip() for line in text.split('\n')]
+    return re.sub(r'\n{2,}', '\n', '\n'.join(lines)).strip()
+
+
+def cache_key(model, system_prompt, topic, content):
+    """由 (模型, 系统提示词, 题目, 归一化正文) 计算内容寻址的缓存键。"""
+    h = hashlib.sha256()
+    for part in (model, system_prompt, (topic or '').strip(), normalize_content(content)):
+        h.update((part or '').encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+class MySQLCacheStore:
+    """
+    持久化缓存层，存放在 llm_cache 表中，由所有 worker 共享。
+    写入时按 created_at 清理过期项，并在超过 max_rows 时删除最旧的记录。
+    """
+
+    def __init__(self, get_connection, ttl, max_rows=100000, prune_every=100):
+        self._get_connection = get_connection
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._prune_every = prune_every
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        conn = self._get_connection()
+        if conn is None:
+            return None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT result FROM llm_cache WHERE cache_key = %s AND created_at >= %s",
+                (key, int((time.time() - self.ttl) * 1000))
+            )
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        conn = self._get_connection()
+        if conn is None:
+            return
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self._prune_every == 0
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT INTO llm_cache (cache_key, result, created_at) VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE result = VALUES(result), created_at = VALUES(created_at)
+                """,
+                (key, json.dumps(value, ensure_ascii=False), int(time.time() * 1000))
+            )
+            if prune:
+                self._prune(cursor)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _prune(self, cursor):
+        cursor.execute("DELETE FROM llm_cache WHERE created_at < %s", (int((time.time() - self.ttl) * 1000),))
+        cursor.execute("SELECT COUNT(*) FROM llm_cache")
+        overflow = cursor.fetchone()[0] - self.max_rows
+        if overflow > 0:
+            cursor.execute("DELETE FROM llm_cache ORDER BY created_at LIMIT %s", (overflow,))
+
+
+class _InFlight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResultCache:
+    """
+    两级结果缓存：进程内 LRU（按条数和 TTL 淘汰）+ 可选的持久化层。
+
+    get_or_compute() 对同一个键的并发请求只会执行一次 compute，
+    其余请求等待并共享这次调用的结果（或异常）。
+    """
+
+    def __init__(self, ttl=7 * 24 * 3600, max_entries=1024, persistent=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.persistent = persistent
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'memory_hits': 0,
+            'persistent_hits': 0,
+            'misses': 0,
+            'shared_inflight': 0,
+            'evictions': 0,
+            'persistent_errors': 0,
+        }
+
+    def _get_memory(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _set_memory(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def get(self, key):
+        with self._lock:
+            value = self._get_memory(key)
+            if value is not None:
+                self._stats['memory_hits'] += 1
+                return value
+        if self.persistent is not None:
+            try:
+                value = self.persistent.get(key)
+            except Exception as e:
+                logger.warning(f"LLM cache read failed: {e}")
+                value = None
+                with self._lock:
+                    self._stats['persistent_errors'] += 1
+            if value is not None:
+                with self._lock:
+                    self._stats['persistent_hits'] += 1
+                    self._set_memory(key, value)
+                return value
+        return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._set_memory(key, value)
+        if self.persistent is not None:
+            try:
+                self.persistent.set(key, value)
+            except Exception as e:
+                logger.warning(f"LLM cache write failed: {e}")
+                with self._lock:
+                    self._stats['persistent_errors'] += 1
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            value = self._get_memory(key)
+            if value is not None:
+                self._stats['memory_hits'] += 1
+                return value
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _InFlight()
+                self._stats['misses'] += 1
+            else:
+                self._stats['shared_inflight'] += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+        try:
+            call.value = compute()
+            self.set(key, call.value)
+            return call.value
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['max_entries'] = self.max_entries
+            stats['inflight'] = len(self._inflight)
+        hits = stats['memory_hits'] + stats['persistent_hits']
+        lookups = hits + stats['misses']
+        stats['hit_rate'] = hits / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,153 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from contextlib import contextmanager
+
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    每条日志输出为一行 JSON；通过 extra={'fields': {...}} 传入的键值 (如各阶段耗时) 会并入顶层。
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'pid': record.process,
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        for key, value in vars(record).items():
+            if key not in _RESERVED and key != 'fields' and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """本地调试用的文本格式，fields 以 key=value 追加在消息后面。"""
+
+    def __init__(self):
+        super().__init__('[%(asctime)s] %(levelname)s in %(name)s: %(message)s')
+
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            text += ' ' + ' '.join(f"{k}={v}" for k, v in fields.items())
+        return text
+
+
+class SamplingFilter(logging.Filter):
+    """
+    对 WARNING 以下的日志按 rate 随机采样，WARNING 及以上全部保留。
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+_listener = None
+
+
+def setup_logging(level='INFO', sample_rate=1.0, fmt='json'):
+    """
+    配置根日志：请求线程只把日志记录放进内存队列 (QueueHandler)，
+    由后台 QueueListener 线程格式化并写到 stdout，写日志不再阻塞请求。
+    """
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def setup_logging_from_env():
+    setup_logging(
+        level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+        sample_rate=float(os.getenv('LOG_SAMPLE_RATE', '1')),
+        fmt=os.getenv('LOG_FORMAT', 'json'),
+    )
+
+
+def log_content(logger, message, content):
+    """
+    记录作文正文、识别文本等学生内容：只有开启 DEBUG 级别时才输出。
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(message, extra={'fields': {'content': content}})
+
+
+class StageTimer:
+    """
+    记录一次请求中各阶段的耗时 (毫秒)，结束时作为日志字段输出。
+    on_stage(name, ms) 在每个阶段结束时回调，用于写入监控指标。
+
+        timer = StageTimer()
+        with timer.stage('llm'):
+            ...
+        logger.info("score_essay", extra={'fields': timer.fields()})
+    """
+
+    def __init__(self, on_stage=None):
+        self._start = time.perf_counter()
+        self._on_stage = on_stage
+        self.stages = {}
+        self.extra = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            self.stages[name] = self.stages.get(name, 0.0) + ms
+            if self._on_stage is not None:
+                self._on_stage(name, ms)
+
+    def merge(self, other):
+        """累加在其他线程中记录的 timer (见 metrics.child_timer) 的阶段耗时与附加字段。"""
+        for name, ms in other.stages.items():
+            self.stages[name] = self.stages.get(name, 0.0) + ms
+        self.extra.update(other.extra)
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    def fields(self, **extra):
+        fields = {f"{name}_ms": round(ms, 1) for name, ms in self.stages.items()}
+        fields['total_ms'] = round(self.elapsed_ms(), 1)
+        fields.update(self.extra)
+        fields.update(extra)
+        return fields
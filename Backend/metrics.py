@@ -0,0 +1,185 @@
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+from logging_config import StageTimer
+
+# gunicorn 多 worker 部署时设置 PROMETHEUS_MULTIPROC_DIR，各进程把指标写到该目录下的 mmap 文件，
+# /metrics 由任意一个 worker 汇总所有进程的数据 (见 gunicorn.conf.py)。
+# 该目录由 gunicorn 主进程在 on_starting 中清空并创建；flask migrate 等不经过 gunicorn 的命令行进程里目录可能不存在，
+# 在这里补建，否则创建指标时打开 mmap 文件会失败
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+if MULTIPROCESS:
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+_LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 20, 40, 60, 120, 300)
+
+REQUEST_SECONDS = Histogram(
+    'essayscore_request_seconds', '接口总耗时', ['endpoint'], buckets=_LATENCY_BUCKETS)
+STAGE_SECONDS = Histogram(
+    'essayscore_stage_seconds', '接口内各阶段耗时 (db_connect / db_query / llm / ocr / serialize 等)',
+    ['endpoint', 'stage'], buckets=_LATENCY_BUCKETS)
+# mode 为评分模式 (score / feedback / full) 或 rewrite，用于对比各模式的 token 用量与耗时
+LLM_TOKENS = Counter(
+    'essayscore_llm_tokens', '大模型累计消耗的 token 数', ['mode', 'kind'])
+LLM_TOKENS_PER_CALL = Histogram(
+    'essayscore_llm_tokens_per_call', '单次大模型调用的 token 数', ['mode', 'kind'],
+    buckets=(50, 100, 250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 16000))
+LLM_CALL_SECONDS = Histogram(
+    'essayscore_llm_call_seconds', '单次大模型调用耗时', ['mode'], buckets=_LATENCY_BUCKETS)
+# 评分结果的写后缓冲 (write_behind.py)：outcome 为 ok / error
+WRITE_BEHIND_DEPTH = Gauge(
+    'essayscore_write_behind_depth', '写后缓冲中等待写入数据库的作文数', multiprocess_mode='livesum')
+WRITE_BEHIND_FLUSH_SECONDS = Histogram(
+    'essayscore_write_behind_flush_seconds', '写后缓冲单次批量写入 (含提交) 耗时', ['outcome'],
+    buckets=_LATENCY_BUCKETS)
+WRITE_BEHIND_BATCH_SIZE = Histogram(
+    'essayscore_write_behind_batch_size', '写后缓冲单次批量写入的作文数',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+# 大模型调用准入控制 (admission.py)：priority 为 interactive / batch，reason 为拒绝原因
+ADMISSION_QUEUE_DEPTH = Gauge(
+    'essayscore_admission_queue_depth', '等待大模型配额的请求数', ['priority'], multiprocess_mode='livesum')
+ADMISSION_WAIT_SECONDS = Histogram(
+    'essayscore_admission_wait_seconds', '请求从排队到获得大模型配额的等待时间', ['priority'],
+    buckets=_LATENCY_BUCKETS)
+ADMISSION_REJECTED = Counter(
+    'essayscore_admission_rejected', '准入控制快速拒绝的请求数 (user_queue / queue_full / wait_estimate / timeout)',
+    ['reason'])
+LLM_RATE_LIMITED = Counter(
+    'essayscore_llm_rate_limited', '大模型服务端返回 429 的次数')
+
+_current_timer = ContextVar('stage_timer', default=None)
+
+
+def start_request(endpoint):
+    """
+    开始记录一次请求：返回的 StageTimer 同时用于日志字段，
+    每个阶段结束时写入 essayscore_stage_seconds。
+    """
+    def observe(stage, ms):
+        STAGE_SECONDS.labels(endpoint, stage).observe(ms / 1000)
+
+    timer = StageTimer(on_stage=observe)
+    timer.endpoint = endpoint
+    _current_timer.set(timer)
+    return timer
+
+
+def finish_request(timer):
+    REQUEST_SECONDS.labels(timer.endpoint).observe(timer.elapsed_ms() / 1000)
+    _current_timer.set(None)
+
+
+def reset():
+    _current_timer.set(None)
+
+
+def current_timer():
+    return _current_timer.get()
+
+
+def child_timer():
+    """
+    为当前请求派生一个交给其他线程使用的 StageTimer：阶段耗时照常写入监控指标，但只记在自身，
+    由请求线程调用 merge_child 合并，避免多个线程同时修改请求的 timer。当前没有在记录的请求时返回 None。
+    """
+    parent = _current_timer.get()
+    if parent is None:
+        return None
+    timer = StageTimer(on_stage=parent._on_stage)
+    timer.endpoint = parent.endpoint
+    return timer
+
+
+def run_with_timer(timer, fn, *args, **kwargs):
+    """在其他线程中以 timer (child_timer 的返回值，可以为 None) 作为当前 timer 调用 fn。"""
+    token = _current_timer.set(timer)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _current_timer.reset(token)
+
+
+def merge_child(timer):
+    """在请求线程中把 child_timer 记录的阶段耗时合并到当前请求的 timer。"""
+    parent = _current_timer.get()
+    if parent is not None and timer is not None:
+        parent.merge(timer)
+
+
+@contextmanager
+def track(stage):
+    """
+    在当前请求的 StageTimer 中记录一个阶段；当前没有在记录的请求时不做任何事。
+    供 get_db_connection、LLM / OCR 调用等底层函数使用，调用方无需传递 timer。
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(stage):
+        yield
+
+
+def record_llm_usage(usage, mode='full'):
+    """记录 OpenAI 兼容接口返回的 usage (prompt_tokens / completion_tokens)。"""
+    if usage is None:
+        return
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        tokens = getattr(usage, kind, None)
+        if tokens:
+            LLM_TOKENS.labels(mode, kind).inc(tokens)
+            LLM_TOKENS_PER_CALL.labels(mode, kind).observe(tokens)
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.extra['prompt_tokens'] = getattr(usage, 'prompt_tokens', None)
+        timer.extra['completion_tokens'] = getattr(usage, 'completion_tokens', None)
+
+
+def record_llm_call(mode, seconds, usage):
+    """记录一次非流式大模型调用的耗时与 token 用量。"""
+    LLM_CALL_SECONDS.labels(mode).observe(seconds)
+    record_llm_usage(usage, mode)
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.extra['mode'] = mode
+
+
+def record_write_behind_flush(seconds, rows, outcome):
+    WRITE_BEHIND_FLUSH_SECONDS.labels(outcome).observe(seconds)
+    if outcome == 'ok':
+        WRITE_BEHIND_BATCH_SIZE.observe(rows)
+
+
+def set_write_behind_depth(depth):
+    WRITE_BEHIND_DEPTH.set(depth)
+
+
+def set_admission_depth(priority, depth):
+    ADMISSION_QUEUE_DEPTH.labels(priority).set(depth)
+
+
+def record_admission_wait(priority, seconds):
+    ADMISSION_WAIT_SECONDS.labels(priority).observe(seconds)
+
+
+def record_admission_reject(reason):
+    ADMISSION_REJECTED.labels(reason).inc()
+
+
+def record_llm_rate_limited():
+    LLM_RATE_LIMITED.inc()
+
+
+def render():
+    """返回 (Prometheus 文本格式的指标, Content-Type)。"""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
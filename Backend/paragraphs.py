@@ -0,0 +1,85 @@
+import numpy as np
+
+
+def location_arrays(words_results):
+    """
+    把百度 OCR 的 words_result 转成 (words, top, left, height, width)，后四项为 NumPy 数组。
+    缺少 location 或 words 的条目会被跳过。
+    """
+    items = [item for item in words_results if 'location' in item and 'words' in item]
+    words = [item['words'] for item in items]
+    if not items:
+        empty = np.zeros(0, dtype=float)
+        return words, empty, empty, empty, empty
+    loc = np.array(
+        [(item['location']['top'], item['location']['left'],
+          item['location']['height'], item['location']['width']) for item in items],
+        dtype=float
+    )
+    return words, loc[:, 0], loc[:, 1], loc[:, 2], loc[:, 3]
+
+
+def _margin_offset(residual, bin_width):
+    """
+    残差的一维直方图中，最靠左且行数不少于峰值一半的区间中心，即边距所在位置。
+    正文行远多于段首行，用「不少于峰值一半」避免左侧零星噪点被当作边距。
+    """
+    low = residual.min()
+    bins = np.floor((residual - low) / bin_width).astype(int)
+    counts = np.bincount(bins)
+    mode_bin = int(np.flatnonzero(counts >= counts.max() / 2)[0])
+    in_bin = residual[bins == mode_bin]
+    return float(np.median(in_bin))
+
+
+def estimate_margin(top, left, height, iterations=4):
+    """
+    估计页面左边距所在的直线 left ≈ slope * top + intercept。
+
+    每一轮先对当前的边距行做最小二乘拟合 (斜率即拍照倾斜造成的偏移)，
+    再用残差直方图找出边距位置，只保留距边距半个行高以内的行进入下一轮；
+    段首缩进行和居中的标题因此不会把直线拉偏。返回 (slope, intercept)。
+    """
+    h = float(np.median(height))
+    if len(left) == 1 or h <= 0:
+        return 0.0, float(left.min())
+
+    bin_width = max(h / 2, 1.0)
+    inliers = np.ones(len(left), dtype=bool)
+    slope, intercept = 0.0, 0.0
+    for _ in range(iterations):
+        if inliers.sum() >= 2 and np.ptp(top[inliers]) > 0:
+            slope, intercept = np.polyfit(top[inliers], left[inliers], 1)
+        residual = left - (slope * top + intercept)
+        offset = _margin_offset(residual, bin_width)
+        intercept += offset
+        next_inliers = np.abs(residual - offset) <= h / 2
+        if np.array_equal(next_inliers, inliers):
+            break
+        inliers = next_inliers
+    return float(slope), float(intercept)
+
+
+def paragraph_starts(top, left, height, indent_ratio=1.0):
+    """
+    判断每一行是否为段首：经倾斜校正后的左缩进超过 indent_ratio 个中位行高即为段首
+    (中文段首缩进两个字，约两个行高)。返回布尔数组，与输入行一一对应。
+    """
+    if len(left) == 0:
+        return np.zeros(0, dtype=bool)
+    slope, intercept = estimate_margin(top, left, height)
+    residual = left - (slope * top + intercept)
+    return residual > indent_ratio * float(np.median(height))
+
+
+def segment_pages(pages, indent_ratio=1.0):
+    """
+    对按页序排列的 words_result 列表逐页估计边距，返回 [(words, is_paragraph_start), ...]。
+    每页单独做倾斜校正，因此下一页首行没有缩进时会接在上一页最后一段之后。
+    """
+    lines = []
+    for words_results in pages:
+        words, top, left, height, _ = location_arrays(words_results)
+        starts = paragraph_starts(top, left, height, indent_ratio)
+        lines.extend(zip(words, starts.tolist()))
+    return lines
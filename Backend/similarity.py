@@ -0,0 +1,86 @@
+import hashlib
+import re
+import zlib
+
+import numpy as np
+
+# 大于 2^32 的最小素数：哈希值 (crc32) 与置换参数都小于 2^32，a * x + b 不会超出 uint64
+_PRIME = np.uint64(4294967311)
+_NORMALIZE_RE = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    """去掉空白与标点并转为小写：只改了分段或标点的抄袭仍能匹配。"""
+    return _NORMALIZE_RE.sub('', text or '').lower()
+
+
+class MinHasher:
+    """
+    作文正文的 MinHash 签名与 LSH 分桶。
+
+    正文规范化后取长度为 shingle_size 的字符片段 (shingle)，num_perm 个随机置换下各自的最小哈希组成签名；
+    两篇作文签名中相同位置取值相等的比例是它们 shingle 集合 Jaccard 相似度的无偏估计。
+    签名切成 bands 段，每段连同题目哈希成一个分桶键：同一题目下至少有一段完全相同的作文才成为候选，
+    Jaccard 相似度为 s 的两篇作文成为候选的概率是 1 - (1 - s^r)^b (r = num_perm / bands)，
+    默认 128 / 32 时阈值约为 0.42。
+
+    置换参数由 seed 决定，所有进程、所有时间都必须一致；修改 num_perm / bands / shingle_size / seed 后需要重建索引。
+    """
+
+    def __init__(self, num_perm=128, bands=32, shingle_size=5, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm 必须是 bands 的整数倍")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text):
+        text = normalize(text)
+        if not text:
+            return np.empty(0, dtype=np.uint64)
+        k = min(self.shingle_size, len(text))
+        hashes = {zlib.crc32(text[i:i + k].encode('utf-8')) for i in range(len(text) - k + 1)}
+        return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+    def signature(self, text):
+        """返回 num_perm 个 uint32 组成的签名；正文为空 (只有标点空白) 时返回 None。"""
+        hashes = self.shingles(text)
+        if not hashes.size:
+            return None
+        permuted = (np.outer(hashes, self._a) + self._b) % _PRIME
+        return permuted.min(axis=0).astype(np.uint32)
+
+    @staticmethod
+    def _key(*parts):
+        digest = hashlib.blake2b(b''.join(parts), digest_size=8).digest()
+        return int.from_bytes(digest, 'big', signed=True)
+
+    def topic_key(self, topic):
+        """题目的 64 位哈希 (有符号，可直接存入 BIGINT)。"""
+        return self._key(normalize(topic).encode('utf-8'))
+
+    def band_keys(self, signature, topic):
+        """签名各段的分桶键 (BIGINT)，键中包含题目，只有同一题目的作文会落入同一个桶。"""
+        topic_part = self.topic_key(topic).to_bytes(8, 'big', signed=True)
+        return [
+            self._key(topic_part, band.to_bytes(2, 'big'),
+                      signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    @staticmethod
+    def similarity(a, b):
+        """两个签名估计出的 Jaccard 相似度。"""
+        return float(np.count_nonzero(a == b)) / len(a)
+
+    @staticmethod
+    def to_bytes(signature):
+        return signature.astype('<u4').tobytes()
+
+    @staticmethod
+    def from_bytes(data):
+        return np.frombuffer(bytes(data), dtype='<u4')
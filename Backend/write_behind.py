@@ -0,0 +1,411 @@
+import fcntl
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+WRITTEN = 'written'
+SPILLED = 'spilled'
+REJECTED = 'rejected'
+
+
+class BufferFull(Exception):
+    pass
+
+
+class _Entry:
+    """一次提交 (同一请求的若干条记录)，写入数据库或溢写到文件后 done 被置位。"""
+
+    def __init__(self, records):
+        self.records = records
+        self.status = None
+        self.done = threading.Event()
+
+    def finish(self, status):
+        self.status = status
+        self.done.set()
+
+
+class SpillFile:
+    """
+    数据库不可用时的本地追加日志：每行一条 JSON 记录。也用作死信文件，保存数据库拒绝写入的记录。
+    多个 worker 进程共用同一个文件，追加与回放都持有 flock 排他锁；
+    回放结束时把未写入的记录写回文件，中途进程退出时记录仍留在文件中，下次回放重新写入
+    (写入语句是幂等的，已写入的记录会被忽略)。
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, records):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = _dumps(records)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def replay(self, write, batch_size, is_rejected=None, reject=None):
+        """
+        把文件中的记录按 batch_size 分批交给 write(records) 写入，返回写入条数；其他进程正在回放时直接返回 0。
+        每批单独写入，因记录本身的问题被拒绝的记录交给 reject(record, error) (见 write_isolating)；
+        遇到其他错误时停止回放，把未写入的记录写回文件后原样抛出该异常，下次从这些记录继续。
+        """
+        if not self.size():
+            return 0
+        with open(self.path, 'r+', encoding='utf-8') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            try:
+                records = []
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # 进程在写入一半时退出，最后一行可能不完整
+                        logger.error(f"Skipping corrupt spill record: {line[:200]}")
+                written = 0
+                remaining = []
+                error = None
+                for start in range(0, len(records), batch_size):
+                    batch = records[start:start + batch_size]
+                    if error is None:
+                        try:
+                            written += write_isolating(write, batch, is_rejected, reject)
+                            continue
+                        except Exception as e:
+                            error = e
+                    remaining.extend(batch)
+                f.seek(0)
+                f.truncate()
+                f.write(_dumps(remaining))
+                f.flush()
+                os.fsync(f.fileno())
+                if error is not None:
+                    raise error
+                return written
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _dumps(records):
+    return ''.join(json.dumps(r, ensure_ascii=False, separators=(',', ':')) + '\n' for r in records)
+
+
+def write_isolating(write, records, is_rejected=None, reject=None):
+    """
+    写入一批记录，返回写入条数。因记录本身的问题失败 (is_rejected(error) 为真，如违反约束、字段超长) 时逐条重写，
+    仍被拒绝的记录交给 reject(record, error)，不影响同批的其他记录；其他异常原样抛出。
+    """
+    try:
+        write(records)
+        return len(records)
+    except Exception as e:
+        if is_rejected is None or not is_rejected(e):
+            raise
+        if len(records) == 1:
+            reject(records[0], e)
+            return 0
+    written = 0
+    for record in records:
+        try:
+            write([record])
+            written += 1
+        except Exception as e:
+            if not is_rejected(e):
+                raise
+            reject(record, e)
+    return written
+
+
+class WriteBehindBuffer:
+    """
+    写后缓冲：请求线程提交记录后立即返回，后台线程把队列中积攒的记录合并成一次批量写入、一次提交 (group commit)。
+
+    write(records) 在一个事务中写入一批记录，失败时按 backoff * 2^n (不超过 max_backoff) 重试 max_retries 次，
+    仍失败则把这批记录追加到溢写文件，之后每隔 replay_interval 秒 (以及进程启动时) 尝试回放。
+    只有连接中断等临时错误才重试和溢写：is_rejected(error) 为真说明是数据本身的问题 (违反约束、字段超长)，
+    此时逐条重写这批记录，被拒绝的记录移到死信文件 dead_letter_path (默认与溢写文件同目录的 *.rejected.jsonl)，
+    同批其他请求的记录照常写入。
+    write 必须是幂等的：提交成功但确认丢失时同一批记录会被再次写入。
+    队列中的记录数超过 max_depth 时，提交的记录直接溢写到文件；溢写也失败时抛出 BufferFull。
+    后台线程在 start() 或第一次 submit 时启动，gunicorn fork 出的 worker 各自启动自己的线程。
+    后台线程是守护线程，进程退出前应调用 close()：把队列中已确认但尚未写入的记录写入数据库，来不及时溢写到文件。
+    """
+
+    def __init__(self, write, spill_path, max_batch=200, linger=0.0, max_depth=10000, max_retries=3,
+                 backoff=0.2, max_backoff=5.0, replay_interval=30.0, on_flush=None, on_depth=None,
+                 is_rejected=None, dead_letter_path=None):
+        self._write = write
+        self._is_rejected = is_rejected or (lambda e: False)
+        self.spill = SpillFile(spill_path)
+        self.dead_letter = SpillFile(dead_letter_path or os.path.splitext(spill_path)[0] + '.rejected.jsonl')
+        self.max_batch = max(1, int(max_batch))
+        self.linger = linger
+        self.max_depth = max(1, int(max_depth))
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.replay_interval = replay_interval
+        self._on_flush = on_flush
+        self._on_depth = on_depth
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._closing = threading.Event()
+        self._inflight = []
+        self._depth = 0
+        self._stats = {
+            'submitted': 0,
+            'written': 0,
+            'spilled': 0,
+            'replayed': 0,
+            'rejected': 0,
+            'flushes': 0,
+            'flush_failures': 0,
+            'flush_ms_total': 0.0,
+            'flush_ms_max': 0.0,
+            'batch_max': 0,
+        }
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+            self._closing = threading.Event()
+            self._inflight = []
+            self._depth = 0
+            self._thread = threading.Thread(target=self._run, name='essay-write-behind', daemon=True)
+            self._thread.start()
+
+    def close(self, timeout=5.0):
+        """
+        停止接收新记录，最多等待 timeout 秒让后台线程写完队列中的记录；
+        仍未写入的 (包括正在写入的一批) 溢写到文件，下次启动时回放。本进程没有启动过后台线程时什么也不做。
+        """
+        if self._pid != os.getpid() or self._closing.is_set():
+            return
+        self._closing.set()
+        # 唤醒等待中的后台线程
+        self._queue.put(None)
+        self._thread.join(timeout)
+        entries = list(self._inflight) if self._thread.is_alive() else []
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not None:
+                entries.append(entry)
+        records = [r for entry in entries for r in entry.records]
+        if not records:
+            return
+        try:
+            self._spill(records)
+        except OSError as e:
+            logger.error(f"Write-behind spill on close failed, {len(records)} records lost: {e}")
+            return
+        for entry in entries:
+            entry.finish(SPILLED)
+
+    def submit(self, records):
+        """
+        提交一组记录，返回 _Entry；调用方可以用 wait() 等待它写入数据库 (或溢写到文件)。
+        close() 之后提交的记录直接溢写到文件。
+        """
+        self.start()
+        entry = _Entry(list(records))
+        with self._lock:
+            self._stats['submitted'] += len(entry.records)
+            overflow = self._closing.is_set() or self._depth + len(entry.records) > self.max_depth
+            if not overflow:
+                self._add_depth(len(entry.records))
+        if overflow:
+            try:
+                self._spill(entry.records)
+            except OSError as e:
+                raise BufferFull(f"写入缓冲已满且溢写失败: {e}")
+            entry.finish(SPILLED)
+            return entry
+        self._queue.put(entry)
+        return entry
+
+    def wait(self, entry, timeout):
+        """最多等待 timeout 秒，返回 written / spilled，仍在缓冲中时返回 None。"""
+        if timeout > 0:
+            entry.done.wait(timeout)
+        return entry.status
+
+    def _add_depth(self, n):
+        # 调用方持有 self._lock
+        self._depth += n
+        if self._on_depth:
+            self._on_depth(self._depth)
+
+    def _run(self):
+        self._replay()
+        last_replay = time.monotonic()
+        while True:
+            entries = self._take_batch()
+            if entries:
+                self._flush(entries)
+            if self._closing.is_set() and self._queue.empty():
+                return
+            if time.monotonic() - last_replay >= self.replay_interval:
+                self._replay()
+                last_replay = time.monotonic()
+
+    def _take_batch(self):
+        """取出队列中已积攒的记录 (不超过 max_batch 条)；队列为空时最多等待 replay_interval 秒。"""
+        try:
+            entry = self._queue.get(timeout=self.replay_interval)
+        except queue.Empty:
+            return []
+        # None 是 close() 放入的唤醒标记
+        if entry is None:
+            return []
+        entries = [entry]
+        count = len(entries[0].records)
+        deadline = time.monotonic() + self.linger
+        while count < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                continue
+            entries.append(entry)
+            count += len(entry.records)
+        return entries
+
+    def _flush(self, entries):
+        records = [r for entry in entries for r in entry.records]
+        self._inflight = entries
+        status, error = self._write_with_retry(records)
+        if status != REJECTED:
+            statuses = {entry: status for entry in entries}
+        elif len(records) == 1:
+            self._reject(records[0], error)
+            statuses = {entry: REJECTED for entry in entries}
+        else:
+            # 整批因某条记录本身的问题被拒绝：逐条重写，只隔离被拒绝的记录，同批其他请求的记录照常写入
+            logger.warning(f"Write-behind batch of {len(records)} records rejected, retrying one by one: {error}")
+            statuses = {}
+            for entry in entries:
+                results = set()
+                for record in entry.records:
+                    status, error = self._write_with_retry([record])
+                    if status == REJECTED:
+                        self._reject(record, error)
+                    results.add(status)
+                # 一次提交中只要有一条被拒绝 / 溢写，整个提交按最差的结果报告
+                statuses[entry] = next(outcome for outcome in (REJECTED, SPILLED, WRITTEN) if outcome in results)
+        self._inflight = []
+        with self._lock:
+            self._add_depth(-len(records))
+        for entry in entries:
+            entry.finish(statuses[entry])
+
+    def _write_with_retry(self, records):
+        """
+        写入一批记录，返回 (结果, 异常)：written；临时错误重试 max_retries 次后溢写到文件，返回 spilled；
+        数据本身的问题 (is_rejected) 不重试，返回 rejected 与该异常，由调用方处理。
+        """
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                self._write(records)
+            except Exception as e:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self._stats['flush_failures'] += 1
+                if self._on_flush:
+                    self._on_flush(elapsed, len(records), 'error')
+                if self._is_rejected(e):
+                    return REJECTED, e
+                attempt += 1
+                logger.warning(f"Write-behind flush of {len(records)} records failed (attempt {attempt}): {e}")
+                if attempt > self.max_retries:
+                    try:
+                        self._spill(records)
+                        return SPILLED, e
+                    except OSError as spill_error:
+                        # 溢写也失败时不丢弃记录，继续按最大间隔重试
+                        logger.error(f"Write-behind spill failed: {spill_error}")
+                time.sleep(min(self.backoff * 2 ** (attempt - 1), self.max_backoff))
+                continue
+            elapsed = time.perf_counter() - start
+            if self._on_flush:
+                self._on_flush(elapsed, len(records), 'ok')
+            with self._lock:
+                self._stats['written'] += len(records)
+                self._stats['flushes'] += 1
+                self._stats['flush_ms_total'] += elapsed * 1000
+                self._stats['flush_ms_max'] = max(self._stats['flush_ms_max'], elapsed * 1000)
+                self._stats['batch_max'] = max(self._stats['batch_max'], len(records))
+            return WRITTEN, None
+
+    def _reject(self, record, error):
+        """把数据库拒绝写入的记录连同错误信息移到死信文件，等待人工处理。"""
+        with self._lock:
+            self._stats['rejected'] += 1
+        logger.error(f"Write-behind record rejected, moved to {self.dead_letter.path}: {error}")
+        try:
+            self.dead_letter.append([{'error': str(error), 'record': record}])
+        except OSError as e:
+            logger.error(f"Write-behind dead-letter append failed, record dropped: {e}")
+
+    def _spill(self, records):
+        self.spill.append(records)
+        with self._lock:
+            self._stats['spilled'] += len(records)
+        logger.warning(f"Spilled {len(records)} records to {self.spill.path}")
+
+    def _replay(self):
+        try:
+            count = self.spill.replay(self._write, self.max_batch, self._is_rejected, self._reject)
+        except Exception as e:
+            logger.warning(f"Replay of {self.spill.path} failed, will retry: {e}")
+            return
+        if count:
+            with self._lock:
+                self._stats['replayed'] += count
+            logger.info(f"Replayed {count} spilled records from {self.spill.path}")
+
+    def stats(self):
+        """缓冲深度、写入 / 溢写 / 回放条数与批量写入耗时统计 (当前 worker 进程)。"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['depth'] = self._depth
+            stats['max_depth'] = self.max_depth
+        stats['flush_ms_avg'] = stats['flush_ms_total'] / stats['flushes'] if stats['flushes'] else 0.0
+        stats['spill_bytes'] = self.spill.size()
+        return stats
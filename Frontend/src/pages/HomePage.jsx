@@ -26,6 +26,34 @@ const getMockEssay = (id) => ({
 });
 
 
+/**
+ * 用刷新令牌换取新的访问令牌，成功时更新 localStorage 并返回 true
+ */
+const refreshAuthToken = async () => {
+    const refreshToken = localStorage.getItem('refreshToken');
+    if (!refreshToken) {
+        return false;
+    }
+    try {
+        const response = await fetch('/api/v1/token/refresh', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ refresh_token: refreshToken }),
+        });
+        if (!response.ok) {
+            localStorage.removeItem('authToken');
+            localStorage.removeItem('refreshToken');
+            return false;
+        }
+        const result = await response.json();
+        localStorage.setItem('authToken', result.access_token);
+        localStorage.setItem('refreshToken', result.refresh_token);
+        return true;
+    } catch {
+        return false;
+    }
+};
+
 const callApi = async (endpoint, method = 'GET', data = null) => {
     // 使用 Vite 代理，直接使用相对路径（会自动代理到 http://localhost:5000）
     const url = endpoint;
@@ -34,18 +62,28 @@ const callApi = async (endpoint, method = 'GET', data = null) => {
 
     try {
         // 对于所有 API 调用，尝试先调用真实后端
-        const fetchOptions = { method };
-        if (method === 'POST' && data !== null) {
-            if (data instanceof FormData) {
-                fetchOptions.body = data;
-            } else {
-                fetchOptions.headers = {
-                    'Content-Type': 'application/json',
-                };
-                fetchOptions.body = JSON.stringify(data);
+        const buildOptions = () => {
+            const fetchOptions = { method, headers: {} };
+            // 登录后获得的访问令牌，后端据此识别用户
+            const authToken = localStorage.getItem('authToken');
+            if (authToken) {
+                fetchOptions.headers['Authorization'] = `Bearer ${authToken}`;
+            }
+            if (method === 'POST' && data !== null) {
+                if (data instanceof FormData) {
+                    fetchOptions.body = data;
+                } else {
+                    fetchOptions.headers['Content-Type'] = 'application/json';
+                    fetchOptions.body = JSON.stringify(data);
+                }
             }
+            return fetchOptions;
+        };
+        let response = await fetch(url, buildOptions());
+        // 访问令牌过期时刷新一次后重试
+        if (response.status === 401 && await refreshAuthToken()) {
+            response = await fetch(url, buildOptions());
         }
-        const response = await fetch(url, fetchOptions);
 
         if (!response.ok) {
                 // 如果后端返回非 2xx 状态码
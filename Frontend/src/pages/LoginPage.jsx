@@ -31,7 +31,7 @@ const callLoginApi = async (username, password) => {
 
         // 检查 HTTP 状态码是否在 200-299 范围内（成功）
         if (response.ok) {
-            // 假设后端成功时返回 { access_token: "...", user: {...} }
+            // 后端成功时返回 { access_token: "...", refresh_token: "...", user: {...} }
             const result = await response.json();
 
             // 验证关键数据是否存在
@@ -40,6 +40,7 @@ const callLoginApi = async (username, password) => {
                 return {
                     success: true,
                     token: result.access_token,
+                    refreshToken: result.refresh_token,
                     user: result.user
                 };
             } else {
@@ -81,6 +82,8 @@ const LoginPage = ({ onLogin }) => {
             if (result.success) {
                 // 存储 Token 以便后续 API 请求使用
                 localStorage.setItem('authToken', result.token);
+                // 访问令牌过期后用刷新令牌换取新令牌
+                localStorage.setItem('refreshToken', result.refreshToken);
                 // 登录成功，更新父组件/全局状态
                 onLogin(result.user.username);
                 navigate('/'); // 导航到主页
@@ -0,0 +1,140 @@
+"""
+成绩统计接口的查询基准：预计算的统计表 vs. 直接按用户扫描 essays 聚合。
+
+在一个独立的数据库 (默认 essay_scoring_bench_analytics) 中通过后端的 write_essays 写入 N 篇作文
+(默认 1000000，统计表随写入增量更新)，然后对随机用户分别执行趋势、各题目统计、反馈分类查询，
+输出 p50 / p95 延迟；最后执行一次一致性检查 (analytics.check) 并输出耗时。
+
+用法 (MySQL 连接参数与后端相同，取自 MYSQL_HOST / MYSQL_USER / MYSQL_ROOT_PASSWORD)：
+    python bench/bench_analytics.py --essays 1000000 --users 1000 --queries 500
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from uuid import uuid4
+
+from bench_concurrency import percentile
+from bench_essay_storage import connect
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Backend'))
+os.environ.setdefault('SCORE_JOB_STORE', 'memory')
+os.environ.setdefault('LLM_CLIENT_WARMUP', 'false')
+os.environ['SIMILARITY_ENABLED'] = 'false'
+
+FEEDBACK = [
+    [{"type": "优点", "detail": "结构清晰，层次分明"}, {"type": "不足", "detail": "论据单薄"},
+     {"type": "建议", "detail": "补充具体事例"}],
+    [{"type": "优点", "detail": "语言生动"}, {"type": "不足", "detail": "立意不够深刻"},
+     {"type": "建议", "detail": "结尾再深入思考"}],
+    [{"type": "优点", "detail": "切题"}, {"type": "不足", "detail": "有错别字，标点使用不规范"},
+     {"type": "建议", "detail": "注意书写规范"}],
+]
+
+# 不使用统计表时的等价查询
+SCAN_QUERIES = {
+    'trend': """
+        SELECT DATE(DATE_ADD('1970-01-01', INTERVAL (timestamp DIV 1000 + 28800) SECOND)) AS day,
+               COUNT(*), SUM(score), MIN(score), MAX(score)
+        FROM essays WHERE username = %s AND timestamp >= %s GROUP BY day ORDER BY day
+    """,
+    'topics': """
+        SELECT topic, COUNT(*), SUM(score), MIN(score), MAX(score), MAX(timestamp)
+        FROM essays WHERE username = %s GROUP BY topic
+    """,
+    'feedback': """
+        SELECT JSON_EXTRACT(feedback, '$[1].detail'), COUNT(*) FROM essays WHERE username = %s
+        GROUP BY JSON_EXTRACT(feedback, '$[1].detail')
+    """,
+}
+AGGREGATE_QUERIES = {
+    'trend': "SELECT day, essays, score_sum, score_min, score_max FROM user_score_daily "
+             "WHERE username = %s AND day >= %s ORDER BY day",
+    'topics': "SELECT topic_hash, topic, essays, score_sum, score_min, score_max, last_timestamp "
+              "FROM user_topic_stats WHERE username = %s",
+    'feedback': "SELECT feedback_type, category, essays FROM user_feedback_categories WHERE username = %s",
+}
+
+
+def seed(backend, total, users, topics, days, batch=500):
+    now = int(time.time() * 1000)
+    for start in range(0, total, batch):
+        records = []
+        for _ in range(min(batch, total - start)):
+            essay = backend._essay_record(random.choice(topics), "基准测试", "正文", random.randint(20, 60),
+                                          random.choice(FEEDBACK), None, str(uuid4()))
+            essay['timestamp'] = now - random.randrange(days * 86400) * 1000
+            records.append({'username': random.choice(users), 'essay': essay})
+        backend.write_essays(records)
+        print(f"seeded {start + len(records)}/{total}", end='\r', flush=True)
+    print()
+
+
+def timed(conn, sql, params_list):
+    cursor = conn.cursor()
+    samples = []
+    for params in params_list:
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentile(samples, 50), percentile(samples, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='essay_scoring_bench_analytics')
+    parser.add_argument('--essays', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--topics', type=int, default=30)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--reuse', action='store_true', help='复用已写入的数据，不重新生成')
+    args = parser.parse_args()
+
+    admin = connect()
+    admin.cursor().execute(f"CREATE DATABASE IF NOT EXISTS {args.database} DEFAULT CHARSET utf8mb4")
+    admin.close()
+    os.environ['MYSQL_DATABASE'] = args.database
+    import app as backend
+    import analytics
+    backend.init_db()
+
+    users = [f"bench_user_{u}" for u in range(args.users)]
+    conn = connect(args.database)
+    if not args.reuse:
+        conn.cursor().executemany("INSERT IGNORE INTO users (username, password_hash) VALUES (%s, 'x')",
+                                  [(u,) for u in users])
+        conn.commit()
+        start = time.perf_counter()
+        seed(backend, args.essays, users, [f"基准题目 {t}" for t in range(args.topics)], args.days)
+        print(f"seed (with incremental aggregates): {time.perf_counter() - start:.1f}s")
+    cursor = conn.cursor()
+    cursor.execute("ANALYZE TABLE essays, user_score_daily, user_topic_stats, user_feedback_categories")
+    cursor.fetchall()
+
+    sample = [random.choice(users) for _ in range(args.queries)]
+    since_day = date.today() - timedelta(days=89)
+    since_ms = int(time.time() * 1000) - 90 * 86400 * 1000
+    print(f"{'query':10} {'mode':10} {'p50 ms':>9} {'p95 ms':>9}")
+    for name in ('trend', 'topics', 'feedback'):
+        for mode, sql in (('aggregate', AGGREGATE_QUERIES[name]), ('scan', SCAN_QUERIES[name])):
+            if name == 'trend':
+                params = [(u, since_day if mode == 'aggregate' else since_ms) for u in sample]
+            else:
+                params = [(u,) for u in sample]
+            p50, p95 = timed(conn, sql, params)
+            print(f"{name:10} {mode:10} {p50:9.2f} {p95:9.2f}")
+
+    start = time.perf_counter()
+    mismatches = analytics.check(conn.cursor(), int(backend.ANALYTICS_UTC_OFFSET_HOURS * 3600),
+                                 backend.ANALYTICS_SCORE_BUCKET)
+    print(f"\nconsistency check: {time.perf_counter() - start:.1f}s, "
+          f"{sum(len(rows) for rows in mismatches.values())} mismatched rows")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
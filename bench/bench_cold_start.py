@@ -0,0 +1,129 @@
+"""
+后端冷启动基准：导入耗时、gunicorn worker 启动到能响应第一个请求的耗时，以及第一次评分请求的耗时。
+
+每一轮分别测量：
+    import_ms   新的 Python 进程执行 `import app` 的耗时
+    ttfr_ms     启动 gunicorn (1 个 worker) 到 /metrics 第一次返回 200 的耗时 (time to first request)
+    score1_ms   第一个 /api/v1/score 请求的耗时 (大模型为本地桩服务，延迟为 0)；
+                大模型客户端改为延迟创建后，后台预热 (LLM_CLIENT_WARMUP) 尚未完成时这个请求要等待 openai SDK 导入，
+                --idle 设置 ttfr 之后、第一次评分之前的空闲秒数
+    score2_ms   第二个 /api/v1/score 请求的耗时
+
+评分结果的写入不等待数据库确认 (ESSAY_WRITE_ACK_TIMEOUT=0)，没有 MySQL 时也能测量。
+
+--backend-dir 指定要测试的后端目录，可用 git worktree 检出改造前的版本做对比：
+    git worktree add /tmp/backend-before <commit>
+    python bench/bench_cold_start.py --backend-dir /tmp/backend-before/Backend
+    python bench/bench_cold_start.py
+
+MYSQL_HOST 等数据库参数取自环境变量；设为不可达的地址 (如 10.255.255.1) 可复现
+「MySQL 尚未就绪时 worker 启动被连接超时拖慢」的情况。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from uuid import uuid4
+
+from bench_concurrency import BACKEND_DIR, BENCH_AUTH_SECRET, bench_token, free_port
+from stubs import start_stub
+
+
+def measure_import(backend_dir, env):
+    code = "import time; s = time.perf_counter(); import app; print((time.perf_counter() - s) * 1000)"
+    result = subprocess.run([sys.executable, '-c', code], cwd=backend_dir, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import app 失败：{result.stderr.strip()[-500:]}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def app_spec(backend_dir):
+    with open(os.path.join(backend_dir, 'app.py'), encoding='utf-8') as f:
+        return 'app:create_app()' if 'def create_app(' in f.read() else 'app:app'
+
+
+def score(base):
+    body = json.dumps({"username": "bench_user", "topic": "冷启动", "title": "冷启动",
+                       "content": f"冷启动作文 {uuid4().hex}"}).encode('utf-8')
+    req = urllib.request.Request(base + '/api/v1/score', data=body, headers={
+        'Content-Type': 'application/json', 'Authorization': f"Bearer {bench_token('bench_user')}"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=120) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return (time.perf_counter() - start) * 1000, status
+
+
+def measure_gunicorn(backend_dir, env, idle=0.0, timeout=120):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = dict(env, GUNICORN_BIND=f"127.0.0.1:{port}", GUNICORN_WORKERS='1')
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', app_spec(backend_dir)],
+                            cwd=backend_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                urllib.request.urlopen(base + '/metrics', timeout=1).read()
+                break
+            except OSError:
+                if proc.poll() is not None:
+                    raise RuntimeError("gunicorn 启动失败")
+                if time.perf_counter() - start > timeout:
+                    raise RuntimeError("gunicorn 启动超时")
+                time.sleep(0.005)
+        ttfr = (time.perf_counter() - start) * 1000
+        time.sleep(idle)
+        score1, status1 = score(base)
+        score2, status2 = score(base)
+        return {'ttfr_ms': ttfr, 'score1_ms': score1, 'score2_ms': score2, 'status': f"{status1}/{status2}"}
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend-dir', default=BACKEND_DIR)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--idle', type=float, default=0.0, help='第一次评分前的空闲秒数')
+    args = parser.parse_args()
+
+    server, _, stub_url = start_stub(latency=0)
+    env = dict(os.environ)
+    env.update({
+        'LLM_BASE_URL': stub_url + '/compatible-mode/v1',
+        'DASHSCOPE_API_KEY': 'stub',
+        'AUTH_SECRET_KEY': BENCH_AUTH_SECRET,
+        'SCORE_JOB_STORE': 'memory',
+        'LOG_LEVEL': 'WARNING',
+        'ESSAY_WRITE_ACK_TIMEOUT': '0',
+    })
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    rows = []
+    try:
+        for _ in range(args.rounds):
+            row = {'import_ms': measure_import(args.backend_dir, env)}
+            row.update(measure_gunicorn(args.backend_dir, env, args.idle))
+            rows.append(row)
+    finally:
+        server.shutdown()
+
+    print(f"backend: {os.path.abspath(args.backend_dir)}  rounds={args.rounds}  "
+          f"score status: {sorted(set(r['status'] for r in rows))}")
+    for key in ('import_ms', 'ttfr_ms', 'score1_ms', 'score2_ms'):
+        values = [r[key] for r in rows]
+        print(f"{key:10s} median={statistics.median(values):8.1f}  min={min(values):8.1f}  max={max(values):8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+gunicorn worker 模型并发压测：同步 worker 与 gthread worker 各能同时挂起多少个大模型调用。
+
+启动本地的 OpenAI 兼容桩服务 (每次调用固定延迟 --llm-latency 秒)，再用指定的 worker 模型
+启动 gunicorn (LLM_BASE_URL 指向桩服务)，以 --concurrency 个并发客户端向 /api/v1/score
+发送 --requests 个内容互不相同的请求 (不命中评分缓存)。输出吞吐、延迟分位数，
+以及桩服务观察到的同时在途调用数峰值。
+
+评分结果需要写入数据库，MySQL 连接参数与后端相同 (MYSQL_HOST / MYSQL_USER / MYSQL_ROOT_PASSWORD)，
+本地可先 `docker compose up -d db`。数据库不可用时请求会在大模型调用之后返回 500，
+在途调用数峰值仍然有效，状态码分布会一并打印。
+
+用法：
+    python bench/bench_concurrency.py --worker-class sync gthread --concurrency 200 --requests 600
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from stubs import start_stub
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from auth import TokenSigner  # noqa: E402
+
+# 压测时后端使用固定的令牌密钥，压测脚本可以直接签发访问令牌，不必经过登录
+BENCH_AUTH_SECRET = 'bench-secret'
+
+
+def bench_token(username):
+    return TokenSigner(BENCH_AUTH_SECRET).issue(username)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(worker_class, workers, threads, llm_base_url, extra_env=None):
+    """在空闲端口上启动后端，返回 (进程, base_url)；extra_env 用于追加后端的环境变量。"""
+    port = free_port()
+    env = dict(os.environ)
+    env.update(extra_env or {})
+    env.update({
+        'LLM_BASE_URL': llm_base_url,
+        'DASHSCOPE_API_KEY': 'stub',
+        'GUNICORN_BIND': f"127.0.0.1:{port}",
+        'GUNICORN_WORKER_CLASS': worker_class,
+        'GUNICORN_WORKERS': str(workers),
+        'GUNICORN_THREADS': str(threads),
+        'LOG_LEVEL': 'WARNING',
+        'AUTH_SECRET_KEY': BENCH_AUTH_SECRET,
+    })
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:create_app()'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(base + '/metrics', timeout=1).read()
+            return proc, base
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError("gunicorn 启动失败")
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("gunicorn 启动超时")
+
+
+def run_migrations(extra_env=None):
+    """执行 flask --app app migrate 创建表结构 (后端启动时不再自动建表)，返回是否成功。"""
+    env = dict(os.environ)
+    env.update(extra_env or {})
+    result = subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'migrate'],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    return result.returncode == 0
+
+
+def score_once(base, timeout):
+    body = json.dumps({
+        "username": "bench_user",
+        "topic": "压测题目",
+        "title": "压测",
+        "content": f"压测作文 {uuid4().hex}",
+    }).encode('utf-8')
+    req = urllib.request.Request(base + '/api/v1/score', data=body,
+                                 headers={'Content-Type': 'application/json',
+                                          'Authorization': f"Bearer {bench_token('bench_user')}"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 'error'
+    return status, (time.perf_counter() - start) * 1000
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(worker_class, args):
+    server, state, stub_url = start_stub(args.llm_latency)
+    base_url = stub_url + '/compatible-mode/v1'
+    # threads > 1 时 gunicorn 会把 sync 自动换成 gthread
+    threads = 1 if worker_class == 'sync' else args.threads
+    proc, base = start_gunicorn(worker_class, args.workers, threads, base_url)
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda _: score_once(base, args.timeout), range(args.requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.wait()
+        server.shutdown()
+
+    latencies = [ms for _, ms in results]
+    statuses = Counter(status for status, _ in results)
+    print(f"\n== worker_class={worker_class} workers={args.workers} threads={threads} ==")
+    print(f"requests={args.requests} concurrency={args.concurrency} llm_latency={args.llm_latency}s")
+    print(f"throughput: {args.requests / elapsed:.1f} req/s  wall: {elapsed:.1f}s")
+    print(f"latency ms: p50={percentile(latencies, 50):.0f} p95={percentile(latencies, 95):.0f} "
+          f"p99={percentile(latencies, 99):.0f} mean={statistics.mean(latencies):.0f}")
+    print(f"peak in-flight LLM calls: {state.peak_inflight}  (stub saw {state.requests} calls)")
+    print(f"status codes: {dict(statuses)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--worker-class', nargs='+', default=['sync', 'gthread'])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=600)
+    parser.add_argument('--llm-latency', type=float, default=2.0)
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+    for worker_class in args.worker_class:
+        run(worker_class, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+润色结果的编辑脚本 (essay_diff) 编解码速度与体积基准。
+
+以 fixtures/essays.json 中的中文作文为原文，按不同改动幅度生成润色稿：
+每句以给定概率被改写 (替换词语、补充修饰语、调整标点)，另有少量整句删除和新增。
+条目中带 revised_content 字段时同时测试这份真实的润色稿。
+输出全文与编辑脚本的 UTF-8 字节数、gzip 后字节数、编码 / 解码耗时，并校验解码结果与润色稿一致。
+
+用法：
+    python bench/bench_essay_diff.py --rounds 200
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'Backend'))
+
+import essay_diff  # noqa: E402
+
+# 模拟润色时常见的改写：换用更书面的词、补充修饰语
+REPLACEMENTS = [
+    ('很', '十分'), ('非常', '格外'), ('我觉得', '我认为'), ('高兴', '欣喜'), ('看到', '望见'),
+    ('可是', '然而'), ('所以', '因此'), ('一点也不', '丝毫不'), ('好像', '仿佛'), ('每天', '每日'),
+]
+ADDITIONS = ['静静地', '不由得', '渐渐地', '默默地', '轻轻地']
+NEW_SENTENCES = ['这段经历让我久久难忘。', '那一刻，我的心里暖暖的。', '时间仿佛在这一刻静止了。']
+
+LEVELS = {'light': 0.1, 'medium': 0.3, 'heavy': 0.7}
+
+
+def revise(text, rate, rng):
+    out = []
+    for sentence in essay_diff.split_sentences(text):
+        r = rng.random()
+        if r < rate * 0.1:
+            continue
+        if r < rate:
+            for old, new in rng.sample(REPLACEMENTS, len(REPLACEMENTS)):
+                if old in sentence:
+                    sentence = sentence.replace(old, new, 1)
+                    break
+            else:
+                cut = rng.randrange(len(sentence)) if sentence else 0
+                sentence = sentence[:cut] + rng.choice(ADDITIONS) + sentence[cut:]
+            sentence = sentence.replace('，', '；', 1) if rng.random() < 0.2 else sentence
+        out.append(sentence)
+        if rng.random() < rate * 0.05:
+            out.append(rng.choice(NEW_SENTENCES))
+    return ''.join(out)
+
+
+def measure(original, revised, rounds):
+    encode_us, decode_us = [], []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        script = essay_diff.dumps(essay_diff.encode(original, revised))
+        encode_us.append((time.perf_counter() - start) * 1e6)
+        start = time.perf_counter()
+        restored = essay_diff.apply(original, essay_diff.loads(script))
+        decode_us.append((time.perf_counter() - start) * 1e6)
+    assert restored == revised
+    full = revised.encode('utf-8')
+    diff = script.encode('utf-8')
+    return {
+        'full_bytes': len(full),
+        'diff_bytes': len(diff),
+        'full_gzip': len(gzip.compress(full)),
+        'diff_gzip': len(gzip.compress(diff)),
+        'encode_us': statistics.median(encode_us),
+        'decode_us': statistics.median(decode_us),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--essays', default=os.path.join(BENCH_DIR, 'fixtures', 'essays.json'))
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--samples', type=int, default=20, help='每篇作文、每档改动幅度生成的润色稿数')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with open(args.essays, encoding='utf-8') as f:
+        essays = json.load(f)
+
+    cases = {level: [] for level in LEVELS}
+    for essay in essays:
+        for level, rate in LEVELS.items():
+            for _ in range(args.samples):
+                cases[level].append((essay['content'], revise(essay['content'], rate, rng)))
+        if essay.get('revised_content'):
+            cases.setdefault('real', []).append((essay['content'], essay['revised_content']))
+
+    print(f"{'level':8s}{'cases':>6s}{'full_B':>9s}{'diff_B':>9s}{'ratio':>7s}{'full_gz':>9s}{'diff_gz':>9s}"
+          f"{'enc_us':>9s}{'dec_us':>9s}")
+    for level, pairs in cases.items():
+        rows = [measure(original, revised, args.rounds) for original, revised in pairs]
+        mean = {key: statistics.mean(row[key] for row in rows) for key in rows[0]}
+        print(f"{level:8s}{len(rows):>6d}{mean['full_bytes']:>9.0f}{mean['diff_bytes']:>9.0f}"
+              f"{mean['diff_bytes'] / mean['full_bytes']:>7.2f}{mean['full_gzip']:>9.0f}{mean['diff_gzip']:>9.0f}"
+              f"{mean['encode_us']:>9.0f}{mean['decode_us']:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+作文正文拆表前后的查询基准。
+
+在一个独立的数据库 (默认 essay_scoring_bench) 中写入 N 篇作文 (默认 100000)：
+  - bench_essays_inline：旧表结构，正文与元数据同在一行；
+  - essays + essay_contents：当前表结构，正文单独存放。
+然后随机抽取作文 id，分别测量「全部字段」「?fields=score,feedback」以及历史列表查询的耗时。
+
+用法 (MySQL 连接参数与后端相同，取自 MYSQL_HOST / MYSQL_USER / MYSQL_ROOT_PASSWORD)：
+    python bench/bench_essay_storage.py --essays 100000 --queries 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from uuid import uuid4
+
+import mysql.connector
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Backend'))
+
+INLINE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS bench_essays_inline (
+        id VARCHAR(36) PRIMARY KEY,
+        username VARCHAR(100) NOT NULL,
+        topic TEXT NOT NULL,
+        title VARCHAR(255),
+        original_content LONGTEXT NOT NULL,
+        score INTEGER,
+        feedback JSON,
+        revised_content LONGTEXT,
+        timestamp BIGINT,
+        INDEX idx_inline_username_timestamp (username, timestamp, id)
+    )
+"""
+
+
+def random_text(n):
+    return ''.join(chr(random.randint(0x4E00, 0x9FA5)) if i % 25 else '\n' for i in range(n))
+
+
+def connect(database=None):
+    return mysql.connector.connect(
+        host=os.getenv('MYSQL_HOST', 'localhost'),
+        port=int(os.getenv('MYSQL_PORT', '3306')),
+        user=os.getenv('MYSQL_USER', 'root'),
+        password=os.getenv('MYSQL_ROOT_PASSWORD'),
+        database=database,
+    )
+
+
+def seed(conn, total, users, batch=1000):
+    cursor = conn.cursor()
+    cursor.executemany(
+        "INSERT IGNORE INTO users (username, password_hash) VALUES (%s, 'x')",
+        [(f"bench_user_{u}",) for u in range(users)]
+    )
+    ids = []
+    now = int(time.time() * 1000)
+    for start in range(0, total, batch):
+        meta, inline, contents = [], [], []
+        for i in range(start, min(start + batch, total)):
+            essay_id = str(uuid4())
+            username = f"bench_user_{i % users}"
+            original = random_text(random.randint(600, 1200))
+            revised = random_text(random.randint(700, 1300))
+            feedback = '[{"type": "优点", "detail": "结构清晰"}, {"type": "不足", "detail": "论据单薄"}]'
+            ts = now - i * 1000
+            meta.append((essay_id, username, "基准测试题目", f"作文 {i}", 45, feedback, ts))
+            contents.append((essay_id, original, revised))
+            inline.append((essay_id, username, "基准测试题目", f"作文 {i}", original, 45, feedback, revised, ts))
+            ids.append(essay_id)
+        cursor.executemany(
+            "INSERT INTO essays (id, username, topic, title, original_content, score, feedback, revised_content, timestamp) "
+            "VALUES (%s, %s, %s, %s, '', %s, %s, NULL, %s)", meta)
+        cursor.executemany(
+            "INSERT INTO essay_contents (essay_id, original_content, revised_content) VALUES (%s, %s, %s)", contents)
+        cursor.executemany(
+            "INSERT INTO bench_essays_inline VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)", inline)
+        conn.commit()
+        print(f"seeded {min(start + batch, total)}/{total}", end='\r', flush=True)
+    print()
+    return ids
+
+
+def timed(conn, sql, params_list):
+    cursor = conn.cursor()
+    samples = []
+    for params in params_list:
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'p50': statistics.median(samples),
+        'p95': samples[int(len(samples) * 0.95) - 1],
+        'mean': statistics.fmean(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='essay_scoring_bench')
+    parser.add_argument('--essays', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--reuse', action='store_true', help='复用已写入的数据，不重新生成')
+    args = parser.parse_args()
+
+    admin = connect()
+    admin.cursor().execute(f"CREATE DATABASE IF NOT EXISTS {args.database} DEFAULT CHARSET utf8mb4")
+    admin.close()
+
+    # 复用后端的建表逻辑
+    os.environ['MYSQL_DATABASE'] = args.database
+    import app as backend
+    backend.init_db()
+
+    conn = connect(args.database)
+    conn.cursor().execute(INLINE_TABLE_SQL)
+    if args.reuse:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM essays")
+        ids = [row[0] for row in cursor.fetchall()]
+    else:
+        ids = seed(conn, args.essays, args.users)
+
+    cursor = conn.cursor()
+    cursor.execute("ANALYZE TABLE essays, essay_contents, bench_essays_inline")
+    cursor.fetchall()
+    sample = [(random.choice(ids),) for _ in range(args.queries)]
+    user_sample = [(f"bench_user_{random.randrange(args.users)}",) for _ in range(max(1, args.queries // 10))]
+
+    cases = [
+        ("inline   full detail", "SELECT * FROM bench_essays_inline WHERE id = %s", sample),
+        ("inline   score,feedback", "SELECT id, score, feedback FROM bench_essays_inline WHERE id = %s", sample),
+        ("split    full detail",
+         "SELECT e.id, e.topic, e.title, e.score, e.feedback, e.timestamp, "
+         "COALESCE(c.original_content, e.original_content), COALESCE(c.revised_content, e.revised_content) "
+         "FROM essays e LEFT JOIN essay_contents c ON c.essay_id = e.id WHERE e.id = %s", sample),
+        ("split    score,feedback", "SELECT e.id, e.score, e.feedback FROM essays e WHERE e.id = %s", sample),
+        ("inline   history page",
+         "SELECT id, title, timestamp FROM bench_essays_inline WHERE username = %s "
+         "ORDER BY timestamp DESC, id DESC LIMIT 20", user_sample),
+        ("split    history page",
+         "SELECT id, title, timestamp FROM essays WHERE username = %s "
+         "ORDER BY timestamp DESC, id DESC LIMIT 20", user_sample),
+    ]
+    print(f"{'case':28} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for name, sql, params in cases:
+        r = timed(conn, sql, params)
+        print(f"{name:28} {r['p50']:8.3f} {r['p95']:8.3f} {r['mean']:8.3f}")
+
+    cursor.execute(
+        "SELECT table_name, data_length, index_length FROM information_schema.tables "
+        "WHERE table_schema = DATABASE() AND table_name IN ('essays', 'essay_contents', 'bench_essays_inline')"
+    )
+    print(f"\n{'table':24} {'data MB':>10} {'index MB':>10}")
+    for name, data_length, index_length in cursor.fetchall():
+        print(f"{name:24} {data_length / 2**20:10.1f} {index_length / 2**20:10.1f}")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+登录密码哈希对同进程其他请求的影响：哈希在请求线程中直接计算 vs. 放到密码哈希线程池 (PasswordHasher)。
+
+在一个进程内用多个线程模拟 gthread worker 的工作线程：
+--logins 个线程不停调用 /api/v1/login，--readers 个线程不停带令牌读取 /api/v1/history/<username>，
+持续 --duration 秒，输出登录吞吐、读请求吞吐与读请求 p50 / p95 / p99 延迟。
+数据库替换为内存中的固定数据，只比较 CPU 争用，不需要 MySQL 和大模型。
+
+各模式：
+    inline   PASSWORD_HASH_WORKERS=0，请求线程直接计算哈希 (改造前的行为)
+    pool     1 个哈希线程，nice 0
+    pool+nice 1 个哈希线程，nice 10 (默认配置)
+
+用法：
+    python bench/bench_login.py --logins 8 --readers 8 --duration 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'Backend'))
+os.environ.setdefault('SCORE_JOB_STORE', 'memory')
+
+import app as backend  # noqa: E402
+from auth import PasswordHasher  # noqa: E402
+from bench_concurrency import percentile  # noqa: E402
+
+USERNAME = 'bench_login'
+PASSWORD = 'bench_password'
+MODES = {
+    'inline': {'workers': 0, 'nice': 0},
+    'pool': {'workers': 1, 'nice': 0},
+    'pool+nice': {'workers': 1, 'nice': 10},
+}
+
+
+class FakeCursor:
+    def __init__(self, password_hash, history):
+        self.password_hash = password_hash
+        self.history = history
+        self.row = None
+
+    def execute(self, sql, params=()):
+        if 'FROM users' in sql:
+            self.row = {'username': USERNAME, 'password_hash': self.password_hash}
+        else:
+            self.row = self.history[0]
+
+    def fetchone(self):
+        return self.row
+
+    def fetchall(self):
+        return self.history
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, password_hash, history):
+        self.password_hash = password_hash
+        self.history = history
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self.password_hash, self.history)
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+def run_mode(app, name, options, args, token):
+    backend.password_hasher = PasswordHasher(
+        backend.password_hasher.hash_func, backend.password_hasher.check_func,
+        workers=options['workers'], max_pending=args.logins + 1, nice=options['nice'])
+    client = app.test_client()
+    stop = threading.Event()
+    logins = []
+    reads = []
+    errors = []
+
+    def login_loop():
+        while not stop.is_set():
+            response = client.post('/api/v1/login', json={'username': USERNAME, 'password': PASSWORD})
+            if response.status_code == 200:
+                logins.append(1)
+            else:
+                errors.append(response.status_code)
+
+    def read_loop():
+        headers = {'Authorization': f"Bearer {token}"}
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = client.get(f"/api/v1/history/{USERNAME}?limit=20", headers=headers)
+            if response.status_code == 200:
+                reads.append((time.perf_counter() - start) * 1000)
+            else:
+                errors.append(response.status_code)
+
+    threads = ([threading.Thread(target=login_loop) for _ in range(args.logins)]
+               + [threading.Thread(target=read_loop) for _ in range(args.readers)])
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {
+        'mode': name,
+        'login_rps': len(logins) / args.duration,
+        'read_rps': len(reads) / args.duration,
+        'read_p50': percentile(reads, 50) if reads else 0,
+        'read_p95': percentile(reads, 95) if reads else 0,
+        'read_p99': percentile(reads, 99) if reads else 0,
+        'read_mean': statistics.mean(reads) if reads else 0,
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=8, help='并发登录线程数')
+    parser.add_argument('--readers', type=int, default=8, help='并发读请求线程数')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    password_hash = backend.password_hasher.hash_func(PASSWORD)
+    history = [{'id': f"essay-{i}", 'title': f"作文 {i}", 'timestamp': 1700000000000 - i} for i in range(21)]
+    backend.get_db_connection = lambda: FakeConnection(password_hash, history)
+    token = backend.token_signer.issue(USERNAME)
+    app = backend.create_app()
+
+    print(f"cpus={os.cpu_count()} logins={args.logins} readers={args.readers} duration={args.duration}s")
+    print(f"{'mode':10s}{'login/s':>9s}{'read/s':>9s}{'p50_ms':>9s}{'p95_ms':>9s}{'p99_ms':>9s}{'errors':>8s}")
+    for name in args.modes:
+        r = run_mode(app, name, MODES[name], args, token)
+        print(f"{name:10s}{r['login_rps']:>9.2f}{r['read_rps']:>9.0f}{r['read_p50']:>9.1f}"
+              f"{r['read_p95']:>9.1f}{r['read_p99']:>9.1f}{r['errors']:>8d}")
+
+
+if __name__ == '__main__':
+    main()
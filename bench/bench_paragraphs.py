@@ -0,0 +1,131 @@
+"""
+OCR 段落切分的准确率与耗时基准。
+
+数据：
+  - bench/fixtures/ocr_pages.json 中录制的 words_result (来自 test.py 的真实识别结果)；
+  - 按随机种子生成的模拟页面：几百行、带拍照倾斜 (±4°)、左边距抖动、居中标题和短尾行。
+对比原来基于相邻行 left 差值的分类方法 (baseline) 与 paragraphs.segment_pages。
+准确率按段首行计算 precision / recall；任一录制样例切分错误时以非零状态退出。
+
+用法：
+    python bench/bench_paragraphs.py --pages 200 --lines 300
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'Backend'))
+from paragraphs import segment_pages  # noqa: E402
+
+
+def baseline_starts(pages):
+    """原 classify_left_baselines_by_index 的逻辑：按相邻两行 left 的差值在两类之间切换。"""
+    lefts, heights = [], []
+    for page in pages:
+        for item in page:
+            lefts.append(item['location']['left'])
+            heights.append(item['location']['height'])
+    if not lefts:
+        return []
+    tolerance = 1.5 * sum(heights) / len(heights)
+    clusters = [[0], []]
+    current = 0
+    min_lefts = [lefts[0], 9999999999]
+    for i in range(1, len(lefts)):
+        if abs(lefts[i] - lefts[i - 1]) > tolerance:
+            current = 1 - current
+        clusters[current].append(i)
+        min_lefts[current] = min(min_lefts[current], lefts[i])
+    indent = set(clusters[0] if min_lefts[0] > min_lefts[1] else clusters[1])
+    return [i in indent for i in range(len(lefts))]
+
+
+def synthetic_page(rng, lines, height=48, char_width=46):
+    """返回 (words_result, 段首行下标集合)。"""
+    angle = math.radians(rng.uniform(-4, 4))
+    margin = rng.uniform(60, 140)
+    items, starts = [], set()
+    top = rng.uniform(20, 60)
+    i = 0
+    while i < lines:
+        para_len = rng.randint(2, 12)
+        for j in range(min(para_len, lines - i)):
+            indent = 2 * char_width if j == 0 else 0
+            if j == 0:
+                starts.add(i)
+            width = rng.uniform(700, 900) if j < para_len - 1 else rng.uniform(80, 600)
+            x = margin + indent + rng.gauss(0, 6)
+            # 绕页面左上角旋转，模拟拍照倾斜
+            left = x * math.cos(angle) - top * math.sin(angle) + 200
+            y = x * math.sin(angle) + top * math.cos(angle)
+            items.append({'location': {'top': int(y), 'left': int(left), 'height': int(height + rng.gauss(0, 2)),
+                                       'width': int(width)}, 'words': f"第{i}行"})
+            top += height * 1.5
+            i += 1
+    return items, starts
+
+
+def score(predicted, expected):
+    predicted = {i for i, flag in enumerate(predicted) if flag}
+    tp = len(predicted & expected)
+    precision = tp / len(predicted) if predicted else 1.0
+    recall = tp / len(expected) if expected else 1.0
+    return precision, recall, predicted == expected
+
+
+def evaluate(name, cases, fn):
+    total_p = total_r = exact = 0
+    elapsed = 0.0
+    for pages, expected in cases:
+        start = time.perf_counter()
+        predicted = fn(pages)
+        elapsed += time.perf_counter() - start
+        p, r, ok = score(predicted, expected)
+        total_p += p
+        total_r += r
+        exact += ok
+    n = len(cases)
+    lines = sum(len(page) for pages, _ in cases for page in pages)
+    print(f"{name:34} precision {total_p / n:6.3f}  recall {total_r / n:6.3f}  "
+          f"exact {exact}/{n}  {elapsed / lines * 1e6:7.2f} us/line")
+    return exact == n
+
+
+def engine_starts(pages):
+    return [flag for _, flag in segment_pages(pages)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--lines', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with open(os.path.join(HERE, 'fixtures', 'ocr_pages.json'), encoding='utf-8') as f:
+        fixtures = json.load(f)
+    recorded = [(fx['pages'], set(fx['expected_starts'])) for fx in fixtures]
+
+    rng = random.Random(args.seed)
+    synthetic = []
+    for _ in range(args.pages):
+        page, starts = synthetic_page(rng, args.lines)
+        synthetic.append(([page], starts))
+
+    print(f"recorded fixtures ({len(recorded)} cases)")
+    evaluate("  baseline (adjacent-line switch)", recorded, baseline_starts)
+    recorded_ok = evaluate("  paragraphs.segment_pages", recorded, engine_starts)
+    print(f"synthetic skewed pages ({args.pages} x {args.lines} lines)")
+    evaluate("  baseline (adjacent-line switch)", synthetic, baseline_starts)
+    evaluate("  paragraphs.segment_pages", synthetic, engine_starts)
+    if not recorded_ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
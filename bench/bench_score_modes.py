@@ -0,0 +1,72 @@
+"""
+各评分模式 (score / feedback / full) 以及按需润色 (rewrite) 的 token 用量与耗时对比。
+
+直接调用后端的评分函数 (绕过缓存)，对 fixtures/essays.json 中的每篇作文在每种模式下各调用 --rounds 次，
+输出每种模式的平均耗时、p50 / p95 与平均 prompt / completion token 数。
+
+默认调用真实的 DashScope 接口 (需要 DASHSCOPE_API_KEY，会产生费用)；
+设置 LLM_BASE_URL 可改为其他 OpenAI 兼容服务。
+
+用法：
+    python bench/bench_score_modes.py --rounds 3
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'Backend'))
+
+import app as backend  # noqa: E402
+
+MODES = ('score', 'feedback', 'full', 'rewrite')
+
+
+def call(mode, essay):
+    """调用一次大模型，返回 (耗时毫秒, prompt_tokens, completion_tokens)。"""
+    if mode == 'rewrite':
+        messages = backend._build_rewrite_messages(essay['topic'], essay['content'])
+        schema = backend.REWRITE_RESPONSE_SCHEMA
+    else:
+        messages = backend._build_score_messages(essay['topic'], essay['content'], mode)
+        schema = backend.SCORE_RESPONSE_SCHEMAS[mode]
+    start = time.perf_counter()
+    response = backend.get_llm_client().chat.completions.create(
+        model=backend.LLM_MODEL,
+        messages=messages,
+        response_format={"type": "json_object", "schema": schema}
+    )
+    elapsed = (time.perf_counter() - start) * 1000
+    json.loads(response.choices[0].message.content)
+    usage = response.usage
+    return elapsed, usage.prompt_tokens, usage.completion_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--essays', default=os.path.join(BENCH_DIR, 'fixtures', 'essays.json'))
+    args = parser.parse_args()
+
+    if backend.get_llm_client() is None:
+        raise SystemExit("LLM 客户端未初始化，请设置 DASHSCOPE_API_KEY")
+    with open(args.essays, encoding='utf-8') as f:
+        essays = json.load(f)
+
+    print(f"{'mode':10s}{'calls':>6s}{'mean_ms':>10s}{'p50_ms':>10s}{'p95_ms':>10s}"
+          f"{'prompt':>9s}{'completion':>12s}")
+    for mode in args.modes:
+        samples = [call(mode, essay) for _ in range(args.rounds) for essay in essays]
+        latencies = sorted(s[0] for s in samples)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"{mode:10s}{len(samples):>6d}{statistics.mean(latencies):>10.0f}"
+              f"{statistics.median(latencies):>10.0f}{p95:>10.0f}"
+              f"{statistics.mean(s[1] for s in samples):>9.0f}{statistics.mean(s[2] for s in samples):>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+作文搜索基准：ngram 全文索引 (SEARCH_SQL) 与 LIKE '%关键词%' 全表扫描的对比。
+
+在一个独立的数据库 (默认 essay_scoring_bench_search) 中写入 N 篇作文 (默认 100000)，
+正文为随机汉字，并按不同比例混入几个固定短语 (常见 / 少见 / 罕见 / 不存在)，
+然后对每个短语随机抽取用户执行搜索，输出各短语的命中数、p50 / p95 延迟以及表与索引大小。
+
+用法 (MySQL 连接参数与后端相同，取自 MYSQL_HOST / MYSQL_USER / MYSQL_ROOT_PASSWORD)：
+    python bench/bench_search.py --essays 100000 --users 50 --queries 200
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from uuid import uuid4
+
+from bench_essay_storage import connect, random_text
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Backend'))
+
+# (短语, 混入的作文比例)
+PHRASES = [
+    ("春天", 0.2),
+    ("汶川地震", 0.02),
+    ("量子纠缠", 0.001),
+    ("不存在的短语", 0.0),
+]
+
+LIKE_SQL = """
+    SELECT e.id, e.title, e.timestamp
+    FROM essays e LEFT JOIN essay_contents c ON c.essay_id = e.id
+    WHERE e.username = %s AND (e.title LIKE %s OR e.topic LIKE %s OR c.original_content LIKE %s)
+    ORDER BY e.timestamp DESC, e.id DESC
+    LIMIT 20
+"""
+
+
+def essay_text():
+    text = random_text(random.randint(600, 1200))
+    for phrase, ratio in PHRASES:
+        if random.random() < ratio:
+            at = random.randrange(len(text))
+            text = text[:at] + phrase + text[at:]
+    return text
+
+
+def seed(backend, conn, total, users, batch=1000):
+    cursor = conn.cursor()
+    cursor.executemany(
+        "INSERT IGNORE INTO users (username, password_hash) VALUES (%s, 'x')",
+        [(f"bench_user_{u}",) for u in range(users)]
+    )
+    now = int(time.time() * 1000)
+    for start in range(0, total, batch):
+        meta, contents = [], []
+        for i in range(start, min(start + batch, total)):
+            essay_id = str(uuid4())
+            # 少量作文的标题含短语，验证标题命中排在前面
+            title = f"作文 {i} {PHRASES[1][0]}" if random.random() < 0.002 else f"作文 {i}"
+            meta.append((essay_id, f"bench_user_{i % users}", "基准测试题目", title, 45, '[]', now - i * 1000))
+            contents.append((essay_id, essay_text(), None, None))
+        cursor.executemany(backend.ESSAY_INSERT_SQL, meta)
+        cursor.executemany(backend.ESSAY_CONTENT_INSERT_SQL, contents)
+        conn.commit()
+        print(f"seeded {min(start + batch, total)}/{total}", end='\r', flush=True)
+    print()
+
+
+def timed(conn, queries):
+    cursor = conn.cursor()
+    samples, hits = [], 0
+    for sql, params in queries:
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        hits += len(cursor.fetchall())
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'p50': statistics.median(samples),
+        'p95': samples[max(int(len(samples) * 0.95) - 1, 0)],
+        'hits': hits / len(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='essay_scoring_bench_search')
+    parser.add_argument('--essays', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=200, help='每个短语、每种查询方式的查询次数')
+    parser.add_argument('--reuse', action='store_true', help='复用已写入的数据，不重新生成')
+    args = parser.parse_args()
+
+    admin = connect()
+    admin.cursor().execute(f"CREATE DATABASE IF NOT EXISTS {args.database} DEFAULT CHARSET utf8mb4")
+    admin.close()
+
+    # 复用后端的建表与全文索引迁移
+    os.environ['MYSQL_DATABASE'] = args.database
+    import app as backend
+    backend.init_db()
+
+    conn = connect(args.database)
+    if not args.reuse:
+        seed(backend, conn, args.essays, args.users)
+    cursor = conn.cursor()
+    cursor.execute("ANALYZE TABLE essays, essay_contents")
+    cursor.fetchall()
+    # 新写入的行先进入全文索引缓存，OPTIMIZE 把它们合并进磁盘上的索引，模拟长期运行后的状态
+    cursor.execute("SET GLOBAL innodb_optimize_fulltext_only = ON")
+    cursor.execute("OPTIMIZE TABLE essays, essay_contents")
+    cursor.fetchall()
+    cursor.execute("SET GLOBAL innodb_optimize_fulltext_only = OFF")
+
+    print(f"{'phrase':14} {'mode':9} {'p50 ms':>9} {'p95 ms':>9} {'hits/query':>11}")
+    for phrase, _ in PHRASES:
+        query, terms = backend.build_search_query(phrase)
+        users = [f"bench_user_{random.randrange(args.users)}" for _ in range(args.queries)]
+        fulltext = [(backend.SEARCH_SQL, {'first': terms[0], 'query': query, 'weight': backend.SEARCH_TITLE_WEIGHT,
+                                          'username': u, 'limit': 20, 'offset': 0}) for u in users]
+        like = [(LIKE_SQL, (u, f"%{phrase}%", f"%{phrase}%", f"%{phrase}%")) for u in users]
+        for mode, queries in (('fulltext', fulltext), ('like', like)):
+            r = timed(conn, queries)
+            print(f"{phrase:14} {mode:9} {r['p50']:9.2f} {r['p95']:9.2f} {r['hits']:11.1f}")
+
+    cursor.execute(
+        "SELECT table_name, data_length, index_length FROM information_schema.tables "
+        "WHERE table_schema = DATABASE() AND table_name IN ('essays', 'essay_contents')"
+    )
+    print(f"\n{'table':24} {'data MB':>10} {'index MB':>10}")
+    for name, data_length, index_length in cursor.fetchall():
+        print(f"{name:24} {data_length / 2**20:10.1f} {index_length / 2**20:10.1f}")
+    # 全文索引存放在独立的辅助表 (fts_*) 中，不计入 index_length
+    cursor.execute(
+        "SELECT SUM(file_size) FROM information_schema.innodb_tablespaces "
+        "WHERE name LIKE CONCAT(DATABASE(), '/fts\\_%')"
+    )
+    print(f"{'fulltext aux tables':24} {'':>10} {(cursor.fetchone()[0] or 0) / 2**20:10.1f}")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
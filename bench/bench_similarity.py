@@ -0,0 +1,187 @@
+"""
+近似重复检测索引的基准：随语料规模增长，写入 (签名 + 分桶键) 与查询相似作文的耗时。
+
+语料为随机汉字作文，分布在 --topics 个题目下，其中 --copy-ratio 比例的作文由已有作文改写而来
+(随机删去、插入若干片段)，用来检验召回率。语料每增长到一个检查点 (--checkpoints)，
+用 --queries 篇「改写过的已有作文」查询，输出：
+    insert_ms   每篇作文计算签名与分桶键 (并写入索引) 的平均耗时
+    lsh_ms      LSH 查询的 p50 / p95 耗时 (按分桶键取候选再用签名估计相似度)
+    brute_ms    同一题目下逐篇比较签名的 p50 耗时 (没有 LSH 时的做法，只在内存模式下测量)
+    recall      被改写的原作文出现在查询结果中的比例
+
+默认在内存中模拟 essay_lsh / essay_minhash 两张表，不需要 MySQL；
+--mysql 时通过后端的 write_essays / find_similar_essays 读写独立数据库 (默认 essay_scoring_bench_similarity)，
+连接参数与后端相同，取自 MYSQL_HOST / MYSQL_USER / MYSQL_ROOT_PASSWORD。
+
+用法：
+    python bench/bench_similarity.py --checkpoints 1000 10000 100000
+    python bench/bench_similarity.py --mysql --checkpoints 1000 10000 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from uuid import uuid4
+
+import numpy as np
+
+from bench_concurrency import percentile
+from bench_essay_storage import random_text
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Backend'))
+os.environ.setdefault('SCORE_JOB_STORE', 'memory')
+os.environ.setdefault('LLM_CLIENT_WARMUP', 'false')
+
+
+def rewrite(text, edits=8):
+    """随机删去、插入若干短片段，模拟抄袭时的改写。"""
+    for _ in range(edits):
+        at = random.randrange(len(text))
+        if random.random() < 0.5:
+            text = text[:at] + text[at + random.randint(1, 10):]
+        else:
+            text = text[:at] + random_text(random.randint(1, 10)) + text[at:]
+    return text
+
+
+class MemoryIndex:
+    """内存中的 essay_minhash / essay_lsh，查询逻辑与 find_similar_essays 相同。"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.signatures = {}
+        self.by_topic = {}
+        self.buckets = {}
+
+    def add(self, essay_id, topic, content):
+        rows = self.backend.similarity_index_rows(essay_id, topic, content)
+        if not rows:
+            return
+        (essay_id, topic_key, signature), lsh_rows = rows
+        self.signatures[essay_id] = self.backend.MinHasher.from_bytes(signature)
+        self.by_topic.setdefault(topic_key, []).append(essay_id)
+        for band_key, _ in lsh_rows:
+            self.buckets.setdefault(band_key, []).append(essay_id)
+
+    def query(self, topic, content):
+        m = self.backend.minhasher
+        signature = m.signature(content)
+        hits = {}
+        for key in m.band_keys(signature, topic):
+            for essay_id in self.buckets.get(key, ()):
+                hits[essay_id] = hits.get(essay_id, 0) + 1
+        candidates = sorted(hits, key=hits.get, reverse=True)[:self.backend.SIMILARITY_MAX_CANDIDATES]
+        return self._rank(signature, candidates)
+
+    def brute_force(self, topic, content):
+        m = self.backend.minhasher
+        signature = m.signature(content)
+        ids = self.by_topic.get(m.topic_key(topic), [])
+        if not ids:
+            return []
+        matrix = np.stack([self.signatures[i] for i in ids])
+        scores = (matrix == signature).mean(axis=1)
+        return [ids[i] for i in np.argsort(-scores)[:self.backend.SIMILARITY_TOP_K]
+                if scores[i] >= self.backend.SIMILARITY_THRESHOLD]
+
+    def _rank(self, signature, candidates):
+        scored = [(self.backend.MinHasher.similarity(signature, self.signatures[i]), i) for i in candidates]
+        scored = [item for item in scored if item[0] >= self.backend.SIMILARITY_THRESHOLD]
+        return [i for _, i in sorted(scored, reverse=True)[:self.backend.SIMILARITY_TOP_K]]
+
+
+class MySQLIndex:
+    """通过后端函数读写数据库中的索引表。"""
+
+    def __init__(self, backend, users):
+        self.backend = backend
+        self.users = users
+
+    def add_batch(self, essays):
+        records = [{'username': random.choice(self.users),
+                    'essay': self.backend._essay_record(topic, "基准测试", content, 45, [], None, essay_id)}
+                   for essay_id, topic, content in essays]
+        self.backend.write_essays(records)
+
+    def query(self, topic, content):
+        return [item['id'] for item in self.backend.find_similar_essays(topic, content) or []]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoints', type=int, nargs='+', default=[1000, 10000, 50000, 100000])
+    parser.add_argument('--topics', type=int, default=20)
+    parser.add_argument('--copy-ratio', type=float, default=0.05)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--mysql', action='store_true', help='读写 MySQL 中的索引表')
+    parser.add_argument('--database', default='essay_scoring_bench_similarity')
+    args = parser.parse_args()
+
+    if args.mysql:
+        from bench_essay_storage import connect
+        admin = connect()
+        admin.cursor().execute(f"CREATE DATABASE IF NOT EXISTS {args.database} DEFAULT CHARSET utf8mb4")
+        admin.close()
+        os.environ['MYSQL_DATABASE'] = args.database
+    import app as backend
+
+    if args.mysql:
+        backend.init_db()
+        users = [f"bench_user_{u}" for u in range(50)]
+        conn = backend.get_db_connection()
+        conn.cursor().executemany("INSERT IGNORE INTO users (username, password_hash) VALUES (%s, 'x')",
+                                  [(u,) for u in users])
+        conn.commit()
+        conn.close()
+        index = MySQLIndex(backend, users)
+    else:
+        index = MemoryIndex(backend)
+
+    topics = [f"基准题目 {t}" for t in range(args.topics)]
+    corpus = []
+    print(f"mode={'mysql' if args.mysql else 'memory'} topics={args.topics} copy_ratio={args.copy_ratio}")
+    print(f"{'essays':>8} {'insert_ms':>10} {'lsh_p50':>8} {'lsh_p95':>8} {'brute_p50':>10} {'recall':>7}")
+    for checkpoint in sorted(args.checkpoints):
+        batch = []
+        insert_ms = []
+        while len(corpus) < checkpoint:
+            if corpus and random.random() < args.copy_ratio:
+                _, topic, source = random.choice(corpus)
+                content = rewrite(source)
+            else:
+                topic, content = random.choice(topics), random_text(random.randint(600, 1200))
+            essay = (str(uuid4()), topic, content)
+            corpus.append(essay)
+            if args.mysql:
+                batch.append(essay)
+                if len(batch) == 200 or len(corpus) == checkpoint:
+                    start = time.perf_counter()
+                    index.add_batch(batch)
+                    insert_ms.append((time.perf_counter() - start) * 1000 / len(batch))
+                    batch = []
+            else:
+                start = time.perf_counter()
+                index.add(*essay)
+                insert_ms.append((time.perf_counter() - start) * 1000)
+
+        lsh_ms, brute_ms, found = [], [], 0
+        for _ in range(args.queries):
+            essay_id, topic, source = random.choice(corpus)
+            content = rewrite(source)
+            start = time.perf_counter()
+            result = index.query(topic, content)
+            lsh_ms.append((time.perf_counter() - start) * 1000)
+            found += essay_id in result
+            if not args.mysql:
+                start = time.perf_counter()
+                index.brute_force(topic, content)
+                brute_ms.append((time.perf_counter() - start) * 1000)
+        brute = f"{statistics.median(brute_ms):10.2f}" if brute_ms else f"{'-':>10}"
+        print(f"{len(corpus):8d} {statistics.fmean(insert_ms):10.3f} {percentile(lsh_ms, 50):8.2f} "
+              f"{percentile(lsh_ms, 95):8.2f} {brute} {found / args.queries:7.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""
+后端压测套件：不消耗 DashScope / 百度额度，在本机复现各接口的吞吐与延迟。
+
+1. 启动 stubs.py 中的桩服务 (大模型 + 百度 OCR)，延迟、生成速度、错误率均可配置；
+2. 用 gunicorn.conf.py 启动后端，LLM_BASE_URL / OCR_BASE_URL 指向桩服务；
+3. 注册并登录压测用户，之后的请求都带上访问令牌；
+4. 依次对 score / ocr / history / essay / login 场景，在每个并发档位下发送固定数量的请求，
+   输出 p50 / p95 / p99 延迟、每秒请求数和状态码分布，可选写入 JSON 文件便于对比。
+
+数据库使用本地 MySQL 容器 (连接参数同后端，默认对应 bench/docker-compose.yml)：
+    docker compose -f bench/docker-compose.yml up -d
+    python bench/loadtest.py --concurrency 1 10 50 --requests 200 --output result.json
+
+评分请求的正文带有本次运行的随机前缀，OCR 图片逐张生成，避免命中评分缓存和 OCR 缓存；
+--seed 固定桩服务的错误注入序列和请求内容。
+"""
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from PIL import Image, ImageDraw
+
+from bench_concurrency import percentile, run_migrations, start_gunicorn
+from stubs import start_stub
+
+SCENARIOS = ('score', 'ocr', 'history', 'essay', 'login')
+
+PASSWORD = 'bench_password'
+
+BENCH_DB_ENV = {
+    'MYSQL_HOST': '127.0.0.1',
+    'MYSQL_PORT': '3307',
+    'MYSQL_USER': 'root',
+    'MYSQL_ROOT_PASSWORD': 'bench',
+    'MYSQL_DATABASE': 'essay_scoring',
+}
+
+
+def http(method, url, body=None, headers=None, timeout=300):
+    """发送一个请求，返回 (状态码, 响应体, 耗时毫秒)；连接失败时状态码为 'error'。"""
+    req = urllib.request.Request(url, data=body, method=method, headers=headers or {})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            data = resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        data = e.read()
+        status = e.code
+    except OSError:
+        data = b''
+        status = 'error'
+    return status, data, (time.perf_counter() - start) * 1000
+
+
+def post_json(url, payload, timeout=300, headers=None):
+    return http('POST', url, json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+                {'Content-Type': 'application/json', **(headers or {})}, timeout)
+
+
+def multipart(field, filename, content, content_type):
+    boundary = uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode('utf-8') + content + f"\r\n--{boundary}--\r\n".encode('ascii')
+    return body, {'Content-Type': f"multipart/form-data; boundary={boundary}"}
+
+
+def make_page(rng, width=1200, height=1600):
+    """生成一张模拟作文纸的 JPEG：横线加随机笔画，每张内容不同。"""
+    image = Image.new('L', (width, height), 245)
+    draw = ImageDraw.Draw(image)
+    for y in range(120, height - 80, 64):
+        draw.line((60, y, width - 60, y), fill=200, width=2)
+        x = 80 + rng.randint(0, 1) * 60
+        while x < width - 120:
+            w = rng.randint(20, 40)
+            draw.rectangle((x, y - 44, x + w, y - 8), outline=rng.randint(20, 80), width=3)
+            x += w + rng.randint(6, 16)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def essay_payload(username, run_id, i, rng):
+    paragraphs = ['    ' + ''.join(chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(rng.randint(80, 160)))
+                  for _ in range(rng.randint(4, 8))]
+    return {
+        "username": username,
+        "topic": "我的校园生活",
+        "title": f"压测作文 {i}",
+        "content": f"{run_id}-{i}\n" + '\n'.join(paragraphs),
+    }
+
+
+class Scenario:
+    """一个压测场景：prepare() 生成各请求的参数 (不计时)，call() 发送单个请求。"""
+
+    def __init__(self, name, base, username, run_id, rng, token=None):
+        self.name = name
+        self.base = base
+        self.username = username
+        self.headers = {'Authorization': f"Bearer {token}"} if token else {}
+        self.run_id = run_id
+        self.rng = rng
+        self.essay_ids = []
+
+    def prepare(self, count):
+        if self.name == 'score':
+            return [essay_payload(self.username, self.run_id, f"{time.time_ns()}-{i}", self.rng)
+                    for i in range(count)]
+        if self.name == 'ocr':
+            return [multipart('file', f"page_{i}.jpg", make_page(self.rng), 'image/jpeg') for i in range(count)]
+        if self.name in ('history', 'login'):
+            return [None] * count
+        if self.name == 'essay':
+            return [self.rng.choice(self.essay_ids) for _ in range(count)]
+        raise ValueError(self.name)
+
+    def call(self, arg):
+        if self.name == 'score':
+            status, data, ms = post_json(f"{self.base}/api/v1/score", arg, headers=self.headers)
+            if status == 200:
+                self.essay_ids.append(json.loads(data)['id'])
+            return status, ms
+        if self.name == 'ocr':
+            body, headers = arg
+            status, _, ms = http('POST', f"{self.base}/api/v1/ocr", body, {**headers, **self.headers})
+            return status, ms
+        if self.name == 'history':
+            status, _, ms = http('GET', f"{self.base}/api/v1/history/{self.username}?limit=20", headers=self.headers)
+            return status, ms
+        if self.name == 'login':
+            status, _, ms = post_json(f"{self.base}/api/v1/login", {"username": self.username, "password": PASSWORD})
+            return status, ms
+        status, _, ms = http('GET', f"{self.base}/api/v1/essay/{arg}", headers=self.headers)
+        return status, ms
+
+
+def run_level(scenario, concurrency, count):
+    args = scenario.prepare(count)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(scenario.call, args))
+    elapsed = time.perf_counter() - start
+    latencies = [ms for _, ms in results]
+    statuses = Counter(str(status) for status, _ in results)
+    return {
+        'scenario': scenario.name,
+        'concurrency': concurrency,
+        'requests': count,
+        'rps': round(count / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+        'mean_ms': round(statistics.mean(latencies), 1),
+        'errors': sum(n for status, n in statuses.items() if status != '200'),
+        'statuses': dict(statuses),
+    }
+
+
+def seed_essays(scenario, count):
+    """essay 场景需要已有的作文 id，未跑 score 场景时先写入一批。"""
+    seeder = Scenario('score', scenario.base, scenario.username, scenario.run_id, scenario.rng)
+    seeder.headers = scenario.headers
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(seeder.call, seeder.prepare(count)))
+    return seeder.essay_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 10, 50])
+    parser.add_argument('--requests', type=int, default=200, help='每个场景、每个并发档位的请求数')
+    parser.add_argument('--worker-class', default='gthread')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--llm-latency', type=float, default=1.0, help='大模型首字节前的固定延迟 (秒)')
+    parser.add_argument('--token-rate', type=float, default=0.0, help='大模型生成速度 (token/秒)，0 表示不计生成时间')
+    parser.add_argument('--completion-tokens', type=int, default=600)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--ocr-latency', type=float, default=0.5)
+    parser.add_argument('--ocr-error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='把结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    server, state, stub_url = start_stub(
+        latency=args.llm_latency, token_rate=args.token_rate, error_rate=args.llm_error_rate,
+        ocr_latency=args.ocr_latency, ocr_error_rate=args.ocr_error_rate,
+        completion_tokens=args.completion_tokens, seed=args.seed,
+    )
+    backend_env = {key: os.getenv(key, value) for key, value in BENCH_DB_ENV.items()}
+    backend_env.update({'OCR_BASE_URL': stub_url, 'OCR_API_KEY': 'stub', 'OCR_SECRET_KEY': 'stub'})
+    if not run_migrations(backend_env):
+        server.shutdown()
+        raise SystemExit("建表失败，请检查 MySQL 是否可用")
+    threads = 1 if args.worker_class == 'sync' else args.threads
+    proc, base = start_gunicorn(args.worker_class, args.workers, threads,
+                                stub_url + '/compatible-mode/v1', backend_env)
+    results = []
+    try:
+        username = f"bench_{args.seed}"
+        status, data, _ = post_json(f"{base}/api/v1/register", {"username": username, "password": PASSWORD})
+        if status not in (201, 409):
+            raise SystemExit(f"注册压测用户失败 ({status})：{data.decode('utf-8', 'ignore').strip()}，请检查 MySQL 是否可用")
+        status, data, _ = post_json(f"{base}/api/v1/login", {"username": username, "password": PASSWORD})
+        if status != 200:
+            raise SystemExit(f"压测用户登录失败 ({status})：{data.decode('utf-8', 'ignore').strip()}")
+        token = json.loads(data)['access_token']
+        run_id = uuid4().hex[:8]
+        essay_ids = []
+        for name in args.scenarios:
+            scenario = Scenario(name, base, username, run_id, rng, token)
+            if name == 'essay':
+                scenario.essay_ids = essay_ids or seed_essays(scenario, 20)
+            for concurrency in args.concurrency:
+                result = run_level(scenario, concurrency, args.requests)
+                results.append(result)
+                print(f"{name:8s} c={concurrency:<4d} rps={result['rps']:<8} p50={result['p50_ms']:<8} "
+                      f"p95={result['p95_ms']:<8} p99={result['p99_ms']:<8} errors={result['errors']} "
+                      f"{result['statuses']}")
+            if name == 'score':
+                essay_ids = scenario.essay_ids
+    finally:
+        proc.terminate()
+        proc.wait()
+        server.shutdown()
+
+    print(f"stub: {state.stats()}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'stub': state.stats(), 'results': results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""
+压测用的本地桩服务，同一个端口上模拟两个外部接口：
+
+  - DashScope 的 OpenAI 兼容接口  POST /compatible-mode/v1/chat/completions (支持 stream=True)
+  - 百度 OCR                      GET  /oauth/2.0/token
+                                  POST /rest/2.0/ocr/v1/handwriting
+
+大模型耗时 = latency + completion_tokens / token_rate (token_rate 为 0 时不计生成时间)；
+流式请求按 token_rate 逐段输出。error_rate / ocr_error_rate 为注入错误的比例：
+大模型返回 429 / 500 / 503，OCR 返回百度的 error_code。桩服务同时统计各接口的调用数和同时在途请求数峰值。
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from uuid import uuid4
+
+SCORE_RESULT = {
+    "score": 48,
+    "feedback": {"优点": "结构完整，中心明确。", "不足": "细节描写略显单薄。"},
+    "revised_content": "这是一篇由压测桩服务返回的修改后作文。",
+}
+
+OCR_LINES = [
+    "    春天来了，校园里的桃花开了。",
+    "同学们在操场上奔跑，笑声传得很远。",
+    "    我最喜欢在花下读书，",
+    "风吹过时，花瓣落在书页上。",
+]
+
+LLM_ERRORS = (
+    (429, "rate_limit_exceeded"),
+    (500, "internal_error"),
+    (503, "service_unavailable"),
+)
+OCR_ERRORS = (
+    (18, "Open api qps request limit reached"),
+    (282000, "internal error"),
+)
+
+
+class StubState:
+    def __init__(self, latency=2.0, token_rate=0.0, error_rate=0.0,
+                 ocr_latency=0.5, ocr_error_rate=0.0, completion_tokens=600, seed=None):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        self.ocr_latency = ocr_latency
+        self.ocr_error_rate = ocr_error_rate
+        self.completion_tokens = completion_tokens
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.peak_inflight = 0
+        self.requests = 0
+        self.counts = {'llm': 0, 'llm_errors': 0, 'ocr': 0, 'ocr_errors': 0, 'token': 0}
+
+    def enter(self):
+        with self.lock:
+            self.inflight += 1
+            self.requests += 1
+            self.peak_inflight = max(self.peak_inflight, self.inflight)
+
+    def leave(self):
+        with self.lock:
+            self.inflight -= 1
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def should_fail(self, rate):
+        with self.lock:
+            return rate > 0 and self.random.random() < rate
+
+    def pick(self, choices):
+        with self.lock:
+            return self.random.choice(choices)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+            stats['peak_inflight'] = self.peak_inflight
+        return stats
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 压测时会同时涌入上百个连接，默认的 listen backlog (5) 不够
+    request_queue_size = 1024
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def do_GET(self):
+        if self.path.startswith('/oauth/2.0/token'):
+            self.state.count('token')
+            self._send_json(200, {
+                "access_token": f"stub.{uuid4().hex}",
+                "expires_in": 2592000,
+                # AipOcr 根据 scope 判断是否为 AI 平台用户
+                "scope": "brain_all_scope",
+            })
+            return
+        self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        body = self._read_body()
+        if self.path.endswith('/chat/completions'):
+            self._chat_completions(json.loads(body or b'{}'))
+        elif self.path.startswith('/rest/2.0/ocr/v1/handwriting'):
+            self._handwriting(parse_qs(body.decode('ascii', 'ignore')))
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    # --- 大模型 ---
+
+    def _chat_completions(self, request):
+        state = self.state
+        state.count('llm')
+        state.enter()
+        try:
+            time.sleep(state.latency)
+            if state.should_fail(state.error_rate):
+                state.count('llm_errors')
+                status, code = state.pick(LLM_ERRORS)
+                self._send_json(status, {"error": {"message": f"stub injected {code}", "type": code, "code": code}})
+                return
+            content = json.dumps(SCORE_RESULT, ensure_ascii=False)
+            usage = {
+                "prompt_tokens": 800,
+                "completion_tokens": state.completion_tokens,
+                "total_tokens": 800 + state.completion_tokens,
+            }
+            if request.get('stream'):
+                self._stream_completion(request, content, usage)
+                return
+            if state.token_rate > 0:
+                time.sleep(state.completion_tokens / state.token_rate)
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get('model', 'qwen-max'),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+        finally:
+            state.leave()
+
+    def _stream_completion(self, request, content, usage):
+        """把 content 切成若干段按 token_rate 逐段发送，最后按 include_usage 附带用量。"""
+        state = self.state
+        chunk_id = f"chatcmpl-{uuid4().hex}"
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def send(payload):
+            data = f"data: {payload}\n\n".encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            return json.dumps({
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get('model', 'qwen-max'),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }, ensure_ascii=False)
+
+        pieces = [content[i:i + 8] for i in range(0, len(content), 8)]
+        delay = state.completion_tokens / state.token_rate / len(pieces) if state.token_rate > 0 else 0
+        send(chunk({"role": "assistant", "content": ""}))
+        for piece in pieces:
+            if delay:
+                time.sleep(delay)
+            send(chunk({"content": piece}))
+        send(chunk({}, finish_reason="stop"))
+        if (request.get('stream_options') or {}).get('include_usage'):
+            send(json.dumps({"id": chunk_id, "object": "chat.completion.chunk", "choices": [], "usage": usage}))
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    # --- 百度 OCR ---
+
+    def _handwriting(self, form):
+        state = self.state
+        state.count('ocr')
+        state.enter()
+        try:
+            time.sleep(state.ocr_latency)
+            if state.should_fail(state.ocr_error_rate):
+                state.count('ocr_errors')
+                code, msg = state.pick(OCR_ERRORS)
+                self._send_json(200, {"error_code": code, "error_msg": msg, "log_id": state.random.getrandbits(48)})
+                return
+            words = []
+            for i, line in enumerate(OCR_LINES):
+                indent = len(line) - len(line.lstrip())
+                words.append({
+                    "words": line.strip(),
+                    "location": {"left": 40 + indent * 20, "top": 60 + i * 48, "width": 600, "height": 40},
+                })
+            self._send_json(200, {
+                "words_result": words,
+                "words_result_num": len(words),
+                "log_id": state.random.getrandbits(48),
+            })
+        finally:
+            state.leave()
+
+
+def start_stub(latency=2.0, token_rate=0.0, error_rate=0.0, ocr_latency=0.5, ocr_error_rate=0.0,
+               completion_tokens=600, seed=None, host='127.0.0.1', port=0):
+    """
+    在后台线程启动桩服务，返回 (server, state, base_url)。
+    base_url + '/compatible-mode/v1' 可作为后端的 LLM_BASE_URL，base_url 本身可作为 OCR_BASE_URL。
+    """
+    state = StubState(latency, token_rate, error_rate, ocr_latency, ocr_error_rate, completion_tokens, seed)
+    handler = type('BoundStubHandler', (StubHandler,), {'state': state})
+    server = StubServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='api-stub', daemon=True).start()
+    base_url = f"http://{host}:{server.server_address[1]}"
+    return server, state, base_url